@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+'''
+Performance benchmarks of iktomi. Run from the repository root::
+
+    python -m benchmarks.routing [--number=N] [--save=baseline.json]
+                                 [--compare=baseline.json]
+    python benchmarks/storage.py [number]
+    python benchmarks/request_overhead.py [number]
+
+`benchmarks.apps` generates synthetic handler trees used by
+`benchmarks.routing`.
+'''
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic applications for benchmarks. Each function returns a `Bench`
+with the handler tree, urls to request, `(name, kwargs)` pairs of urls
+to build by `Reverse.build_url` and Host header of requests (None for
+absolute urls).
+'''
+
+from collections import namedtuple
+
+from webob import Response
+from iktomi import web
+
+
+Bench = namedtuple('Bench', 'name handler urls reverse host')
+
+RESPONSE = Response('ok')
+
+
+def endpoint(env, data):
+    return RESPONSE
+
+
+def flat(routes=1000, compiled=False):
+    '''Single `cases` with `routes` static branches.'''
+    handler = web.cases(*[web.match('/page%d' % i, 'page%d' % i) | endpoint
+                          for i in range(routes)], compiled=compiled)
+    step = max(routes // 10, 1)
+    urls = ['/page%d' % i for i in range(0, routes, step)] + \
+           ['/page%d' % (routes - 1), '/none']
+    reverse = [('page%d' % i, {}) for i in range(0, routes, step)]
+    name = 'flat_compiled' if compiled else 'flat'
+    return Bench(name, handler, urls, reverse, 'example.com')
+
+
+def nested(depth=5, width=5):
+    '''Tree of `prefix` and `namespace` handlers `depth` levels deep,
+    `width` branches on each level.'''
+    def level(n):
+        if n == depth:
+            return web.cases(*[web.match('/item%d/<int:id>' % i, 'item%d' % i)
+                               | endpoint for i in range(width)])
+        return web.cases(*[web.prefix('/level%d' % i, name='level%d' % i)
+                           | level(n + 1) for i in range(width)])
+    last = width - 1
+    path = ''.join('/level%d' % last for i in range(depth))
+    name = '.'.join('level%d' % last for i in range(depth))
+    urls = [''.join('/level0' for i in range(depth)) + '/item0/1',
+            path + '/item%d/1' % last,
+            path + '/none']
+    reverse = [(name + '.item%d' % last, {'id': 1}),
+               ('.'.join('level0' for i in range(depth)) + '.item0',
+                {'id': 1})]
+    return Bench('nested', level(0), urls, reverse, 'example.com')
+
+
+def subdomains(count=200):
+    '''`cases` of `count` subdomain branches with nested routes.'''
+    handler = web.cases(*[
+        web.subdomain('site%d' % i, name='site%d' % i) | web.cases(
+            web.match('/', 'index') | endpoint,
+            web.match('/news/<int:id>', 'news') | endpoint,
+        ) for i in range(count)])
+    last = count - 1
+    urls = ['http://site0.example.com/',
+            'http://site%d.example.com/news/1' % last,
+            'http://none.example.com/']
+    reverse = [('site%d.news' % last, {'id': 1}), ('site0.index', {})]
+    return Bench('subdomains', web.subdomain('example.com') | handler,
+                 urls, reverse, None)
+
+
+def converters(routes=200):
+    '''Routes with several converted url params each.'''
+    handler = web.cases(*[
+        web.match('/r%d/<int:year>/<int:month>/<string:slug>/<int:id>' % i,
+                  'r%d' % i) | endpoint
+        for i in range(routes)])
+    last = routes - 1
+    urls = ['/r0/2015/1/slug/1', '/r%d/2015/12/slug/100' % last,
+            '/r%d/x/1/slug/1' % last]
+    kwargs = {'year': 2015, 'month': 12, 'slug': 'slug', 'id': 100}
+    reverse = [('r%d' % last, kwargs), ('r0', kwargs)]
+    return Bench('converters', handler, urls, reverse, 'example.com')
+
+
+def all_benches():
+    return [flat(), flat(compiled=True), nested(), subdomains(),
+            converters()]
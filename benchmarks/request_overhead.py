@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of fixed per-request cost of `Application`::
+
+    python benchmarks/request_overhead.py [number]
+
+Measures creation of `env` and WSGI calls of an application answering
+without doing any work: a response returned by the first branch, a 404
+after trying all branches and a response using `env.root` to build an url.
+
+`env.root` is bound and the host is decoded on first access. The `eager`
+column is the baseline doing both at creation of `env`, like iktomi did
+before, `lazy` is the current behaviour, and `lazy flat` is the same with
+`FlatVersionedStorage`.
+'''
+
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webob import Request, Response
+from iktomi import web
+from iktomi.utils.storage import VersionedStorage, FlatVersionedStorage
+
+
+RESPONSE = Response('ok')
+
+
+def hit(env, data):
+    return RESPONSE
+
+
+def reverse(env, data):
+    env.root.news.item(id=1).as_url
+    return RESPONSE
+
+
+class EagerApplication(web.Application):
+    # baseline binding `env.root` and decoding the host for every request
+
+    def create_env(self, request, **kwargs):
+        env = web.Application.create_env(self, request, **kwargs)
+        env.root
+        env._route_state.subdomain
+        return env
+
+
+def make_app(storage_class, app_class=web.Application):
+    handler = web.cases(
+        web.match('/', 'index') | hit,
+        web.match('/url', 'url') | reverse,
+        web.prefix('/news', name='news') | web.cases(
+            web.match('', 'list') | hit,
+            web.match('/<int:id>', 'item') | hit,
+        ),
+        web.match('/docs', 'docs') | hit,
+    )
+    class App(app_class):
+        pass
+    App.storage_class = storage_class
+    return App(handler)
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def request(app, url):
+    environ = Request.blank(url, headers={'Host': 'example.com'}).environ
+    def run():
+        app(dict(environ), start_response)
+    return run
+
+
+def create_env(app, url):
+    environ = Request.blank(url, headers={'Host': 'example.com'}).environ
+    def run():
+        app.create_env(Request(dict(environ), charset='utf-8'))
+    return run
+
+
+CASES = [('hit', '/'), ('not found', '/none'), ('reverse', '/url')]
+
+
+def main(number=20000):
+    print '%-20s %15s %15s %15s' % ('us per request', 'eager', 'lazy',
+                                    'lazy flat')
+    apps = [make_app(VersionedStorage, EagerApplication),
+            make_app(VersionedStorage),
+            make_app(FlatVersionedStorage)]
+    for name, url in [('env', None)] + CASES:
+        results = []
+        for app in apps:
+            case = create_env(app, '/') if url is None else request(app, url)
+            best = min(timeit.repeat(case, number=number,
+                                     repeat=3))
+            results.append(best / number * 1e6)
+        print '%-20s %15.1f %15.1f %15.1f' % ((name,) + tuple(results))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
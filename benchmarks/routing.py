@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''
+Routing benchmarks on synthetic applications of `benchmarks.apps`::
+
+    python -m benchmarks.routing [--number=N] [--save=baseline.json]
+                                 [--compare=baseline.json]
+
+For each application reports requests per second through handler called
+with prebuilt reverse map, like `web.testing.ask` does but without building
+the map for every call, and through WSGI `Application`, urls built per second
+by `Reverse.build_url` and memory left by a WSGI request. If `tracemalloc`
+module is available, bytes retained per request are reported. Otherwise, in
+Python 2, the garbage collector is disabled while requests are run and
+`cyclic_objects_per_request` is the number of container objects not freed
+by reference counting: reference cycles left for the cycle collector and
+leaked objects. Neither counts all allocations.
+
+With `--compare` the results are compared with the saved baseline, and the
+exit status is 1 if any throughput dropped by more than `--threshold`
+percent.
+'''
+
+import gc
+import sys
+import json
+import timeit
+import argparse
+
+from webob import Request
+from iktomi import web
+from iktomi.utils.storage import VersionedStorage
+
+from .apps import all_benches
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def _headers(bench):
+    return {'Host': bench.host} if bench.host else {}
+
+
+def _environs(bench):
+    return [Request.blank(url, headers=_headers(bench)).environ
+            for url in bench.urls]
+
+
+def _rate(func, calls, number, repeat=3):
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return calls * number / best
+
+
+def handler_rate(bench, number):
+    handler = bench.handler
+    root = web.Reverse.from_handler(handler)
+    environs = _environs(bench)
+    def run():
+        for environ in environs:
+            env = VersionedStorage(web.AppEnvironment,
+                                   Request(dict(environ)), root)
+            handler(env, VersionedStorage())
+    return _rate(run, len(environs), number)
+
+
+def wsgi_rate(bench, number):
+    app = web.Application(bench.handler)
+    environs = _environs(bench)
+    def run():
+        for environ in environs:
+            app(dict(environ), start_response)
+    return _rate(run, len(environs), number)
+
+
+def build_url_rate(bench, number):
+    root = web.Reverse.from_handler(bench.handler)
+    reverse = bench.reverse
+    def run():
+        for name, kwargs in reverse:
+            root.build_url(name, **kwargs)
+    return _rate(run, len(reverse), number)
+
+
+def allocations(bench, number):
+    app = web.Application(bench.handler)
+    environs = _environs(bench)
+    def run():
+        for i in xrange(number):
+            for environ in environs:
+                app(dict(environ), start_response)
+    run() # warm caches
+    calls = float(number * len(environs))
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            run()
+            return ('retained_bytes_per_request',
+                    (tracemalloc.get_traced_memory()[0] - before) / calls)
+        finally:
+            tracemalloc.stop()
+    # the counter of generation 0 grows by objects tracked by the garbage
+    # collector and drops when they are freed, so with collection disabled
+    # its growth is the number of objects only the collector can free
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        run()
+        return ('cyclic_objects_per_request',
+                (gc.get_count()[0] - before) / calls)
+    finally:
+        gc.enable()
+        gc.collect()
+
+
+def run_benches(number):
+    results = {}
+    for bench in all_benches():
+        result = results[bench.name] = {}
+        result['handler_rps'] = handler_rate(bench, number)
+        result['wsgi_rps'] = wsgi_rate(bench, number)
+        result['build_url_per_s'] = build_url_rate(bench, number)
+        key, value = allocations(bench, max(number // 10, 1))
+        result[key] = value
+    return results
+
+
+def print_results(results, baseline=None, threshold=10.0):
+    '''Prints results, returns a list of throughput regressions.'''
+    regressions = []
+    for name in sorted(results):
+        print name
+        for key, value in sorted(results[name].items()):
+            line = '    %-32s %14.1f' % (key, value)
+            old = (baseline or {}).get(name, {}).get(key)
+            if old:
+                change = (value - old) / old * 100
+                line += ' %+7.1f%%' % change
+                if key.endswith(('_rps', '_per_s')) and change < -threshold:
+                    line += ' REGRESSION'
+                    regressions.append((name, key, change))
+            print line
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='iktomi routing benchmarks')
+    parser.add_argument('--number', type=int, default=1000,
+                        help='iterations over urls of each application')
+    parser.add_argument('--save', help='save results to JSON file')
+    parser.add_argument('--compare', help='compare with JSON baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed throughput drop in percent')
+    args = parser.parse_args(argv)
+    results = run_benches(args.number)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmark of VersionedStorage implementations::
+
+    python benchmarks/storage.py [number]
+
+Measures typical routing usage: attribute lookup from a deep frame and
+push/pop of failed routing branches that set nothing or a few values.
+'''
+
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iktomi.utils.storage import VersionedStorage, FlatVersionedStorage
+
+
+def deep_lookup(cls, depth=10):
+    vs = cls(request=object())
+    for i in range(depth):
+        vs._push(level=i)
+    def run():
+        vs.request
+        vs.level
+    return run
+
+
+def missing_lookup(cls, depth=10):
+    vs = cls(request=object())
+    for i in range(depth):
+        vs._push()
+    def run():
+        getattr(vs, 'namespace', None)
+    return run
+
+
+def empty_branches(cls, branches=10):
+    vs = cls(request=object())
+    def run():
+        for i in xrange(branches):
+            vs._push()
+            vs._pop()
+    return run
+
+
+def setting_branches(cls, branches=10):
+    vs = cls(request=object())
+    def run():
+        for i in xrange(branches):
+            vs._push()
+            vs.current_url_name = 'name'
+            vs.id = i
+            vs._pop()
+    return run
+
+
+CASES = [deep_lookup, missing_lookup, empty_branches, setting_branches]
+
+
+def main(number=100000):
+    print '%-20s %15s %15s' % ('', 'Versioned', 'FlatVersioned')
+    for case in CASES:
+        results = []
+        for cls in (VersionedStorage, FlatVersionedStorage):
+            results.append(min(timeit.repeat(case(cls), number=number,
+                                             repeat=3)))
+        print '%-20s %14.3fs %14.3fs' % ((case.__name__,) + tuple(results))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
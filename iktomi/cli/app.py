@@ -79,6 +79,44 @@ class App(Cli):
                 self.shutdown()
             sys.exit()
 
+    def command_route_order(self, filename=None):
+        '''
+        Prints the order of disjoint branches of `web.cases` of the app,
+        the frozen order is loaded from `filename` if given::
+
+            ./manage.py app:route_order [route-order.json]
+
+        Without `filename` the order and hits of `route_order` of the app
+        are printed, if it is set.
+        '''
+        from iktomi.web.route_order import RouteOrder, reorder_cases
+        order = getattr(self.app, 'route_order', None)
+        if order is None or filename is not None:
+            if filename is None:
+                order = RouteOrder()
+            else:
+                order = RouteOrder.load(filename)
+            reorder_cases(getattr(self.app, 'handler', self.app), order)
+        sys.stdout.write(order.report() + '\n')
+
+    def command_replay(self, filename, workers='4', processes=False,
+                       host='localhost', profile='0', profile_dir='profiles'):
+        '''
+        Replays access log against the app, prints latency report::
+
+            ./manage.py app:replay access.log [--workers=4] [--processes]
+                [--host=example.com] [--profile=5 --profile_dir=profiles]
+        '''
+        from iktomi.web.replay import Replay, read_log
+        replay = Replay(self.app, workers=int(workers),
+                        processes=bool(processes))
+        results = replay.run(read_log(filename, default_host=host))
+        sys.stdout.write(results.report() + '\n')
+        if int(profile):
+            for name in replay.profile(results.slowest(int(profile)),
+                                       profile_dir):
+                sys.stdout.write('Profile saved to %s\n' % name)
+
     def command_shell(self):
         from code import interact
         interact('Namespace %r' % self.shell_namespace,
@@ -36,6 +36,10 @@ def flup_fastcgi(wsgi_app, bind, cwd=None, pidfile=None, logfile=None,
                 logger.info('PID file should contain a number')
         doublefork(pidfile, logfile, cwd, umask)
     logger.info('Starting FastCGI server (flup), current working dir %r' % cwd)
+    # build routes before forking workers
+    warm = getattr(wsgi_app, 'warm', None)
+    if warm is not None:
+        warm()
     fcgi.WSGIServer(wsgi_app, bindAddress=bind, umask=umask,
                     debug=False, **params).run()
 
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import time
 import logging
-from sqlalchemy import orm, create_engine
+from sqlalchemy import orm, create_engine, event
 from sqlalchemy.orm.query import Query
 from iktomi.utils import import_string
 from iktomi.utils.deprecation import deprecated
@@ -66,3 +67,26 @@ def session_maker(databases, query_cls=Query, models_location='models',
     binds = multidb_binds(databases, models_location, engine_params=engine_params)
     return orm.sessionmaker(class_=session_class, query_cls=query_cls,
                             binds=binds, **session_params)
+
+
+def observe_query_time(engine, metrics=None, sampler=None,
+                       name='iktomi_db_query_seconds'):
+    '''Records time of queries executed by `engine` to histogram of
+    `iktomi.web.metrics.MetricsRegistry` and to profiles of
+    `iktomi.web.slow_requests.SlowRequestSampler`.'''
+    if metrics is not None:
+        histogram = metrics.histogram(name, 'Time spent by database queries')
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.time())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        seconds = time.time() - conn.info['query_start_time'].pop()
+        if metrics is not None:
+            histogram.observe(seconds)
+        if sampler is not None:
+            sampler.observe('db', seconds)
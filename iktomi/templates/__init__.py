@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import logging
 logger = logging.getLogger(__name__)
 from glob import glob
-from ..web import Response, request_filter
+from ..web import Response, StreamingResponse, request_filter
 from ..utils import cached_property
 
 __all__ = ('Template',)
@@ -36,6 +37,19 @@ class Template(object):
         resolved_name, engine = self.resolve(template_name)
         return engine.render(resolved_name, **vars)
 
+    def stream(self, template_name, **kw):
+        '''
+        Returns an iterator over rendered template parts. Engines having
+        `stream` method produce them incrementally, the others render the
+        whole template at once.'''
+        logger.debug('Streaming template "%s"', template_name)
+        vars = self.globs.copy()
+        vars.update(kw)
+        resolved_name, engine = self.resolve(template_name)
+        if hasattr(engine, 'stream'):
+            return engine.stream(resolved_name, **vars)
+        return iter([engine.render(resolved_name, **vars)])
+
     def resolve(self, template_name):
         pattern = template_name
         if not os.path.splitext(template_name)[1]:
@@ -86,8 +100,22 @@ class BoundTemplate(object):
         return d
 
     def render(self, template_name, __data=None, **kw):
-        return self.template.render(template_name,
-                                    **self._vars(__data, **kw))
+        started = time.time()
+        try:
+            return self.template.render(template_name,
+                                        **self._vars(__data, **kw))
+        finally:
+            self._observe_render(time.time() - started)
+
+    def _observe_render(self, seconds):
+        metrics = getattr(self.env, 'metrics', None)
+        if metrics is not None:
+            metrics.histogram('iktomi_template_render_seconds',
+                              'Time spent to render templates')\
+                   .observe(seconds)
+        slow_requests = getattr(self.env, 'slow_requests', None)
+        if slow_requests is not None:
+            slow_requests.observe('templates', seconds)
 
     def render_to_response(self, template_name, __data,
                            content_type="text/html"):
@@ -95,6 +123,37 @@ class BoundTemplate(object):
         return Response(resp,
                         content_type=content_type)
 
+    def stream(self, template_name, __data=None, **kw):
+        started = time.time()
+        parts = self.template.stream(template_name,
+                                     **self._vars(__data, **kw))
+        return self._observed(parts, time.time() - started)
+
+    def _observed(self, parts, seconds):
+        # Render time is observed like in `render`, when the parts are
+        # exhausted or the iterator is closed. Time spent by consumer
+        # between the parts is not counted.
+        parts = iter(parts)
+        try:
+            while True:
+                started = time.time()
+                try:
+                    part = next(parts)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.time() - started
+                yield part
+        finally:
+            self._observe_render(seconds)
+
+    def stream_to_response(self, template_name, __data,
+                           content_type="text/html"):
+        '''Same as `render_to_response`, but returns `StreamingResponse`
+        sending the page while it is being rendered.'''
+        return StreamingResponse(self.stream(template_name, __data),
+                                 content_type=content_type)
+
 
 def render_to(self, template_name):
     @request_filter
@@ -29,6 +29,15 @@ class TemplateEngine(object):
             extensions=self.extensions
         )
 
+    # number of template parts joined into one chunk when streaming
+    stream_buffer_size = 40
+
     def render(self, template_name, **kw):
         'Interface method'
         return self.env.get_template(template_name).render(**kw)
+
+    def stream(self, template_name, **kw):
+        'Interface method'
+        stream = self.env.get_template(template_name).stream(**kw)
+        stream.enable_buffering(self.stream_buffer_size)
+        return stream
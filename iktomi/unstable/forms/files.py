@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
 from iktomi.forms import convs, widgets, Field, FieldSet, FileField
+from iktomi.unstable.db.files import TransientFile
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,11 @@ class FileFieldSetConv(convs.Converter):
 
         file_manager = self.env.file_manager
 
-        if not self._is_empty(file):
+        if isinstance(file, TransientFile):
+            # already written to transient storage by
+            # iktomi.unstable.web.multipart.spool_multipart
+            pass
+        elif not self._is_empty(file):
             file = file_manager.create_transient(file.file, file.filename)
         else:
             file = None
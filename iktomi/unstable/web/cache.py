@@ -6,11 +6,15 @@ XXX: Before marge to cache.py lets test as separate module for
 Supports two types of cache:
 * CacheManager class is for basic cache that stores only content
 * CacheManagerWithContentType is for cache with content type (as separate cache key)
+
+Bodies compressed by `web.gzip` filter chained after cache manager are
+stored as a separate variant and served to clients accepting gzip.
 """
 
 __all__ = ['CacheManager', 'CacheManagerWithContentType', 'cache', 'nocache']
 
 from iktomi import web
+from iktomi.web.filters import _accepts_gzip
 import logging
 
 
@@ -62,8 +66,10 @@ class CacheManager(web.WebHandler):
         self._content_type = content_type
 
 
-    def get_cache_name(self, env):
+    def get_cache_name(self, env, content_encoding=None):
         cache_name = env.request.url
+        if content_encoding:
+            cache_name = content_encoding + ':' + cache_name
         if len(cache_name) > self._cache_name_length:
             return None
         return cache_name
@@ -83,7 +89,7 @@ class CacheManager(web.WebHandler):
         """ Save response to cache without guaranty
         """
         content = response.body
-        cache_name = self.get_cache_name(env)
+        cache_name = self.get_cache_name(env, response.content_encoding)
         if cache_name is None or duration is None:
             return None
         logger.info('Caching for %i seconds %s', duration, cache_name)
@@ -92,7 +98,14 @@ class CacheManager(web.WebHandler):
         self._storage.set(cache_name, content, time=duration)
 
     def get_response_from_cache(self, env):
-        cache_name = self.get_cache_name(env)
+        if _accepts_gzip(env.request.headers.get('Accept-Encoding')):
+            response = self.get_variant_from_cache(env, 'gzip')
+            if response is not None:
+                return response
+        return self.get_variant_from_cache(env)
+
+    def get_variant_from_cache(self, env, content_encoding=None):
+        cache_name = self.get_cache_name(env, content_encoding)
         if cache_name is None:
             return None
         body = self._storage.get(cache_name)
@@ -101,12 +114,22 @@ class CacheManager(web.WebHandler):
         if body is None:
             return None
         logger.info('Got from cache by `%s`', cache_name)
-        return web.Response(body, content_type=self._content_type)
+        response = web.Response(body, content_type=self._content_type)
+        if content_encoding:
+            response.content_encoding = content_encoding
+        # shared caches should not serve identity variant to clients
+        # accepting gzip and vice versa
+        response.vary = ('Accept-Encoding',)
+        return response
 
     def call_view(self, env, data):
         logger.info("Call view %s", env.request.url)
         response = self.next_handler(env, data)
         if response is not None:
+            if not web.body_in_memory(response):
+                # reading the body would load whole stream into memory
+                logger.info("Streaming or file response is not cached")
+                return response
             self.save_response_to_cache(env, response, self.get_duration(response))
             return response
         return None
@@ -118,6 +141,12 @@ class CacheManager(web.WebHandler):
             return response
         
         cached = self.get_response_from_cache(env)
+        metrics = getattr(env, 'metrics', None)
+        if metrics is not None:
+            metrics.counter('iktomi_cache_requests_total',
+                            'Number of requests to response cache',
+                            ['result'])\
+                   .inc(result='miss' if cached is None else 'hit')
         if not cached:
             cached = self.call_view(env, data)
         return cached
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming parser of `multipart/form-data` request bodies. File parts are
+written directly to transient storage of `FileManager` as they are read
+from `wsgi.input`, text parts are kept in memory::
+
+    app = web.cases(
+        web.match('/upload', 'upload') |
+            spool_multipart(max_file_size=50 * 1024 * 1024) | upload,
+        ...
+    )
+
+    def upload(env, data):
+        form = UploadForm(env)
+        if form.accept(env.request.POST):
+            ...
+
+After the filter `env.request.POST` is a `MultiDict` of unicode text values
+and `SpooledFile` objects. `SpooledFile` is a `TransientFile`, so
+`FileFieldSet` takes it as is instead of copying uploaded data once more,
+and it has `read` method, so plain `FileField` accepts it too.
+
+Spooled files opened for reading are closed by `spool_multipart` when the
+request is handled.
+
+Requests with a file larger than `max_file_size`, a text part larger than
+`max_text_size` or a body larger than `max_body_size` get 413 response as
+soon as the limit is exceeded. Files spooled by such request are removed.
+'''
+
+__all__ = ['SpooledFile', 'parse_multipart', 'spool_multipart']
+
+import os
+import cgi
+
+from webob.multidict import MultiDict
+from webob.exc import HTTPBadRequest, HTTPLengthRequired, \
+                      HTTPRequestEntityTooLarge
+
+from iktomi import web
+from iktomi.utils import cached_property
+from iktomi.unstable.db.files import TransientFile
+
+
+# limit of headers of a part and of preamble
+_MAX_HEADERS_SIZE = 16 * 1024
+
+
+class SpooledFile(TransientFile):
+    '''
+    Uploaded file spooled to transient storage, with `filename` and `type`
+    (content type) sent by the client.
+    '''
+
+    def __init__(self, root, name, filename, type, manager):
+        TransientFile.__init__(self, root, name, original_name=filename,
+                               manager=manager)
+        self.filename = filename
+        self.type = type
+
+    @cached_property
+    def file(self):
+        return open(self.path, 'rb')
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        if 'file' in self.__dict__:
+            self.__dict__.pop('file').close()
+
+
+class _Input(object):
+    # buffered reader of request body, checking its size
+
+    def __init__(self, stream, length, max_size, chunk_size):
+        self.stream = stream
+        self.left = length
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.buffer = ''
+
+    def fill(self):
+        '''Reads next chunk to the buffer, returns False at end of body.'''
+        size = self.chunk_size
+        if self.left is not None:
+            size = min(size, self.left)
+            if not size:
+                return False
+        chunk = self.stream.read(size)
+        if not chunk:
+            if self.left:
+                raise HTTPBadRequest('Request body is truncated')
+            return False
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise HTTPRequestEntityTooLarge()
+        if self.left is not None:
+            self.left -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def read_until(self, separator, limit):
+        '''Returns data before the separator and skips the separator.'''
+        while True:
+            index = self.buffer.find(separator)
+            if index >= 0:
+                data = self.buffer[:index]
+                self.buffer = self.buffer[index + len(separator):]
+                return data
+            if len(self.buffer) > limit:
+                raise HTTPBadRequest('Malformed multipart body')
+            if not self.fill():
+                raise HTTPBadRequest('Malformed multipart body')
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            if not self.fill():
+                raise HTTPBadRequest('Malformed multipart body')
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+    def iter_until(self, separator):
+        '''Yields chunks of data before the separator and skips the
+        separator.'''
+        keep = len(separator) - 1
+        while True:
+            index = self.buffer.find(separator)
+            if index >= 0:
+                data = self.buffer[:index]
+                self.buffer = self.buffer[index + len(separator):]
+                if data:
+                    yield data
+                return
+            if len(self.buffer) > keep:
+                # the tail can be a start of the separator
+                data = self.buffer[:-keep] if keep else self.buffer
+                self.buffer = self.buffer[len(data):]
+                yield data
+            if not self.fill():
+                raise HTTPBadRequest('Malformed multipart body')
+
+
+def _parse_headers(data):
+    headers = {}
+    for line in data.split('\r\n'):
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise HTTPBadRequest('Malformed multipart headers')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_multipart(environ, file_manager, max_file_size=None,
+                    max_text_size=1024 * 1024, max_body_size=None,
+                    chunk_size=64 * 1024, charset='utf-8'):
+    '''
+    Parses `multipart/form-data` body of WSGI request, returns `MultiDict`
+    with unicode values of text parts and `SpooledFile` objects of file
+    parts written to transient storage of `file_manager`. Empty file
+    inputs have `u''` value, like in `webob.Request.POST`. The body is
+    read in `chunk_size` pieces, so memory used does not depend on the
+    size of files.
+    '''
+    content_type, params = cgi.parse_header(environ.get('CONTENT_TYPE', ''))
+    boundary = params.get('boundary')
+    if content_type != 'multipart/form-data' or not boundary:
+        raise HTTPBadRequest('Not a multipart/form-data request')
+    length = environ.get('CONTENT_LENGTH')
+    if length:
+        length = int(length)
+        if max_body_size is not None and length > max_body_size:
+            raise HTTPRequestEntityTooLarge()
+    elif environ.get('wsgi.input_terminated'):
+        # chunked body, read until the end of the stream
+        length = None
+    else:
+        raise HTTPLengthRequired()
+    charset = params.get('charset', charset)
+
+    body = _Input(environ['wsgi.input'], length, max_body_size, chunk_size)
+    delimiter = '--' + boundary
+    separator = '\r\n' + delimiter
+    result = MultiDict()
+    spooled = []
+    try:
+        # preamble
+        body.read_until(delimiter, _MAX_HEADERS_SIZE)
+        while True:
+            end = body.read_exactly(2)
+            if end == '--':
+                # the rest is epilogue
+                break
+            if end != '\r\n':
+                raise HTTPBadRequest('Malformed multipart body')
+            headers = _parse_headers(
+                    body.read_until('\r\n\r\n', _MAX_HEADERS_SIZE))
+            disposition, options = cgi.parse_header(
+                    headers.get('content-disposition', ''))
+            name = options.get('name')
+            if disposition != 'form-data' or name is None:
+                raise HTTPBadRequest('Malformed multipart headers')
+            name = name.decode(charset, 'replace')
+            chunks = body.iter_until(separator)
+            if 'filename' not in options:
+                value = []
+                size = 0
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_text_size:
+                        raise HTTPRequestEntityTooLarge()
+                    value.append(chunk)
+                result.add(name, ''.join(value).decode(charset, 'replace'))
+                continue
+            filename = options['filename'].decode(charset, 'replace')
+            if not filename:
+                # empty file input
+                for chunk in chunks:
+                    pass
+                result.add(name, u'')
+                continue
+            result.add(name, _spool(chunks, file_manager, filename,
+                                    headers.get('content-type'),
+                                    max_file_size, spooled))
+    except:
+        for spooled_file in spooled:
+            file_manager.delete(spooled_file)
+        raise
+    return result
+
+
+def _spool(chunks, file_manager, filename, type, max_file_size, spooled):
+    ext = os.path.splitext(filename)[1]
+    name = file_manager.new_transient(ext).name
+    spooled_file = SpooledFile(file_manager.transient_root, name, filename,
+                               type, file_manager)
+    if not os.path.isdir(file_manager.transient_root):
+        os.makedirs(file_manager.transient_root)
+    spooled.append(spooled_file)
+    size = 0
+    with open(spooled_file.path, 'wb') as fp:
+        for chunk in chunks:
+            size += len(chunk)
+            if max_file_size is not None and size > max_file_size:
+                raise HTTPRequestEntityTooLarge()
+            fp.write(chunk)
+    return spooled_file
+
+
+class spool_multipart(web.WebHandler):
+    '''
+    Parses `multipart/form-data` request body with `parse_multipart` and
+    makes the result available as `env.request.POST`::
+
+        web.match('/upload', 'upload') |
+            spool_multipart(max_file_size=10 * 1024 * 1024) | upload
+
+    Files are written to `env.file_manager` unless `file_manager` is
+    given. Requests of other content types are passed through.
+    '''
+
+    def __init__(self, max_file_size=None, max_text_size=1024 * 1024,
+                 max_body_size=None, file_manager=None):
+        self.max_file_size = max_file_size
+        self.max_text_size = max_text_size
+        self.max_body_size = max_body_size
+        self.file_manager = file_manager
+
+    def spool_multipart(self, env, data):
+        request = env.request
+        if request.method != 'POST' or \
+                request.content_type != 'multipart/form-data' or \
+                'webob._parsed_post_vars' in request.environ:
+            return self.next_handler(env, data)
+        file_manager = self.file_manager or env.file_manager
+        post = parse_multipart(request.environ, file_manager,
+                               max_file_size=self.max_file_size,
+                               max_text_size=self.max_text_size,
+                               max_body_size=self.max_body_size)
+        # webob returns cached value when the body is not replaced
+        request.environ['webob._parsed_post_vars'] = \
+                (post, request.body_file_raw)
+        try:
+            return self.next_handler(env, data)
+        finally:
+            # files opened by handlers reading the uploads
+            for value in post.values():
+                if isinstance(value, SpooledFile):
+                    value.close()
+    __call__ = spool_multipart
@@ -62,6 +62,100 @@ class VersionedStorage(object):
         return self._storage.as_dict()
 
 
+_missing = object()
+
+
+class FlatVersionedStorage(VersionedStorage):
+    '''
+    VersionedStorage keeping all values in a single frame with undo log of
+    changes instead of a chain of frames.
+
+    Attribute lookup does not depend on the number of pushed frames, and
+    `_push`/`_pop` of a frame where nothing has been set cost almost nothing.
+    The API is the same, except `_push` returns the storage itself, because
+    there are no separate frame objects. Note that unlike VersionedStorage,
+    values are stored in root frame's `__dict__`, so class-level data
+    descriptors (like `property`) of root frame class take precedence over
+    them.
+    '''
+
+    def __init__(self, cls=StorageFrame, *args, **kwargs):
+        self.__dict__['_journal'] = []
+        self.__dict__['_marks'] = []
+        VersionedStorage.__init__(self, cls, *args, **kwargs)
+
+    def _push(self, **kwargs):
+        self._marks.append(len(self._journal))
+        for key, value in kwargs.iteritems():
+            self.__setattr__(key, value)
+        return self
+
+    def _pop(self):
+        mark = self._marks.pop()
+        journal = self._journal
+        if len(journal) > mark:
+            values = self._storage.__dict__
+            for name, value in reversed(journal[mark:]):
+                if value is _missing:
+                    del values[name]
+                else:
+                    values[name] = value
+            del journal[mark:]
+
+    def __getattr__(self, name):
+        storage = self._storage
+        try:
+            return getattr(storage, name)
+        except AttributeError:
+            # allow to chain the storage to another one in the same way as
+            # VersionedStorage does
+            parent = storage.__dict__.get('_parent_storage')
+            if parent is not None:
+                return getattr(parent, name)
+        raise AttributeError("{} has no attribute {}".format(
+                             self.__class__.__name__, name))
+
+    def __setattr__(self, name, value):
+        if name == '_storage':
+            self.__dict__[name] = value
+            return
+        values = self._storage.__dict__
+        if self._marks:
+            self._journal.append((name, values.get(name, _missing)))
+        values[name] = value
+
+    def __delattr__(self, name):
+        values = self._storage.__dict__
+        if not self._marks:
+            if name not in values:
+                raise AttributeError(name)
+            del values[name]
+            return
+        # only a value set in the current frame can be deleted, previous
+        # value becomes visible then
+        mark = self._marks[-1]
+        frame_journal = self._journal[mark:]
+        for key, value in frame_journal:
+            if key == name:
+                if value is _missing:
+                    del values[name]
+                else:
+                    values[name] = value
+                self._journal[mark:] = [x for x in frame_journal
+                                        if x[0] != name]
+                return
+        raise AttributeError(name)
+
+    def as_dict(self):
+        d = dict(self._storage.__dict__)
+        d.pop('_parent_storage', None)
+        d.pop('_root_storage', None)
+        parent = self._storage._parent_storage
+        if parent is not None:
+            d = dict(parent.as_dict(), **d)
+        return d
+
+
 class storage_property_base(object):
 
     def __init__(self, method, name=None):
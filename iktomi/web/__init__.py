@@ -1,5 +1,6 @@
 from webob import Request, Response
 from .core import *
+from .response import *
 from .app import *
 from .filters import *
 from .reverse import *
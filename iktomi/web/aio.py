@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+'''
+Running iktomi application on an asyncio event loop (`trollius` package,
+asyncio for Python 2).
+
+Request filters made of coroutine functions are run on the event loop, and
+the rest of handlers are run in a bounded thread pool, so slow I/O done by
+coroutines does not take a worker thread::
+
+    @web.request_filter
+    @asyncio.coroutine
+    def fetch_rates(env, data, next_handler):
+        data.rates = yield From(rates_client.get())
+        result = yield From(next_handler(env, data))
+        raise Return(result)
+
+    app = AsyncApplication(web.cases(
+        web.match('/rates', 'rates') | fetch_rates | render_rates,
+        web.match('/', 'index') | index,
+    ))
+    response = yield From(app.respond(environ))
+
+`next_handler` passed to a coroutine filter returns a future. The event
+loop does routing through `web.cases` and its subclasses (`web.by_method`,
+`web.by_subdomain`, `AdaptiveCases` of route order) and step filters
+(`web.match`, `web.method`, `web.namespace`, `web.subdomain`) leading to
+coroutine filters, any other handler is called in the thread pool. A coroutine filter
+reached from such handler is still run on the event loop, but the worker
+thread waits for it.
+'''
+
+__all__ = ['AsyncApplication', 'AsyncFilter']
+
+import time
+import Queue
+import logging
+import functools
+
+import trollius as asyncio
+from trollius import From, Return
+from concurrent.futures import ThreadPoolExecutor
+from webob import Request
+from webob.exc import HTTPException, HTTPInternalServerError, HTTPNotFound
+
+from .core import WebHandler, cases, _FunctionWrapper3, _record_location, \
+                  _enter_branch, _exit_branch
+from .flatten import FlatChain, _is_step
+from .app import Application
+
+logger = logging.getLogger(__name__)
+
+
+def _resolved(loop, func, *args):
+    # returns a future with result of synchronous call
+    future = asyncio.Future(loop=loop)
+    try:
+        future.set_result(func(*args))
+    except Exception, e:
+        future.set_exception(e)
+    return future
+
+
+class AsyncFilter(_FunctionWrapper3):
+    '''
+    Request filter made of a coroutine function. `AsyncApplication` replaces
+    request filters of coroutine functions by it.
+    '''
+
+    def async_filter(self, env, data):
+        # called synchronously from a worker thread or outside of
+        # AsyncApplication
+        loop = getattr(env, '_async_loop', None)
+        if loop is None:
+            return self._run_locally(env, data)
+        return self._run_from_thread(loop, env, data)
+    __call__ = async_filter
+
+    def _run_locally(self, env, data):
+        try:
+            previous = asyncio.get_event_loop()
+        except (RuntimeError, AssertionError):
+            # there is no loop in current thread
+            previous = None
+        loop = asyncio.new_event_loop()
+        # coroutines use current loop by default
+        asyncio.set_event_loop(loop)
+        try:
+            next_handler = functools.partial(_resolved, loop,
+                                             self.next_handler)
+            return loop.run_until_complete(
+                    self.handler(env, data, next_handler))
+        finally:
+            asyncio.set_event_loop(previous)
+            loop.close()
+
+    def _run_from_thread(self, loop, env, data):
+        # The coroutine runs on the loop, while next handler is called by
+        # current thread waiting for the coroutine to finish.
+        calls = Queue.Queue()
+
+        def next_handler(env, data):
+            future = asyncio.Future(loop=loop)
+            calls.put((future, env, data))
+            return future
+
+        def start():
+            task = asyncio.ensure_future(
+                    self.handler(env, data, next_handler), loop=loop)
+            task.add_done_callback(lambda task: calls.put((task,)))
+        loop.call_soon_threadsafe(start)
+
+        while True:
+            call = calls.get()
+            if len(call) == 1:
+                return call[0].result()
+            future, env, data = call
+            try:
+                result = self.next_handler(env, data)
+            except Exception, e:
+                loop.call_soon_threadsafe(future.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(future.set_result, result)
+
+
+def _is_async_filter(handler):
+    return isinstance(handler, _FunctionWrapper3) and \
+           asyncio.iscoroutinefunction(handler.handler)
+
+
+class AsyncApplication(Application):
+    '''
+    Application serving requests on asyncio event loop. `respond(environ)`
+    coroutine returns `webob.Response`. Synchronous handlers are called in
+    a thread pool of `max_workers` threads.
+
+    WSGI interface is kept, coroutine filters are run by a temporary
+    event loop then.
+    '''
+
+    max_workers = 10
+
+    def __init__(self, handler, env_class=None, loop=None):
+        Application.__init__(self, handler, env_class=env_class)
+        self.handler = self._prepare(self.handler)
+        # handlers to be walked on event loop: the ones leading to
+        # coroutine filters
+        self._async_handlers = set()
+        self._collect_async(self.handler)
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(self.max_workers)
+
+    def _prepare(self, handler):
+        if not isinstance(handler, WebHandler):
+            return handler
+        handler = handler._map_handlers(self._prepare)
+        if _is_async_filter(handler) and \
+                not isinstance(handler, AsyncFilter):
+            prepared = AsyncFilter(handler.handler)
+            prepared.__dict__.update(handler.__dict__)
+            handler = prepared
+        return handler
+
+    def _collect_async(self, handler):
+        nested = []
+        def visit(child):
+            nested.append(self._collect_async(child))
+            return child
+        if isinstance(handler, cases):
+            # branches as returned by `_candidates`
+            for child in handler.handlers:
+                visit(child)
+        elif isinstance(handler, WebHandler):
+            handler._map_handlers(visit)
+        if isinstance(handler, AsyncFilter) or any(nested):
+            self._async_handlers.add(id(handler))
+            return True
+        return False
+
+    @asyncio.coroutine
+    def respond(self, environ):
+        '''
+        Coroutine handling WSGI `environ` like `handle` method and
+        returning a response.'''
+        started = time.time()
+        request = Request(environ, charset='utf-8')
+        env = self.create_env(request, _async_loop=self.loop)
+        data = self.storage_class()
+        try:
+            response = yield From(self._walk(self.handler, env, data))
+            if response is None:
+                logger.debug('Application returned None '
+                             'instead of Response object')
+                response = HTTPNotFound()
+        except HTTPException, e:
+            response = e
+        except Exception, e:
+            self.handle_error(env)
+            response = HTTPInternalServerError()
+        _record_location(env)
+        self.observe_request(env, response, started)
+        if getattr(env, '_deferred', None):
+            # there is no hook to call after the response is sent, so
+            # deferred tasks are run in the pool once it is ready
+            self.loop.run_in_executor(self.executor,
+                                      self._after_response, env)
+        raise Return(response)
+
+    @asyncio.coroutine
+    def _walk(self, handler, env, data):
+        while id(handler) in self._async_handlers:
+            if isinstance(handler, AsyncFilter):
+                next_handler = functools.partial(self._walk,
+                                                 handler.next_handler)
+                result = yield From(handler.handler(env, data, next_handler))
+                raise Return(result)
+            elif isinstance(handler, cases):
+                result = yield From(self._walk_cases(handler, env, data))
+                raise Return(result)
+            elif isinstance(handler, FlatChain):
+                for step in handler._steps:
+                    if not step(env, data):
+                        raise Return(None)
+                handler = handler.handler
+            elif _is_step(handler):
+                if not handler._step(env, data):
+                    raise Return(None)
+                handler = handler.next_handler
+            else:
+                break
+        result = yield From(self.loop.run_in_executor(
+                self.executor, handler, env, data))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def _walk_cases(self, handler, env, data):
+        route_state = env._route_state
+        # steps like `prefix` and `subdomain` change route state
+        subdomain_state = route_state.subdomain_state()
+        offset_state = route_state.offset_state()
+        for nested in handler._candidates(env):
+            # same as core._call_branch, but the frame is kept while the
+            # coroutine waits for the branch
+            _enter_branch(env, data)
+            answered = True
+            try:
+                result = yield From(self._walk(nested, env, data))
+                answered = result is not None
+            finally:
+                _exit_branch(env, data, answered)
+            if result is not None:
+                raise Return(result)
+            route_state.restore_subdomain_state(subdomain_state)
+            route_state.restore_offset_state(offset_state)
+        raise Return(handler._fallback(env))
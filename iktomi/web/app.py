@@ -2,13 +2,22 @@
 
 __all__ = ['Application', 'AppEnvironment']
 
+import time
 import logging
-from iktomi.utils.storage import VersionedStorage, StorageFrame, storage_property
+from iktomi.utils.storage import VersionedStorage, StorageFrame, \
+                                 storage_property, storage_cached_property
 from webob.exc import HTTPException, HTTPInternalServerError, \
                       HTTPNotFound
 from webob import Request
 from .route_state import RouteState
+from .core import _record_location
+from .response import is_streaming
 from .reverse import Reverse
+from .flatten import flatten_chains, call_depths
+from .instrument import instrument
+from .route_order import reorder_cases
+from .metrics import RequestMetrics
+from .url_templates import template_cache_info
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +40,33 @@ class AppEnvironment(StorageFrame):
     def __init__(self, request, root, _parent_storage=None, **kwargs):
         StorageFrame.__init__(self, _parent_storage=_parent_storage, **kwargs)
         self.request = request
-        self.root = root.bind_to_env(self._root_storage)
+        # unbound reverse, `root` is bound on first access
+        self._reverse = root
         self._route_state = RouteState(request)
 
+    # tasks of `defer`, a list is created by the first one
+    _deferred = ()
+    # `iktomi.web.metrics.MetricsRegistry` of the application, if any
+    metrics = None
+    # `iktomi.web.slow_requests.SlowRequestSampler` of the application
+    slow_requests = None
+
+    def defer(self, func, *args, **kwargs):
+        '''
+        Schedules `func(*args, **kwargs)` call after the response is sent
+        to the client. Use it for work the response does not depend on::
+
+            env.defer(make_thumbnails, item.image.path)
+        '''
+        if not self._deferred:
+            self._deferred = []
+        self._deferred.append((func, args, kwargs))
+
+    @storage_cached_property
+    def root(self):
+        '''`Reverse` of the application bound to the environment.'''
+        return self._reverse.bind_to_env(self)
+
     @storage_property
     def current_location(self):
         ns = getattr(self, 'namespace', '')
@@ -49,12 +82,80 @@ class Application(object):
     '''
 
     env_class = AppEnvironment
+    # class of `env` and `data` storages, `FlatVersionedStorage` can be used
+    # to make attribute lookup and routing branches cheaper
+    storage_class = VersionedStorage
+    # replace linear chains of handlers by loops, see `iktomi.web.flatten`
+    flatten_chains = False
+    # `iktomi.web.route_order.RouteOrder` instance to try most requested
+    # branches of `web.cases` first, see `iktomi.web.route_order`
+    route_order = None
+    # `iktomi.web.instrument.HandlerStats` instance to collect timings of
+    # every handler to, see `iktomi.web.instrument`
+    handler_stats = None
+    # an object with `submit(func, *args)` method, like
+    # `concurrent.futures.ThreadPoolExecutor`, to run tasks deferred with
+    # `env.defer()` in background. By default they are run by the thread
+    # that served the request, after the response is sent.
+    defer_executor = None
+    # `iktomi.web.metrics.MetricsRegistry` instance to count requests by
+    # endpoint and status, it is available as `env.metrics` to handlers
+    metrics = None
+    # `iktomi.web.slow_requests.SlowRequestSampler` instance logging
+    # stack profiles of slow requests, it is available as
+    # `env.slow_requests`
+    slow_requests = None
 
     def __init__(self, handler, env_class=None):
         self.handler = handler
         if env_class is not None:
             self.env_class = env_class
+        # time in seconds spent to build routes by steps. Url templates
+        # are compiled when handlers are created, so `process_templates`
+        # is the time spent to compile them by all applications of the
+        # process so far.
+        self.build_times = {
+            'process_templates': template_cache_info()['time'],
+        }
+        started = time.time()
         self.root = Reverse.from_handler(handler)
+        self.build_times['reverse'] = time.time() - started
+        if self.flatten_chains:
+            started = time.time()
+            self.handler = flatten_chains(handler)
+            self.build_times['flatten'] = time.time() - started
+            logger.debug('Handler chains are flattened, call depths: %r',
+                         self.call_depths())
+        if self.route_order is not None:
+            started = time.time()
+            self.handler = reorder_cases(self.handler, self.route_order)
+            self.build_times['route_order'] = time.time() - started
+        if self.handler_stats is not None:
+            started = time.time()
+            self.handler = instrument(self.handler, self.handler_stats)
+            self.build_times['instrument'] = time.time() - started
+        if self.metrics is not None:
+            self._request_metrics = RequestMetrics(self.metrics)
+        logger.info('Routes are built: %s',
+                    ', '.join('%s %.3fs' % item
+                              for item in sorted(self.build_times.items())))
+
+    def warm(self):
+        '''
+        Does lazy work of building routes and reverse map, so it is done
+        once in the master process before forking workers. Call it from
+        pre-fork hook of your server.'''
+        started = time.time()
+        self.root.warm()
+        self.build_times['warm'] = time.time() - started
+        logger.info('Routes are warmed up in %.3fs',
+                    self.build_times['warm'])
+
+    def call_depths(self):
+        '''
+        Returns a dict of endpoint names and a number of nested handler
+        calls needed to reach the endpoint.'''
+        return call_depths(self.handler)
 
     def handle_error(self, env):
         '''
@@ -63,6 +164,49 @@ class Application(object):
         logger.exception('Exception for %s %s :',
                          env.request.method, env.request.url)
 
+    def run_deferred(self, env):
+        '''
+        Calls tasks deferred with `env.defer()`, errors are passed to
+        `handle_error`.'''
+        deferred = getattr(env, '_deferred', None)
+        while deferred:
+            func, args, kwargs = deferred.pop(0)
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                self.handle_error(env)
+
+    def _after_response(self, env):
+        if not getattr(env, '_deferred', None):
+            return
+        if self.defer_executor is not None:
+            self.defer_executor.submit(self.run_deferred, env)
+        else:
+            self.run_deferred(env)
+
+    def create_env(self, request, **kwargs):
+        '''Creates `env` storage for the request.'''
+        if self.metrics is not None:
+            kwargs['metrics'] = self.metrics
+        if self.slow_requests is not None:
+            kwargs['slow_requests'] = self.slow_requests
+        env = self.storage_class(self.env_class, request, self.root,
+                                 **kwargs)
+        if self.metrics is not None or self.slow_requests is not None:
+            # both need the endpoint name, see `observe_request`
+            env._route_state.track_location = True
+        return env
+
+    def observe_request(self, env, response, started):
+        '''
+        Records request metrics by endpoint name and status of the
+        response, if `metrics` is set.'''
+        if self.metrics is None:
+            return
+        self._request_metrics.observe(env._route_state.location or '',
+                                      response.status_int,
+                                      time.time() - started)
+
     def handle(self, env, data):
         '''
         Calls application and handles following cases:
@@ -82,6 +226,8 @@ class Application(object):
         except Exception, e:
             self.handle_error(env)
             response = HTTPInternalServerError()
+        # the response is not returned from any branch of `web.cases`
+        _record_location(env)
         return response
 
     def __call__(self, environ, start_response):
@@ -89,8 +235,77 @@ class Application(object):
         WSGI interface method. 
         Creates webob and iktomi wrappers and calls `handle` method.
         '''
+        started = time.time()
         request = Request(environ, charset='utf-8')
-        env = VersionedStorage(self.env_class, request, self.root)
-        data = VersionedStorage()
-        response = self.handle(env, data)
-        return response(environ, start_response)
+        env = self.create_env(request)
+        data = self.storage_class()
+        sampler = self.slow_requests
+        if sampler is None:
+            response = self.handle(env, data)
+        else:
+            watched = sampler.start(env)
+            response = self.handle(env, data)
+            sampler.finish(watched)
+        self.observe_request(env, response, started)
+        streaming = is_streaming(response)
+        if streaming:
+            response.app_iter = _StreamErrors(self, env, response.app_iter)
+        app_iter = response(environ, start_response)
+        # streaming body can defer tasks too
+        if streaming or getattr(env, '_deferred', None):
+            app_iter = _ClosingIter(app_iter,
+                                    lambda: self._after_response(env))
+        return app_iter
+
+
+class _ClosingIter(object):
+    '''
+    WSGI iterable calling `callback` when WSGI server closes it, that is
+    after the response is sent.
+    '''
+
+    def __init__(self, app_iter, callback):
+        self.app_iter = app_iter
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            close = getattr(self.app_iter, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.callback()
+
+
+class _StreamErrors(object):
+    '''
+    Iterates over body of streaming response calling `handle_error` of
+    application on exceptions. The response is already started then, so
+    the exception is reraised to let WSGI server abort it.
+    '''
+
+    def __init__(self, app, env, app_iter):
+        self.app = app
+        self.env = env
+        self.app_iter = app_iter
+        self._iter = iter(app_iter)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise
+        except Exception:
+            self.app.handle_error(self.env)
+            raise
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
@@ -2,6 +2,7 @@
 
 __all__ = ['WebHandler', 'cases', 'request_filter']
 
+import re
 import logging
 import functools
 
@@ -23,6 +24,29 @@ def respond(response):
         return response
     return response_wrapper
 
+def _static_segment(literal, complete):
+    '''
+    Returns `(segment, exact)` describing first path segment of every path
+    starting with `literal` (the whole path if `complete` is true): the
+    segment is equal to `segment` if `exact` is true, otherwise it starts
+    with it. Returns None if nothing is known about the segment.'''
+    if not literal.startswith('/'):
+        return None
+    segment, slash, rest = literal[1:].partition('/')
+    if slash or complete:
+        return segment, True
+    if segment:
+        # literal ends inside the first segment, like `prefix('/news')`
+        # matching both '/news/1' and '/newsletter'
+        return segment, False
+    return None
+
+def _path_segment(path, pos):
+    if path.startswith('/', pos):
+        end = path.find('/', pos + 1)
+        return path[pos+1:end] if end >= 0 else path[pos+1:]
+    return None
+
 def prepare_handler(handler):
     if isinstance(handler, Response):
         return respond(handler)
@@ -32,9 +56,77 @@ def prepare_handler(handler):
     return handler
 
 
+def _none_handler(env, data):
+    return None
+
+
+def _call_branch(handler, env, data):
+    '''
+    Calls `handler` in a new frame of `env` and `data`, so the changes
+    made by a branch not returning a response are not seen by the next
+    one. Used by `cases` and other handlers choosing between branches.'''
+    _enter_branch(env, data)
+    answered = True
+    try:
+        result = handler(env, data)
+        answered = result is not None
+        return result
+    finally:
+        _exit_branch(env, data, answered)
+
+
+def _enter_branch(env, data):
+    env._push()
+    data._push()
+
+
+def _exit_branch(env, data, answered):
+    # `answered` is True if the branch returned a response or raised
+    if answered:
+        _record_location(env)
+    env._pop()
+    data._pop()
+
+
+def _record_location(env):
+    '''
+    Remembers location of the endpoint answering the request in route
+    state, while its frame of `env` is not popped. The innermost branch
+    wins. Does nothing unless the application needs the location for
+    metrics or slow requests log.'''
+    route_state = getattr(env, '_route_state', None)
+    if route_state is not None and route_state.track_location and \
+            route_state.location is None:
+        route_state.location = env.current_location
+
+
+class _next_handler_property(object):
+    '''
+    Same as `property`, but allows to store resolved value in instance
+    `__dict__`, which is done by build steps like `flatten_chains`.
+    '''
+
+    def __init__(self, method):
+        self.method = method
+        self.__doc__ = method.__doc__
+
+    def __get__(self, inst, cls):
+        if inst is None:
+            return self
+        return self.method(inst)
+
+
 class WebHandler(object):
     '''Base class for all request handlers.'''
 
+    # Handlers doing nothing but checking a condition and updating env and
+    # data before calling the next handler can define `_step(env, data)`
+    # method returning True if the next handler should be called. Chains of
+    # such handlers are executed by a loop instead of nested calls when
+    # they are flattened. Path offset pushed by a step (`prefix`) is
+    # restored by the caller if the chain does not return a response.
+    _step = None
+
     def __or__(self, next_handler):
         '''
         Supports chaining handler after itself::
@@ -46,6 +138,8 @@ class WebHandler(object):
         #     causes a copy of each single nested handler.
         #     Sure, is bad idea to chain anything after big cases(..) anyway.
         h = self.copy()
+        # drop next handler resolved by build steps
+        h.__dict__.pop('next_handler', None)
 
         next_handler = prepare_handler(next_handler)
         if hasattr(self, '_next_handler'):
@@ -61,6 +155,25 @@ class WebHandler(object):
         # we are last in chain
         return {}
 
+    def _static_prefix(self):
+        '''
+        Returns `(literal, complete)` tuple describing paths the handler
+        can return a response for: all of them start with urlencoded
+        `literal`, and if `complete` is true, are equal to it.
+        Used by compiled `cases` to skip branches that can not match.
+        '''
+        return '', False
+
+    def _match_template(self):
+        '''
+        Returns `UrlTemplate` the handler matches the whole path against
+        or None. Handlers returning a template must implement
+        `_call_matched(values, env, data)` method accepting a dict of
+        urlencoded url params matched by the template.
+        Used by compiled `cases` to match sibling templates at once.
+        '''
+        return None
+
     def __repr__(self):
         return '%s()' % self.__class__.__name__
 
@@ -79,12 +192,25 @@ class WebHandler(object):
         '''
         raise NotImplementedError("__call__ is not implemented in %r" % self)
 
-    @property
+    @_next_handler_property
     def next_handler(self):
         '''A handler, chained next to self'''
         if hasattr(self, '_next_handler'):
             return self._next_handler
-        return lambda e, d: None
+        return _none_handler
+
+    def _map_handlers(self, func):
+        '''
+        Returns a copy of the handler with each nested handler replaced by
+        `func(handler)`. Used by build steps transforming handlers tree.
+        '''
+        if not hasattr(self, '_next_handler'):
+            return self
+        h = self.copy()
+        h._next_handler = func(self._next_handler)
+        # resolve next handler once
+        h.next_handler = h._next_handler
+        return h
 
     def copy(self):
         '''
@@ -104,10 +230,32 @@ class cases(WebHandler):
             web.match('/', 'index') | index,
             web.match('/contacts', 'contacts') | contacts,
             web.match('/about', 'about') | about,
-        )'''
+        )
+
+    If `compiled=True` is given, the index of branches by the first segment
+    of their static url part is built, and only branches that can match
+    the current path are called. Templates of sibling `web.match` handlers
+    are combined into one pattern, so there is a single regex match instead
+    of one per branch. The order of branches is kept::
 
-    def __init__(self, *handlers):
+        web.cases(
+            web.prefix('/news') | news_app,
+            web.prefix('/docs') | docs_app,
+            compiled=True)'''
+
+    def __init__(self, *handlers, **kwargs):
         self.handlers = map(prepare_handler, handlers)
+        self.compiled = kwargs.pop('compiled', False)
+        if kwargs:
+            raise TypeError("cases.__init__ got an unexpected keyword "
+                            "arguments {}".format(",".join(kwargs)))
+        self._compile()
+
+    def _compile(self):
+        if self.compiled:
+            self._index = _DispatchIndex(self.handlers)
+        else:
+            self._index = None
 
     def __or__(self, next_handler):
         #cases needs to set next handler for each handler it keeps
@@ -116,6 +264,13 @@ class cases(WebHandler):
                             if is_chainable(handler) 
                             else handler)
                       for handler in self.handlers]
+        h._compile()
+        return h
+
+    def _map_handlers(self, func):
+        h = self.copy()
+        h.handlers = [func(handler) for handler in self.handlers]
+        h._compile()
         return h
 
     def cases(self, env, data):
@@ -124,19 +279,28 @@ class cases(WebHandler):
         If any handler returns `None`, it is interpreted as 
         "request does not match, the handler has nothing to do with it and 
         `web.cases` should try to call the next handler".'''
-        for handler in self.handlers:
-            env._push()
-            data._push()
-            try:
-                result = handler(env, data)
-            finally:
-                env._pop()
-                data._pop()
+        for handler in self._candidates(env):
+            result = _call_branch(handler, env, data)
             if result is not None:
                 return result
     # for readable tracebacks
     __call__ = cases
 
+    def _candidates(self, env):
+        '''Returns nested handlers that can match current request, in
+        the order they should be tried. Subclasses choosing branches
+        differently override it together with `_fallback`, so
+        `iktomi.web.aio` can walk them on the event loop.'''
+        if self._index is not None:
+            route_state = env._route_state
+            return self._index.candidates(route_state.full_path,
+                                          route_state.offset)
+        return self.handlers
+
+    def _fallback(self, env):
+        '''Returns the result when none of the candidates answered.'''
+        return None
+
     def _locations(self):
         locations = {}
         for handler in self.handlers:
@@ -153,6 +317,168 @@ class cases(WebHandler):
                            ', '.join(repr(h) for h in self.handlers))
 
 
+class _MatchGroup(object):
+    '''
+    Consecutive `cases` branches matched by one combined pattern.
+
+    The first matched branch is called with already matched url params,
+    the branches after it are tried one by one as usual (for example,
+    if a converter of the first one has not accepted the value).
+    '''
+
+    # python's re module does not support more groups in one pattern
+    max_groups = 100
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.positions = {}
+        self.params = []
+        sources = []
+        for i, (literal, handler) in enumerate(entries):
+            template = handler._match_template()
+            name = '_b%d' % i
+            self.positions[name] = i
+            self.params.append([(name + '_' + var, var)
+                                for var in template._url_params])
+            sources.append('(?P<%s>%s)' % (name, template.regex(name + '_')))
+        self.pattern = re.compile('(?:%s)' % '|'.join(sources))
+
+    @classmethod
+    def groups_count(cls, handler):
+        '''Returns a number of groups the handler adds to combined pattern
+        or None if it can not be combined'''
+        if not isinstance(handler, WebHandler):
+            return None
+        template = handler._match_template()
+        # converters' regexes having own groups would break group names
+        # and numbered backreferences
+        if template is None or \
+                template._pattern.groups != len(template._url_params):
+            return None
+        return template._pattern.groups + 1
+
+    @classmethod
+    def combine(cls, entries):
+        '''Replaces runs of combinable entries by groups'''
+        result = []
+        run = []
+        run_groups = 0
+        for entry in entries + [None]:
+            count = entry and cls.groups_count(entry[1])
+            if count is None or run_groups + count > cls.max_groups:
+                if len(run) > 1:
+                    result.append(cls(run))
+                else:
+                    result.extend(run)
+                run = []
+                run_groups = 0
+            if entry is None:
+                break
+            if count is None:
+                result.append(entry)
+            else:
+                run.append(entry)
+                run_groups += count
+        return result
+
+    def candidates(self, path, pos):
+        m = self.pattern.match(path, pos)
+        if m is None:
+            return
+        index = self.positions[m.lastgroup]
+        values = dict((name, m.group(group_name))
+                      for group_name, name in self.params[index])
+        handler = self.entries[index][1]
+        yield functools.partial(handler._call_matched, values)
+        for literal, handler in self.entries[index+1:]:
+            if path.startswith(literal, pos):
+                yield handler
+
+
+class _DispatchIndex(object):
+    '''
+    Index of `cases` branches by the first segment of the path.
+
+    Branches having static first segment are put into buckets by it.
+    Branches whose static part ends inside the first segment (like
+    `prefix('/news')` or `match('/item<int:id>')`) are put into buckets of
+    segments starting with their literal. The rest are put into every
+    bucket and into the default list. Original order of branches is kept
+    in all of them. Buckets of other segments are combined on first
+    request of a segment and cached by the set of branches they contain.
+    '''
+
+    # limit of segments with cached buckets
+    max_buckets = 1000
+
+    def __init__(self, handlers):
+        self.entries = entries = []
+        # segment -> indices of branches
+        self.exact = {}
+        self.partial = {}
+        self.unkeyed = []
+        for i, handler in enumerate(handlers):
+            if isinstance(handler, WebHandler):
+                literal, complete = handler._static_prefix()
+            else:
+                literal, complete = '', False
+            entries.append((literal, handler))
+            key = _static_segment(literal, complete)
+            if key is None:
+                self.unkeyed.append(i)
+            else:
+                segment, exact = key
+                index = self.exact if exact else self.partial
+                index.setdefault(segment, []).append(i)
+        # lengths of partial segments to look up
+        self.partial_lengths = sorted(set(len(x) for x in self.partial))
+        self.default = _MatchGroup.combine([entries[i] for i in self.unkeyed])
+        self.buckets = {}
+        self._combined = {}
+        for segment in self.exact.keys() + self.partial.keys():
+            self._bucket(segment)
+
+    def _bucket(self, segment):
+        bucket = self.buckets.get(segment)
+        if bucket is not None:
+            return bucket
+        if segment is None:
+            return self.default
+        key = []
+        if segment in self.exact:
+            key.append((segment, True))
+        for length in self.partial_lengths:
+            if length > len(segment):
+                break
+            if segment[:length] in self.partial:
+                key.append((segment[:length], False))
+        if not key:
+            return self.default
+        key = tuple(key)
+        bucket = self._combined.get(key)
+        if bucket is None:
+            indices = list(self.unkeyed)
+            for part, exact in key:
+                index = self.exact if exact else self.partial
+                indices.extend(index[part])
+            bucket = self._combined[key] = _MatchGroup.combine(
+                    [self.entries[i] for i in sorted(indices)])
+        if len(self.buckets) < self.max_buckets:
+            # segments of arbitrary paths are not cached forever
+            self.buckets[segment] = bucket
+        return bucket
+
+    def candidates(self, path, pos=0):
+        '''Yields handlers that can match given urlencoded path
+        starting from given position'''
+        for entry in self._bucket(_path_segment(path, pos)):
+            if isinstance(entry, _MatchGroup):
+                for handler in entry.candidates(path, pos):
+                    yield handler
+            elif path.startswith(entry[0], pos):
+                yield entry[1]
+
+
 class _FunctionWrapper3(WebHandler):
     '''
     Wrapper for handler represented by function 
@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 
 __all__ = ['match', 'method', 'static_files', 'prefix', 
-           'subdomain', 'namespace', 'by_method']
-
+           'subdomain', 'namespace', 'by_method', 'by_subdomain', 'gzip',
+           'limit_concurrency', 'etag', 'check_etag']
+
+import os
+import stat
+import time
+import zlib
+import hashlib
 import logging
+import threading
 import mimetypes
 from os import path
+from collections import OrderedDict
 from urllib import unquote
-from webob.exc import HTTPMethodNotAllowed
-from .core import WebHandler, cases
+from webob.exc import HTTPMethodNotAllowed, HTTPServiceUnavailable, \
+                      HTTPNotModified
+from .core import WebHandler, cases, _call_branch
 from . import Response
+from .response import is_streaming, body_in_memory
 from .url_templates import UrlTemplate
 from .reverse import Location
 
@@ -43,17 +53,45 @@ class match(WebHandler):
         self.builder = UrlTemplate(url, converters=convs)
 
     def match(self, env, data):
-        matched, kwargs = self.builder.match(env._route_state.path, env=env)
-        if matched is not None:
-            env.current_url_name = self.url_name
-            update_data(data, kwargs)
+        if self._step(env, data):
             return self.next_handler(env, data)
         return None
     __call__ = match # for beautiful tracebacks
 
+    def _step(self, env, data):
+        route_state = env._route_state
+        end, kwargs = self.builder.match_to(route_state.full_path,
+                                            route_state.offset, env=env)
+        if end is None:
+            return False
+        self._matched(env, data, kwargs)
+        return True
+
+    def _step_matched(self, values, env, data):
+        kwargs = self.builder.convert(values, env=env)
+        if kwargs is None:
+            return False
+        self._matched(env, data, kwargs)
+        return True
+
+    def _matched(self, env, data, kwargs):
+        env.current_url_name = self.url_name
+        update_data(data, kwargs)
+
+    def _call_matched(self, values, env, data):
+        if self._step_matched(values, env, data):
+            return self.next_handler(env, data)
+        return None
+
+    def _match_template(self):
+        return self.builder
+
     def _locations(self):
         return {self.url_name: (Location(self.builder), {})}
 
+    def _static_prefix(self):
+        return self.builder.static_prefix, self.builder.is_static
+
     def __repr__(self):
         return '%s(\'%s\', \'%s\')' % \
                 (self.__class__.__name__, self.url, self.url_name)
@@ -86,10 +124,7 @@ class prefix(WebHandler):
             self._next_handler = namespace(name)
 
     def prefix(self, env, data):
-        matched, kwargs = self.builder.match(env._route_state.path, env=env)
-        if matched is not None:
-            update_data(data, kwargs)
-            env._route_state.add_prefix(matched)
+        if self._step(env, data):
             result = self.next_handler(env, data)
             if result is not None:
                 return result
@@ -97,12 +132,27 @@ class prefix(WebHandler):
         return None
     __call__ = prefix
 
+    def _step(self, env, data):
+        # the offset pushed is popped by the caller if the chain does not
+        # return a response, see `FlatChain`
+        route_state = env._route_state
+        end, kwargs = self.builder.match_to(route_state.full_path,
+                                            route_state.offset, env=env)
+        if end is None:
+            return False
+        update_data(data, kwargs)
+        route_state.push_offset(end)
+        return True
+
     def _locations(self):
         locations = WebHandler._locations(self)
         for location, scope in locations.values():
             location.builders.insert(0, self.builder)
         return locations
 
+    def _static_prefix(self):
+        return self.builder.static_prefix, False
+
     def __repr__(self):
         return '%s(\'%r\')' % (self.__class__.__name__, self.builder)
 
@@ -119,12 +169,21 @@ class namespace(WebHandler):
         self.namespace = ns
 
     def namespace(self, env, data):
+        self._step(env, data)
+        return self.next_handler(env, data)
+    __call__ = namespace
+
+    def _step(self, env, data):
         if hasattr(env, 'namespace'):
             env.namespace += '.' + self.namespace
         else:
             env.namespace = self.namespace
-        return self.next_handler(env, data)
-    __call__ = namespace
+        return True
+
+    def _static_prefix(self):
+        if isinstance(self.next_handler, WebHandler):
+            return self.next_handler._static_prefix()
+        return WebHandler._static_prefix(self)
 
     def _locations(self):
         locations = WebHandler._locations(self)
@@ -187,13 +246,19 @@ class method(WebHandler):
         assert not kw
 
     def method(self, env, data):
-        if env.request.method in self._names:
+        if self._step(env, data):
             return self.next_handler(env, data)
-        if self.strict:
-            raise HTTPMethodNotAllowed()
         return None
     __call__ = method
 
+    def _step(self, env, data):
+        if env.request.method in self._names:
+            return True
+        if self.strict:
+            raise HTTPMethodNotAllowed(
+                    headers={'Allow': ', '.join(sorted(self._names))})
+        return False
+
     def __repr__(self):
         return 'method(%s)' % ', '.join(repr(n) for n in self._names)
 
@@ -204,20 +269,67 @@ class by_method(cases):
 
         by_method({'GET': get_item_handler,
                    'POST': save_item_handler})
+
+    The handler is chosen by a dict lookup. `HEAD` requests are handled by
+    `GET` handler unless `HEAD` is given explicitly. If there is no handler
+    for the method or the handler returns None, `default_handler` is
+    called, or 405 response with `Allow` header is returned.
     '''
 
     def __init__(self, handlers_dict, default_handler=None):
         handlers = []
-        for methods, handler in handlers_dict.items():
-            if isinstance(methods, basestring):
-                methods = (methods,)
-            handlers.append(method(*methods, strict=False) | handler)
-        if default_handler is not None:
+        # method name -> index of handler in self.handlers
+        self._methods = methods = {}
+        for names, handler in handlers_dict.items():
+            if isinstance(names, basestring):
+                names = (names,)
+            for name in names:
+                methods[name.upper()] = len(handlers)
+            handlers.append(handler)
+        if 'GET' in methods:
+            methods.setdefault('HEAD', methods['GET'])
+        self._allow = ', '.join(sorted(methods))
+        self._has_default = default_handler is not None
+        if self._has_default:
             handlers.append(default_handler)
-        else:
-            handlers.append(HTTPMethodNotAllowed())
         cases.__init__(self, *handlers)
 
+    def _compile(self):
+        self._index = None
+        self._dispatch = dict((name, self.handlers[i])
+                              for name, i in self._methods.items())
+        self._default = self.handlers[-1] if self._has_default else None
+
+    def by_method(self, env, data):
+        handler = self._dispatch.get(env.request.method)
+        default = self._default
+        if handler is not None:
+            if default is None:
+                result = handler(env, data)
+            else:
+                # default handler should not see changes made by handler
+                result = _call_branch(handler, env, data)
+            if result is not None:
+                return result
+        if default is not None:
+            return default(env, data)
+        return self._fallback(env)
+    __call__ = by_method
+
+    def _candidates(self, env):
+        handler = self._dispatch.get(env.request.method)
+        return [x for x in (handler, self._default) if x is not None]
+
+    def _fallback(self, env):
+        if self._default is not None:
+            return None
+        return HTTPMethodNotAllowed(headers={'Allow': self._allow})
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%r: %r' % (name, self._dispatch[name])
+                                     for name in sorted(self._dispatch)))
+
 
 class subdomain(WebHandler):
     '''
@@ -262,6 +374,12 @@ class subdomain(WebHandler):
                             "arguments {}".format(",".join(kwargs)))
 
     def subdomain(self, env, data):
+        if self._step(env, data):
+            return self.next_handler(env, data)
+        return None
+    __call__ = subdomain
+
+    def _step(self, env, data):
         subdomain = env._route_state.subdomain
         #XXX: here we can get 'idna' encoded sequence, that is the bug
         for subd in self.subdomains:
@@ -278,9 +396,8 @@ class subdomain(WebHandler):
 
             if matches:
                 env._route_state.add_subdomain(self.primary, subd)
-                return self.next_handler(env, data)
-        return None
-    __call__ = subdomain
+                return True
+        return False
 
     def _locations(self):
         locations = WebHandler._locations(self)
@@ -292,17 +409,191 @@ class subdomain(WebHandler):
         return '%s(%r)' % (self.__class__.__name__, self.subdomains)
 
 
+class by_subdomain(cases):
+    '''
+    Cases chooser handler for sites served by one application. Branches
+    starting with `web.subdomain` are indexed by subdomain aliases, so
+    the matching branch is found by a few dict lookups instead of trying
+    each site in turn::
+
+        web.by_subdomain(
+            web.subdomain('example.com', 'example.ru', name='main') | main,
+            web.subdomain('example.org', name='org') | org,
+            web.subdomain('admin.example.com', name='admin') | admin,
+        )
+
+    Branches matching the current host are called in the order they are
+    given. Branches not starting with `web.subdomain` or having empty or
+    `None` subdomain aliases are always tried, as in `web.cases`.
+    '''
+
+    def __init__(self, *handlers):
+        cases.__init__(self, *handlers)
+
+    @staticmethod
+    def _is_indexed(handler):
+        return isinstance(handler, subdomain) and \
+               all(handler.subdomains)
+
+    def _compile(self):
+        self._index = None
+        # alias -> [(branch index, alias position in branch)]
+        self._aliases = aliases = {}
+        self._unindexed = []
+        for i, handler in enumerate(self.handlers):
+            if self._is_indexed(handler):
+                for pos, alias in enumerate(handler.subdomains):
+                    aliases.setdefault(alias, []).append((i, pos))
+            else:
+                self._unindexed.append(i)
+
+    def _map_handlers(self, func):
+        # keep subdomain filters in place to check them by the index
+        h = self.copy()
+        h.handlers = [handler._map_handlers(func)
+                            if self._is_indexed(handler)
+                            else func(handler)
+                      for handler in self.handlers]
+        h._compile()
+        return h
+
+    def _match(self, domain):
+        # returns a dict {branch index: (alias position, alias)} of indexed
+        # branches matching domain, looking up all label-aligned suffixes
+        matched = {}
+        aliases = self._aliases
+        pos = 0
+        while True:
+            alias = domain[pos:]
+            for i, alias_pos in aliases.get(alias, ()):
+                if i not in matched or matched[i][0] > alias_pos:
+                    matched[i] = (alias_pos, alias)
+            pos = domain.find('.', pos) + 1
+            if not pos:
+                return matched
+
+    def _indices(self, route_state):
+        # indices of branches to try and matched indexed branches
+        matched = self._match(route_state.subdomain)
+        indices = self._unindexed
+        if matched:
+            indices = sorted(indices + matched.keys())
+        return indices, matched
+
+    def by_subdomain(self, env, data):
+        route_state = env._route_state
+        indices, matched = self._indices(route_state)
+        state = route_state.subdomain_state()
+        for i in indices:
+            handler = self.handlers[i]
+            if i in matched:
+                route_state.add_subdomain(handler.primary, matched[i][1])
+                result = _call_branch(handler.next_handler, env, data)
+            else:
+                result = _call_branch(handler, env, data)
+            if result is not None:
+                return result
+            # restore subdomain state changed by the branch
+            route_state.restore_subdomain_state(state)
+    __call__ = by_subdomain
+
+    def _candidates(self, env):
+        # subdomain filters of indexed branches check the domain again
+        indices, matched = self._indices(env._route_state)
+        return [self.handlers[i] for i in indices]
+
+
+
+class _FileIter(object):
+    '''
+    Iterates over a file by blocks and closes it when done. Supports
+    `app_iter_range`, so webob serves byte ranges without reading skipped
+    data.
+    '''
+
+    block_size = 1 << 16
+
+    def __init__(self, f):
+        self.file = f
+
+    def app_iter_range(self, start=None, stop=None):
+        f = self.file
+        try:
+            if start:
+                f.seek(start)
+            left = None if stop is None else stop - (start or 0)
+            while left is None or left > 0:
+                size = self.block_size if left is None \
+                                       else min(self.block_size, left)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                if left is not None:
+                    left -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    def __iter__(self):
+        return self.app_iter_range()
+
+    def close(self):
+        self.file.close()
+
+
+def _accepts_gzip(header):
+    for item in (header or '').split(','):
+        params = item.strip().split(';')
+        if params[0].strip().lower() not in ('gzip', '*'):
+            continue
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    if float(value) == 0:
+                        break
+                except ValueError:
+                    break
+        else:
+            return True
+    return False
+
 
 class static_files(WebHandler):
     '''
-    Static file handler for dev server (not recommended in production)::
+    Static file handler::
 
        static_files('/path/to/static', url='/static/')
+
+    By default it is a simple handler for dev server. With `production=True`
+    it is suitable to serve files in production:
+
+        * file is streamed with `wsgi.file_wrapper` of WSGI server (it can use
+          `sendfile`), if available;
+        * `ETag` and `Last-Modified` headers are built from file's `stat`,
+          `If-None-Match`/`If-Modified-Since` requests are answered with 304
+          without opening the file;
+        * `Range` requests are served;
+        * if client accepts gzip and there is a precompressed `.gz` sibling
+          of the file, the sibling is served;
+        * results of `stat` and mime type guessing are kept in a cache of
+          `cache_size` entries for `cache_ttl` seconds.
+
+    `max_age` sets `Cache-Control: max-age` header of served files.
     '''
 
-    def __init__(self, location, url='/static/'):
+    def __init__(self, location, url='/static/', production=False,
+                 max_age=None, cache_size=1000, cache_ttl=10):
         self.location = location
         self.url = url
+        self.production = production
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._root = path.join(path.abspath(location), '')
+        # shared by copies of the handler
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
 
     def construct_reverse(self):
         def url_for_static(part):
@@ -314,26 +605,467 @@ class static_files(WebHandler):
     def static_files(self, env, data):
         path_info = unquote(env.request.path)
         if path_info.startswith(self.url):
-            static_path = path_info[len(self.url):]
-            while static_path[0] in ('.', '/', '~'):
-                static_path = static_path[1:]
-            file_path = path.join(self.location, static_path)
-            if path.exists(file_path) and path.isfile(file_path):
-                mime = mimetypes.guess_type(file_path)[0]
-                response = Response()
-                if mime:
-                    response.content_type = mime
-                with open(file_path, 'r') as f:
-                    response.write(f.read())
-                return response
+            file_path = self._file_path(path_info[len(self.url):])
+            if self.production:
+                response = self._serve(env, file_path)
             else:
+                response = self._serve_simple(file_path)
+            if response is None:
                 logger.info('Client requested non existent static data "%s"',
                             file_path)
                 return Response(status=404)
+            return response
         return None
     __call__ = static_files
 
+    def _file_path(self, static_path):
+        static_path = static_path.lstrip('./~')
+        file_path = path.normpath(path.join(self._root, static_path))
+        if not file_path.startswith(self._root):
+            # the path points outside of location with '..'
+            return self._root
+        return file_path
+
+    def _serve_simple(self, file_path):
+        if not path.isfile(file_path):
+            return None
+        mime = mimetypes.guess_type(file_path)[0]
+        response = Response()
+        if mime:
+            response.content_type = mime
+        with open(file_path, 'rb') as f:
+            response.write(f.read())
+        return response
+
+    def _stat(self, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return int(st.st_mtime), st.st_size
+
+    def _file_info(self, file_path):
+        # (stat of the file, stat of .gz sibling, mime type), cached
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(file_path)
+        if cached is not None and now - cached[0] < self.cache_ttl:
+            return cached[1]
+        info = (self._stat(file_path), self._stat(file_path + '.gz'),
+                mimetypes.guess_type(file_path)[0])
+        # OrderedDict is corrupted by concurrent changes
+        with self._lock:
+            self._cache.pop(file_path, None)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+            self._cache[file_path] = (now, info)
+        return info
+
+    def _serve(self, env, file_path):
+        file_stat, gz_stat, mime = self._file_info(file_path)
+        if file_stat is None:
+            return None
+        request = env.request
+        response = Response(conditional_response=True)
+        if mime:
+            response.content_type = mime
+        if self.max_age is not None:
+            response.cache_control.max_age = self.max_age
+        etag_suffix = ''
+        if gz_stat is not None:
+            response.vary = ('Accept-Encoding',)
+            if _accepts_gzip(request.headers.get('Accept-Encoding')):
+                file_path += '.gz'
+                file_stat = gz_stat
+                etag_suffix = '-gz'
+                response.content_encoding = 'gzip'
+        self._set_validators(response, file_stat, etag_suffix)
+
+        if request.method in ('GET', 'HEAD') and \
+                self._not_modified(request, response):
+            response.status = 304
+            del response.content_type
+            return response
+
+        try:
+            f = open(file_path, 'rb')
+        except IOError:
+            # the file is removed after it's stat had been cached
+            with self._lock:
+                self._cache.clear()
+            return None
+        st = os.fstat(f.fileno())
+        # the file could be changed after it's stat had been cached
+        file_stat = int(st.st_mtime), st.st_size
+        self._set_validators(response, file_stat, etag_suffix)
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and request.range is None:
+            response.app_iter = file_wrapper(f, _FileIter.block_size)
+        else:
+            response.app_iter = _FileIter(f)
+        response.content_length = file_stat[1]
+        return response
+
+    def _set_validators(self, response, file_stat, etag_suffix):
+        mtime, size = file_stat
+        response.etag = '%x-%x%s' % (mtime, size, etag_suffix)
+        response.last_modified = mtime
+
+    def _not_modified(self, request, response):
+        if request.if_none_match:
+            return response.etag in request.if_none_match
+        if request.if_modified_since:
+            return response.last_modified <= request.if_modified_since
+        return False
+
     def __repr__(self):
         return '%s(\'%r\', \'%r\')' % (self.__class__.__name__, 
                                        self.location, self.url)
 
+
+class gzip(WebHandler):
+    '''
+    Compresses responses of next handlers with gzip if client accepts it::
+
+        web.gzip(min_size=1024, level=6) | app
+
+    Bodies shorter than `min_size` bytes and responses with content types
+    starting with one of `skip_content_types` (already compressed formats)
+    are sent as is. Streaming responses are compressed chunk by chunk,
+    responses sending files (see `body_in_memory`) are not compressed.
+    `Vary: Accept-Encoding` header is set on all responses that could be
+    compressed.
+
+    To cache compressed bodies, put `CacheManager` from
+    `iktomi.unstable.web.cache` before the filter, it keeps compressed and
+    uncompressed variants separately::
+
+        cache_manager | web.gzip() | app
+    '''
+
+    skip_content_types = ('image/png', 'image/jpeg', 'image/gif',
+                          'image/webp', 'audio/', 'video/',
+                          'application/zip', 'application/gzip',
+                          'application/x-gzip', 'application/x-bzip2',
+                          'application/x-rar-compressed', 'application/pdf')
+
+    def __init__(self, min_size=500, level=6, skip_content_types=None):
+        self.min_size = min_size
+        self.level = level
+        if skip_content_types is not None:
+            self.skip_content_types = tuple(skip_content_types)
+
+    def gzip(self, env, data):
+        response = self.next_handler(env, data)
+        if response is None:
+            return None
+        return self.compress(env.request, response)
+    __call__ = gzip
+
+    def compressible(self, response):
+        if not isinstance(response, Response) or \
+                response.content_encoding or \
+                response.status_int != 200:
+            return False
+        if not is_streaming(response) and not body_in_memory(response):
+            # files are sent as is, without reading them into memory
+            return False
+        content_type = response.content_type or ''
+        return not content_type.startswith(self.skip_content_types)
+
+    def compress(self, request, response):
+        '''Compresses the response if it is possible and acceptable.'''
+        if not self.compressible(response):
+            return response
+        if 'Accept-Encoding' not in (response.vary or ()):
+            response.vary = tuple(response.vary or ()) + ('Accept-Encoding',)
+        if not _accepts_gzip(request.headers.get('Accept-Encoding')):
+            return response
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        if is_streaming(response):
+            response.app_iter = _GzipIter(response.app_iter, compressor)
+        else:
+            body = response.body
+            if len(body) < self.min_size:
+                return response
+            response.body = compressor.compress(body) + compressor.flush()
+        response.content_encoding = 'gzip'
+        if response.etag:
+            # compressed entity differs from the original
+            response.etag = response.etag + '-gzip'
+        return response
+
+    def __repr__(self):
+        return '%s(min_size=%r, level=%r)' % (self.__class__.__name__,
+                                              self.min_size, self.level)
+
+
+class _GzipIter(object):
+
+    def __init__(self, app_iter, compressor):
+        self.app_iter = app_iter
+        self.compressor = compressor
+        self._iter = iter(app_iter)
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        compressor = self.compressor
+        while not self._finished:
+            try:
+                chunk = next(self._iter)
+            except StopIteration:
+                self._finished = True
+                return compressor.flush()
+            # flush each chunk to send it to the client at once
+            chunk = compressor.compress(chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                return chunk
+        raise StopIteration
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+class _Validator(object):
+    # tag declared by next handlers, shared by all frames of env
+
+    def __init__(self, filter):
+        self.filter = filter
+        self.tag = None
+
+
+class etag(WebHandler):
+    '''
+    Sets strong `ETag` header on responses to GET and HEAD requests and
+    answers 304 Not Modified when the client sends matching
+    `If-None-Match`::
+
+        web.match('/news/<int:id>', 'item') | web.etag() | item
+
+    By default the tag is a hash of the body, which saves the traffic but
+    not the rendering. If the response is determined by a cheap version
+    key, like `updated_dt` of the item shown, the key can be returned by
+    `version` function called with `env, data`, or declared by the handler
+    with `check_etag`. Then repeated requests are answered without
+    rendering::
+
+        web.match('/news/<int:id>', 'item') | load_item |
+            web.etag(version=lambda env, data: data.item.updated_dt) | item
+
+    `salt`, like a release number, is mixed into tags made from version
+    keys, so the responses rendered by new code get new tags.
+
+    Streaming responses, responses sending files (see `body_in_memory`)
+    and responses with status other than 200 are not hashed, tags set by
+    next handlers are kept. Put the filter after
+    `web.gzip`, then tags of compressed variants (with `-gzip` suffix)
+    are matched too.
+    '''
+
+    # headers of the response repeated in 304 response
+    not_modified_headers = ('Cache-Control', 'Expires', 'Vary',
+                            'Content-Location')
+
+    def __init__(self, version=None, salt=''):
+        self.version = version
+        self.salt = salt
+
+    def etag(self, env, data):
+        request = env.request
+        if request.method not in ('GET', 'HEAD'):
+            return self.next_handler(env, data)
+        validator = env._etag = _Validator(self)
+        if self.version is not None:
+            key = self.version(env, data)
+            if key is not None:
+                validator.tag = self.make_tag(key)
+                not_modified = self.not_modified(request, validator.tag)
+                if not_modified is not None:
+                    return not_modified
+        response = self.next_handler(env, data)
+        if not isinstance(response, Response) or response.status_int != 200:
+            return response
+        if response.etag is None:
+            if validator.tag is not None:
+                response.etag = validator.tag
+            elif not body_in_memory(response):
+                # streaming responses and files are not read to hash them
+                return response
+            else:
+                response.etag = hashlib.md5(response.body).hexdigest()
+        return self.not_modified(request, response.etag, response) or \
+               response
+    __call__ = etag
+
+    def make_tag(self, key):
+        '''Returns tag for version key.'''
+        return hashlib.md5('%s:%r' % (self.salt, key)).hexdigest()
+
+    def not_modified(self, request, tag, response=None):
+        '''
+        Returns 304 response if the client has the entity with `tag` or
+        its compressed variant, None otherwise.'''
+        for candidate in (tag, tag + '-gzip'):
+            if candidate in request.if_none_match:
+                break
+        else:
+            return None
+        not_modified = HTTPNotModified()
+        not_modified.etag = candidate
+        if response is not None:
+            for name in self.not_modified_headers:
+                if name in response.headers:
+                    not_modified.headers[name] = response.headers[name]
+        return not_modified
+
+    def __repr__(self):
+        return '%s(version=%r)' % (self.__class__.__name__, self.version)
+
+
+def check_etag(env, key):
+    '''
+    Declares version key of the response before it is rendered by handler
+    after `etag` filter. Raises `HTTPNotModified` if the client already has
+    the response of this version::
+
+        def item(env, data):
+            item = env.db.query(Item).get(data.id)
+            web.check_etag(env, item.updated_dt)
+            return env.render_to_response('item', {'item': item})
+
+    Does nothing if there is no `etag` filter before the handler or the
+    request is not GET or HEAD.
+    '''
+    validator = getattr(env, '_etag', None)
+    if validator is None:
+        return
+    validator.tag = validator.filter.make_tag(key)
+    not_modified = validator.filter.not_modified(env.request, validator.tag)
+    if not_modified is not None:
+        raise not_modified
+
+
+class _Slots(object):
+    # in-flight requests limited by one limiter key
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.counters = dict(admitted=0, queued=0, shed=0)
+
+    def acquire(self, max_queued, timeout):
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                self.counters['admitted'] += 1
+                return True
+            if self.waiting >= max_queued:
+                self.counters['shed'] += 1
+                return False
+            self.counters['queued'] += 1
+            self.waiting += 1
+            deadline = time.time() + timeout
+            try:
+                while self.active >= self.limit:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        self.counters['shed'] += 1
+                        return False
+                    self.condition.wait(left)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.counters['admitted'] += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class limit_concurrency(WebHandler):
+    '''
+    Limits the number of requests handled by next handlers at the same
+    time in current process::
+
+        web.limit_concurrency(4, max_queued=8, timeout=2) | heavy_handler
+
+    When `max_active` requests are in progress, up to `max_queued`
+    requests wait for at most `timeout` seconds. Other requests, and the
+    ones that have not got a chance in time, get 503 response with
+    `Retry-After: retry_after` header immediately.
+
+    If `per_namespace=True`, requests are counted separately for each
+    current namespace (`env.namespace`).
+
+    Note that the slot is released when next handler returns, before the
+    body of streaming response is sent.
+    '''
+
+    def __init__(self, max_active, max_queued=0, timeout=1.0, retry_after=5,
+                 per_namespace=False):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.per_namespace = per_namespace
+        # shared by copies of the handler
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _get_slots(self, key):
+        slots = self._slots.get(key)
+        if slots is None:
+            with self._lock:
+                slots = self._slots.setdefault(key, _Slots(self.max_active))
+        return slots
+
+    def limit_concurrency(self, env, data):
+        key = getattr(env, 'namespace', '') if self.per_namespace else ''
+        slots = self._get_slots(key)
+        if not slots.acquire(self.max_queued, self.timeout):
+            logger.warning('Request %s is shed, %d requests are in progress',
+                           env.request.path, slots.active)
+            return HTTPServiceUnavailable(
+                    headers={'Retry-After': str(self.retry_after)})
+        try:
+            return self.next_handler(env, data)
+        finally:
+            slots.release()
+    __call__ = limit_concurrency
+
+    def counters(self, namespace=None):
+        '''
+        Returns a dict with numbers of `admitted`, `queued` (admitted and
+        shed after waiting) and `shed` requests, and currently `active` and
+        `waiting` ones. Counters are summed over all namespaces unless
+        `namespace` is given.'''
+        if namespace is not None:
+            slots = [self._slots[namespace]] if namespace in self._slots \
+                                              else []
+        else:
+            slots = self._slots.values()
+        result = dict(admitted=0, queued=0, shed=0, active=0, waiting=0)
+        for item in slots:
+            with item.condition:
+                for key, value in item.counters.items():
+                    result[key] += value
+                result['active'] += item.active
+                result['waiting'] += item.waiting
+        return result
+
+    def __repr__(self):
+        return '%s(%r, max_queued=%r)' % (self.__class__.__name__,
+                                          self.max_active, self.max_queued)
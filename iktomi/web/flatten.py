@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+Build step replacing linear chains of handlers by loops.
+
+Every `a | b | c` chain is executed by nested calls: each handler calls
+`self.next_handler(env, data)`. Handlers that just check a condition and
+update env and data (`match`, `prefix`, `namespace`, `method`, `subdomain`)
+implement `_step` method, and chains of them are executed by `FlatChain` in
+a loop instead. `FlatChain` restores the path offset pushed by `prefix`
+steps if the chain does not return a response::
+
+    handler = flatten_chains(app)
+    call_depths(handler) # {'index': 3, 'news.item': 5, ...}
+'''
+
+__all__ = ['FlatChain', 'flatten_chains', 'call_depths']
+
+from .core import WebHandler, cases, _FunctionWrapper3
+from .filters import match, prefix, namespace
+
+
+class FlatChain(WebHandler):
+    '''
+    Chain of step handlers executed by a loop, followed by a handler
+    called after all steps have passed.
+    '''
+
+    def __init__(self, chain, steps, handler):
+        # original chain, used to build reverse map and to chain handlers
+        self.chain = chain
+        self.steps = steps
+        self.handler = handler
+        self._steps = [h._step for h in steps]
+        self._tail_steps = self._steps[1:]
+        # prefix steps push path offset to be restored on a miss
+        self._prefixed = any(isinstance(h, prefix) for h in steps)
+
+    def flat_chain(self, env, data):
+        if self._prefixed:
+            return self._restoring(self._steps, env, data)
+        for step in self._steps:
+            if not step(env, data):
+                return None
+        return self.handler(env, data)
+    __call__ = flat_chain
+
+    def _restoring(self, steps, env, data):
+        route_state = env._route_state
+        state = route_state.offset_state()
+        for step in steps:
+            if not step(env, data):
+                break
+        else:
+            result = self.handler(env, data)
+            if result is not None:
+                return result
+        route_state.restore_offset_state(state)
+        return None
+
+    def __or__(self, next_handler):
+        return flatten_chains(self.chain | next_handler)
+
+    def _map_handlers(self, func):
+        return FlatChain(self.chain, self.steps, func(self.handler))
+
+    def _locations(self):
+        return self.chain._locations()
+
+    def _static_prefix(self):
+        return self.chain._static_prefix()
+
+    def _match_template(self):
+        return self.chain._match_template()
+
+    def _call_matched(self, values, env, data):
+        if not self.steps[0]._step_matched(values, env, data):
+            return None
+        if self._prefixed:
+            return self._restoring(self._tail_steps, env, data)
+        for step in self._tail_steps:
+            if not step(env, data):
+                return None
+        return self.handler(env, data)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ' | '.join(repr(h) for h in
+                                      self.steps + [self.handler]))
+
+
+def _is_step(handler):
+    # subclass overriding __call__ of step handler may do something else,
+    # so _step must be defined in the same class as __call__
+    for cls in type(handler).__mro__:
+        if '__call__' in vars(cls):
+            return vars(cls).get('_step') is not None
+    return False
+
+
+def flatten_chains(handler):
+    '''
+    Returns a copy of handlers tree with linear chains of step handlers
+    replaced by `FlatChain` and `next_handler` of other handlers resolved.
+    '''
+    if not isinstance(handler, WebHandler):
+        return handler
+    steps = []
+    current = handler
+    while isinstance(current, WebHandler) and _is_step(current):
+        steps.append(current)
+        current = current.next_handler
+    if not steps:
+        return handler._map_handlers(flatten_chains)
+    return FlatChain(handler, steps, flatten_chains(current))
+
+
+def _location_names(handler, ns, url_name):
+    if isinstance(handler, namespace):
+        ns = '.'.join(filter(None, (ns, handler.namespace)))
+    elif isinstance(handler, match):
+        url_name = handler.url_name
+    return ns, url_name
+
+
+def _collect_depths(handler, depth, ns, url_name, depths):
+    if isinstance(handler, FlatChain):
+        for step in handler.steps:
+            ns, url_name = _location_names(step, ns, url_name)
+        return _collect_depths(handler.handler, depth + 1,
+                               ns, url_name, depths)
+    if isinstance(handler, cases):
+        for nested in handler.handlers:
+            _collect_depths(nested, depth + 1, ns, url_name, depths)
+        return
+    if isinstance(handler, WebHandler):
+        ns, url_name = _location_names(handler, ns, url_name)
+        if isinstance(handler, _FunctionWrapper3):
+            # wrapped function is called by the wrapper
+            depth += 1
+        if hasattr(handler, '_next_handler'):
+            return _collect_depths(handler._next_handler, depth + 1,
+                                   ns, url_name, depths)
+    if url_name is not None:
+        name = '.'.join(filter(None, (ns, url_name)))
+        depths[name] = max(depths.get(name, 0), depth)
+
+
+def call_depths(handler):
+    '''
+    Returns a dict of endpoint names and a number of nested handler calls
+    needed to reach the last handler of the endpoint.
+    '''
+    depths = {}
+    _collect_depths(handler, 1, '', None, depths)
+    return depths
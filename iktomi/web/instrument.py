@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+'''
+Build step wrapping every handler of handlers tree to collect timing
+statistics: number of calls, number of None results (route misses), total
+and exclusive (without time spent in nested handlers) wall time, keyed by
+handler's repr and `env.current_location`::
+
+    stats = HandlerStats()
+    app = web.cases(
+        web.match('/_stats', 'stats') | stats.view,
+        ...
+    )
+    handler = instrument(app, stats)
+    ...
+    stats.dump('/tmp/handler-stats.json')
+
+`Application` does it if `handler_stats` attribute is set.
+'''
+
+__all__ = ['HandlerStats', 'TimedHandler', 'instrument']
+
+import json
+import time
+import threading
+from functools import partial
+
+from webob import Response
+from .core import WebHandler
+
+
+def _handler_name(handler, max_length=200):
+    if not isinstance(handler, WebHandler) and hasattr(handler, '__name__'):
+        # function repr contains an address, that is useless in reports
+        name = '%s.%s' % (getattr(handler, '__module__', None),
+                          handler.__name__)
+    else:
+        try:
+            name = repr(handler)
+        except UnicodeError:
+            # repr of a handler with non-ascii url template is unicode
+            name = handler.__class__.__name__
+            builder = getattr(handler, 'builder', None)
+            if builder is not None:
+                name += "('%s')" % builder.template.encode('utf-8',
+                                                           'replace')
+    if len(name) > max_length:
+        name = name[:max_length - 3] + '...'
+    return name
+
+
+class HandlerStats(object):
+    '''
+    Timing statistics of handlers. Safe to be used from several threads.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (handler name, location) -> [calls, misses, total, exclusive]
+        self._records = {}
+
+    def _stack(self):
+        # time spent in nested handlers of each handler being called
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def add(self, name, location, elapsed, exclusive, miss):
+        key = (name, location)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = [0, 0, 0.0, 0.0]
+            record[0] += 1
+            record[1] += miss
+            record[2] += elapsed
+            record[3] += exclusive
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+    def as_list(self):
+        '''
+        Returns a list of dicts with `handler`, `location`, `calls`,
+        `misses`, `total` and `exclusive` keys, sorted by exclusive time.'''
+        with self._lock:
+            items = [(key, list(record))
+                     for key, record in self._records.items()]
+        result = [dict(handler=name, location=location, calls=calls,
+                       misses=misses, total=total, exclusive=exclusive)
+                  for (name, location), (calls, misses, total, exclusive)
+                  in items]
+        result.sort(key=lambda x: x['exclusive'], reverse=True)
+        return result
+
+    def report(self):
+        '''Returns statistics as a text table.'''
+        lines = ['%8s %8s %10s %10s  %-30s %s' % (
+                    'calls', 'misses', 'total', 'exclusive',
+                    'location', 'handler')]
+        for item in self.as_list():
+            lines.append('%(calls)8d %(misses)8d %(total)10.4f '
+                         '%(exclusive)10.4f  %(location)-30s %(handler)s'
+                         % item)
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename):
+        '''Writes statistics to a file in JSON format.'''
+        with open(filename, 'w') as f:
+            json.dump(self.as_list(), f, indent=1)
+
+    def view(self, env, data):
+        '''Handler returning the report::
+
+            web.match('/_stats', 'stats') | stats.view
+        '''
+        return Response(self.report(), content_type='text/plain')
+
+
+class TimedHandler(WebHandler):
+    '''
+    Calls wrapped handler and records timing of the call to `stats`.
+    '''
+
+    def __init__(self, handler, stats):
+        self.handler = handler
+        self.stats = stats
+        self.name = _handler_name(handler)
+
+    @property
+    def _next_handler(self):
+        # wrapped handler is chainable if it is chainable itself
+        return self.handler
+
+    def timed(self, env, data):
+        return self._timed(self.handler, env, data)
+    __call__ = timed
+
+    def _timed(self, func, *args):
+        env = args[-2]
+        stack = self.stats._stack()
+        stack.append(0.0)
+        started = time.time()
+        # stays unchanged if an exception is raised
+        result = stack
+        try:
+            result = func(*args)
+        finally:
+            elapsed = time.time() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.stats.add(self.name,
+                           getattr(env, 'current_location', ''),
+                           elapsed, elapsed - nested, result is None)
+        return result
+
+    def __or__(self, next_handler):
+        return instrument(self.handler | next_handler, self.stats)
+
+    def _map_handlers(self, func):
+        return TimedHandler(func(self.handler), self.stats)
+
+    def _static_prefix(self):
+        if isinstance(self.handler, WebHandler):
+            return self.handler._static_prefix()
+        return WebHandler._static_prefix(self)
+
+    def _match_template(self):
+        if isinstance(self.handler, WebHandler):
+            return self.handler._match_template()
+        return None
+
+    def _call_matched(self, values, env, data):
+        return self._timed(self.handler._call_matched, values, env, data)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.handler)
+
+
+def instrument(handler, stats):
+    '''
+    Returns a copy of handlers tree with each handler wrapped by
+    `TimedHandler` recording to `stats`.
+    '''
+    if isinstance(handler, TimedHandler):
+        return handler
+    if isinstance(handler, WebHandler):
+        handler = handler._map_handlers(partial(instrument, stats=stats))
+    return TimedHandler(handler, stats)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+'''
+Metrics registry with counters and histograms, exposed in Prometheus text
+format::
+
+    metrics = MetricsRegistry('/var/run/myapp/metrics')
+
+    class App(Application):
+        metrics = metrics
+
+    app = web.cases(
+        web.match('/metrics', 'metrics') | metrics.view,
+        ...
+    )
+
+When `Application.metrics` is set, requests are counted by endpoint name
+(`env.current_location`) and status code, and their durations are
+observed by the endpoint. The registry is also available as `env.metrics`
+to record other values::
+
+    env.metrics.counter('myapp_emails_total', 'Sent emails').inc()
+    with env.metrics.timer('myapp_upstream_seconds', 'Upstream calls'):
+        call_upstream()
+
+Template rendering time and `CacheManager` hits are recorded when
+`env.metrics` is available.
+
+If `directory` is given, each process keeps its values in mmap'ed file in
+the directory and the values of all processes are summed in the report,
+so the report is the same whichever worker process renders it. Type, help
+and labels of metrics are kept in the files too, so metrics created by
+other processes only are reported. Remove the files when the server is
+restarted.
+'''
+
+__all__ = ['MetricsRegistry', 'Counter', 'Histogram']
+
+import os
+import glob
+import json
+import mmap
+import time
+import struct
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from webob import Response
+
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+# sample name of entries describing metrics in files of processes
+_DESCRIPTION = '#description'
+
+
+class _Metric(object):
+
+    type = None
+    buckets = ()
+
+    def __init__(self, registry, name, help='', labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _describe(self):
+        return [self.type, self.help, list(self.labels), list(self.buckets)]
+
+    def _label_values(self, labels):
+        if len(labels) != len(self.labels):
+            raise TypeError('Metric %s has labels %r, got %r' % (
+                            self.name, self.labels, tuple(labels)))
+        return tuple(unicode(labels[x]) for x in self.labels)
+
+
+class Counter(_Metric):
+    '''Value that can only increase.'''
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry._inc((self.name, '', self._label_values(labels)),
+                           amount)
+
+
+class Histogram(_Metric):
+    '''Counts of observed values by buckets, their sum and count.'''
+
+    type = 'histogram'
+
+    def __init__(self, registry, name, help='', labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        _Metric.__init__(self, registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = self._label_values(labels)
+        for bound in self.buckets:
+            if value <= bound:
+                break
+        else:
+            bound = '+Inf'
+        inc = self.registry._inc
+        inc((self.name, 'bucket:%s' % bound, values), 1)
+        inc((self.name, 'sum', values), value)
+        inc((self.name, 'count', values), 1)
+
+
+class _MmapedValues(object):
+    '''
+    Float values by string keys kept in a file mapped to memory. The file
+    starts with 8 bytes header with used size, followed by entries of
+    4 bytes key length, utf-8 encoded key padded to 8 bytes boundary and
+    8 bytes double value.
+    '''
+
+    initial_size = 1 << 16
+
+    def __init__(self, filename):
+        self._file = open(filename, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.initial_size:
+            self._file.truncate(self.initial_size)
+            size = self.initial_size
+        self._size = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._positions = {}
+        for key, value, pos in _read_entries(self._map, self._used):
+            self._positions[key] = pos
+
+    def inc(self, key, amount):
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._add(key)
+        value = struct.unpack_from('d', self._map, pos)[0]
+        struct.pack_into('d', self._map, pos, value + amount)
+
+    def _add(self, key):
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (8 - (len(encoded) + 4) % 8) % 8
+        entry = struct.pack('i%dsd' % padded, len(encoded), encoded, 0.0)
+        while self._used + len(entry) > self._size:
+            self._map.close()
+            self._size *= 2
+            self._file.truncate(self._size)
+            self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+        pos = self._positions[key] = self._used - 8
+        return pos
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _read_entries(data, used):
+    pos = 8
+    while pos < used:
+        length = struct.unpack_from('i', data, pos)[0]
+        key = data[pos + 4:pos + 4 + length].decode('utf-8')
+        pos += 4 + length + (8 - (length + 4) % 8) % 8
+        value = struct.unpack_from('d', data, pos)[0]
+        yield key, value, pos
+        pos += 8
+
+
+def _read_file(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return
+    used = struct.unpack_from('i', data, 0)[0]
+    for key, value, pos in _read_entries(data, used):
+        yield key, value
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n')\
+                .replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == int(value):
+        return '%d' % value
+    return repr(value)
+
+
+class MetricsRegistry(object):
+    '''
+    Collection of metrics. Metrics are created on first request by name
+    and are shared by all threads.
+    '''
+
+    # name of files with values of processes in `directory`
+    file_pattern = 'metrics_%d.db'
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pid = None
+        self._mmaped = None
+        # keys of values encoded for the files
+        self._encoded = {}
+
+    def counter(self, name, help='', labels=()):
+        '''Returns counter with given name, creating it if needed.'''
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name, help='', labels=(), buckets=DEFAULT_BUCKETS):
+        '''Returns histogram with given name, creating it if needed.'''
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(self, name, help, labels, **kwargs)
+                    if self.directory is not None:
+                        # value of description is not used
+                        self._file_values().inc(json.dumps(
+                                [name, _DESCRIPTION, metric._describe()]), 0)
+                    self._metrics[name] = metric
+        if not isinstance(metric, cls):
+            raise TypeError('Metric %s is %s' % (name, metric.type))
+        return metric
+
+    @contextmanager
+    def timer(self, name, help='', **labels):
+        '''
+        Context manager observing time spent in the block by histogram
+        with given name.'''
+        histogram = self.histogram(name, help, sorted(labels))
+        started = time.time()
+        try:
+            yield
+        finally:
+            histogram.observe(time.time() - started, **labels)
+
+    def _file_values(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # new process after fork
+            self._pid = pid
+            self._mmaped = _MmapedValues(
+                    os.path.join(self.directory, self.file_pattern % pid))
+        return self._mmaped
+
+    def _inc(self, key, amount):
+        if self.directory is None:
+            with self._lock:
+                self._values[key] = self._values.get(key, 0) + amount
+            return
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = self._encoded[key] = json.dumps(key)
+        with self._lock:
+            self._file_values().inc(encoded, amount)
+
+    def collect(self):
+        '''
+        Returns a dict of values by `(metric name, sample, label values)`
+        keys. Values of all processes are summed if `directory` is set.'''
+        return self._collect()[0]
+
+    def _collect(self):
+        # values and descriptions of metrics found in files
+        if self.directory is None:
+            with self._lock:
+                return dict(self._values), {}
+        values = {}
+        descriptions = {}
+        pattern = os.path.join(self.directory,
+                               self.file_pattern.replace('%d', '*'))
+        for filename in glob.glob(pattern):
+            for key, value in _read_file(filename):
+                name, sample, labels = json.loads(key)
+                if sample == _DESCRIPTION:
+                    descriptions[name] = labels
+                    continue
+                key = (name, sample, tuple(labels))
+                values[key] = values.get(key, 0) + value
+        return values, descriptions
+
+    def _described(self, name, description):
+        # metric created by other process only
+        type, help, labels, buckets = description
+        cls = Histogram if type == Histogram.type else Counter
+        kwargs = {'buckets': buckets} if cls is Histogram else {}
+        return cls(self, name, help, labels, **kwargs)
+
+    def render(self):
+        '''Returns all values in Prometheus text exposition format.'''
+        values, descriptions = self._collect()
+        samples = {}
+        for (name, sample, labels), value in values.items():
+            samples.setdefault(name, {}).setdefault(labels, {})[sample] = value
+        lines = []
+        for name in sorted(samples):
+            metric = self._metrics.get(name)
+            if metric is None:
+                if name not in descriptions:
+                    continue
+                metric = self._described(name, descriptions[name])
+            if metric.help:
+                lines.append('# HELP %s %s' % (name, _escape(metric.help)))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for labels, values in sorted(samples[name].items()):
+                pairs = zip(metric.labels, labels)
+                if metric.type == 'counter':
+                    lines.append(self._line(name, pairs, values['']))
+                    continue
+                total = 0
+                for bound in metric.buckets + ('+Inf',):
+                    total += values.get('bucket:%s' % bound, 0)
+                    lines.append(self._line(name + '_bucket',
+                                            pairs + [('le', str(bound))],
+                                            total))
+                lines.append(self._line(name + '_sum', pairs,
+                                        values.get('sum', 0)))
+                lines.append(self._line(name + '_count', pairs,
+                                        values.get('count', 0)))
+        return u'\n'.join(lines) + u'\n'
+
+    def _line(self, name, pairs, value):
+        if pairs:
+            name += u'{%s}' % u','.join(u'%s="%s"' % (key, _escape(value))
+                                        for key, value in pairs)
+        return u'%s %s' % (name, _format_value(value))
+
+    def view(self, env, data):
+        '''Handler returning the report::
+
+            web.match('/metrics', 'metrics') | metrics.view
+        '''
+        return Response(self.render().encode('utf-8'),
+                        content_type='text/plain; version=0.0.4')
+
+
+class RequestMetrics(object):
+    '''
+    Metrics of requests recorded by `Application`.
+    '''
+
+    def __init__(self, registry):
+        self.requests = registry.counter(
+                'iktomi_requests_total', 'Number of handled requests',
+                ['endpoint', 'status'])
+        self.errors = registry.counter(
+                'iktomi_request_errors_total',
+                'Number of requests finished with 5xx status',
+                ['endpoint'])
+        self.duration = registry.histogram(
+                'iktomi_request_duration_seconds',
+                'Time spent by handlers', ['endpoint'])
+
+    def observe(self, endpoint, status, seconds):
+        self.requests.inc(endpoint=endpoint, status=status)
+        if status >= 500:
+            self.errors.inc(endpoint=endpoint)
+        self.duration.observe(seconds, endpoint=endpoint)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+'''
+Replaying access logs against an application in-process to measure its
+throughput and latency::
+
+    replay = Replay(wsgi_app, workers=8)
+    results = replay.run(read_log('/var/log/nginx/access.log'))
+    print results.report()
+    replay.profile(results.slowest(5), '/tmp/profiles')
+
+Log lines in combined format (`$remote_addr - $remote_user [$time_local]
+"$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"`,
+optionally prefixed by `$host`) and JSON lines with `method`, `path`,
+`query`, `host` and `headers` keys are understood.
+
+Requests are run by `workers` threads or, if `processes=True`, by forked
+worker processes. The responses are not checked, status codes are
+reported. `./manage.py app:replay access.log` does the same.
+'''
+
+__all__ = ['Replay', 'ReplayResults', 'read_log', 'parse_line']
+
+import os
+import re
+import copy
+import json
+import math
+import time
+import Queue
+import cProfile
+import threading
+import multiprocessing
+from collections import namedtuple
+
+from webob import Request
+
+
+LogEntry = namedtuple('LogEntry', 'method path query host headers')
+
+_combined = re.compile(
+    r'^(?:(?P<host>[^\s]+)\s+)?(?P<addr>[^\s]+) [^\s]+ [^\s]+ '
+    r'\[[^\]]*\] "(?P<method>[A-Z]+) (?P<url>[^\s"]+)[^"]*" \d+ [\d-]+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?')
+
+
+def parse_line(line, default_host='localhost'):
+    '''Returns `LogEntry` for a line of the log or None if the line is not
+    recognized.'''
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            item = json.loads(line)
+        except ValueError:
+            return None
+        path, _, query = item.get('path', '/').partition('?')
+        return LogEntry(item.get('method', 'GET'), path,
+                        item.get('query', query),
+                        item.get('host', default_host),
+                        item.get('headers') or {})
+    match = _combined.match(line)
+    if match is None:
+        return None
+    path, _, query = match.group('url').partition('?')
+    headers = {}
+    if match.group('referer') not in (None, '', '-'):
+        headers['Referer'] = match.group('referer')
+    if match.group('agent') not in (None, '', '-'):
+        headers['User-Agent'] = match.group('agent')
+    host = match.group('host') or default_host
+    return LogEntry(match.group('method'), path, query, host, headers)
+
+
+def read_log(filename, default_host='localhost'):
+    '''Yields `LogEntry` of each recognized line of the log file.'''
+    with open(filename) as f:
+        for line in f:
+            entry = parse_line(line, default_host)
+            if entry is not None:
+                yield entry
+
+
+def _url(entry):
+    return 'http://%s%s%s' % (entry.host, entry.path,
+                              '?' + entry.query if entry.query else '')
+
+
+def _percentile(values, percent):
+    # nearest-rank method, values are sorted
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+# (entry, endpoint name, status code, seconds)
+Record = namedtuple('Record', 'entry endpoint status seconds')
+
+
+class ReplayResults(object):
+    '''Records of replayed requests and total wall time.'''
+
+    def __init__(self, records, elapsed):
+        self.records = records
+        self.elapsed = elapsed
+
+    def by_endpoint(self):
+        '''Returns a list of dicts with latency statistics of endpoints,
+        slowest first.'''
+        groups = {}
+        for record in self.records:
+            groups.setdefault(record.endpoint, []).append(record.seconds)
+        stats = []
+        for endpoint, values in groups.items():
+            values.sort()
+            stats.append({'endpoint': endpoint,
+                          'count': len(values),
+                          'p50': _percentile(values, 50),
+                          'p90': _percentile(values, 90),
+                          'p99': _percentile(values, 99),
+                          'max': values[-1]})
+        stats.sort(key=lambda x: -x['p90'])
+        return stats
+
+    def slowest(self, count=10):
+        '''Returns records of `count` slowest requests.'''
+        return sorted(self.records, key=lambda x: -x.seconds)[:count]
+
+    def report(self, slowest=10):
+        '''Returns text report with percentiles of endpoints and slowest
+        urls, times are in milliseconds.'''
+        lines = ['%d requests in %.3fs, %.1f requests/s' % (
+                    len(self.records), self.elapsed,
+                    len(self.records) / self.elapsed if self.elapsed else 0)]
+        lines.append('%-40s %7s %9s %9s %9s %9s' % (
+                        'endpoint', 'count', 'p50', 'p90', 'p99', 'max'))
+        for item in self.by_endpoint():
+            lines.append('%-40s %7d %9.2f %9.2f %9.2f %9.2f' % (
+                            item['endpoint'] or '-', item['count'],
+                            item['p50'] * 1000, item['p90'] * 1000,
+                            item['p99'] * 1000, item['max'] * 1000))
+        lines.append('Slowest requests:')
+        for record in self.slowest(slowest):
+            lines.append('%9.2f %d %s %s' % (
+                            record.seconds * 1000, record.status,
+                            record.entry.method, _url(record.entry)))
+        return '\n'.join(lines)
+
+
+# application of worker processes, inherited by fork
+_process_replay = None
+
+
+def _replay_in_process(entries):
+    return [_process_replay.request(entry) for entry in entries]
+
+
+class Replay(object):
+    '''
+    Replays log entries against WSGI `iktomi.web.Application` by
+    `workers` threads or processes.
+    '''
+
+    # entries sent to a worker process at once
+    chunk_size = 50
+
+    def __init__(self, app, workers=4, processes=False):
+        self.app = app
+        self.workers = workers
+        self.processes = processes
+        # endpoint name is taken from route state of env, which is not
+        # returned by WSGI interface, so requests are run by a copy of the
+        # application with `create_env` hook catching env of the request
+        # in a thread local. The copy shares routes with the application.
+        self._local = threading.local()
+        self._tracking_app = copy.copy(app)
+        self._tracking_app.create_env = self._create_env
+
+    def _create_env(self, request, **kwargs):
+        env = self.app.create_env(request, **kwargs)
+        env._route_state.track_location = True
+        self._local.env = env
+        return env
+
+    def request(self, entry):
+        '''Runs the request of log entry, returns `Record`.'''
+        request = Request.blank(_url(entry), headers=entry.headers,
+                                method=entry.method)
+        environ = request.environ
+        statuses = []
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split(' ', 1)[0]))
+        self._local.env = None
+        started = time.time()
+        app_iter = self._tracking_app(environ, start_response)
+        try:
+            for chunk in app_iter:
+                pass
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+        seconds = time.time() - started
+        env = self._local.env
+        endpoint = env._route_state.location or '' if env is not None else ''
+        return Record(entry, endpoint, statuses[0] if statuses else 0,
+                      seconds)
+
+    def run(self, entries):
+        '''Replays entries, returns `ReplayResults`.'''
+        entries = list(entries)
+        started = time.time()
+        if self.processes:
+            records = self._run_processes(entries)
+        else:
+            records = self._run_threads(entries)
+        return ReplayResults(records, time.time() - started)
+
+    def _run_threads(self, entries):
+        tasks = Queue.Queue()
+        for entry in entries:
+            tasks.put(entry)
+        records = []
+        def work():
+            while True:
+                try:
+                    entry = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+                records.append(self.request(entry))
+        threads = [threading.Thread(target=work)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return records
+
+    def _run_processes(self, entries):
+        global _process_replay
+        _process_replay = self
+        chunks = [entries[i:i + self.chunk_size]
+                  for i in range(0, len(entries), self.chunk_size)]
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            results = pool.map(_replay_in_process, chunks)
+        finally:
+            pool.terminate()
+            _process_replay = None
+        return sum(results, [])
+
+    def profile(self, records, directory):
+        '''Replays requests of records once more under `cProfile` and
+        saves the stats to `directory`, returns a list of file names.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        filenames = []
+        for i, record in enumerate(records):
+            profile = cProfile.Profile()
+            profile.runcall(self.request, record.entry)
+            filename = os.path.join(directory, '%02d-%s.prof' % (
+                            i, record.endpoint or 'none'))
+            profile.dump_stats(filename)
+            filenames.append(filename)
+        return filenames
+
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['StreamingResponse', 'is_streaming', 'body_in_memory']
+
+from webob import Response
+
+
+class StreamingResponse(Response):
+    '''
+    Response with body produced by an iterable, so the first chunks are
+    sent to the client before the last ones are produced::
+
+        def export(env, data):
+            def rows():
+                for item in env.db.query(Item).yield_per(100):
+                    yield u'%s\\t%s\\n' % (item.id, item.title)
+            return web.StreamingResponse(rows(), content_type='text/plain')
+
+    Unicode chunks are encoded with response charset. Content length is
+    unknown. Filters should not read `body` of such response, because it
+    reads the whole iterable into memory, use `is_streaming` to check it.
+    '''
+
+    def __init__(self, app_iter, **kwargs):
+        Response.__init__(self, **kwargs)
+        self.app_iter = _EncodedIter(app_iter, self.charset or 'utf-8')
+
+
+class _EncodedIter(object):
+
+    def __init__(self, chunks, charset):
+        self.chunks = chunks
+        self.charset = charset
+        self._iter = iter(chunks)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        chunk = next(self._iter)
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(self.charset)
+        return chunk
+
+    def close(self):
+        # allows generators to clean up
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def is_streaming(response):
+    '''Returns True if body of the response is produced by an iterator.'''
+    return isinstance(response, StreamingResponse)
+
+
+def body_in_memory(response):
+    '''
+    Returns True if body of the response is kept in memory, so reading
+    `body` is cheap. It is not for streaming responses and responses
+    sending files, like ones of `static_files(production=True)`, which
+    can be sent by the server with `sendfile`.'''
+    return isinstance(response.app_iter, (list, tuple))
@@ -3,7 +3,7 @@
 __all__ = ['Reverse', 'UrlBuildingError']
 
 from .url import URL
-from .url_templates import UrlBuildingError
+from .url_templates import UrlTemplate, UrlBuildingError
 from ..utils import cached_property
 
 
@@ -23,11 +23,24 @@ class Location(object):
                 return True
         return False
 
-    def build_path(self, reverse, **kwargs):
-        result = []
+    @cached_property
+    def _parts(self):
+        # all builders' parts with adjacent static parts joined
+        parts = []
         for b in self.builders:
-            result.append(b(**kwargs))
-        return ''.join(result)
+            for part in b._builder_params:
+                if not isinstance(part, tuple) and parts and \
+                        not isinstance(parts[-1], tuple):
+                    parts[-1] += part
+                else:
+                    parts.append(part)
+        return parts
+
+    def build_path(self, reverse, **kwargs):
+        parts = self._parts
+        if len(parts) == 1 and not isinstance(parts[0], tuple):
+            return parts[0]
+        return UrlTemplate.build_parts(parts, kwargs)
 
     def build_subdomians(self, reverse):
         subdomains = [getattr(x, 'primary', x) 
@@ -48,6 +61,12 @@ class Location(object):
 
 
 
+def _compile_locations(scope):
+    for location, nested_scope in scope.values():
+        location._parts
+        _compile_locations(nested_scope)
+
+
 class Reverse(object):
     '''
     Object incapsulating reverse url map and methods needed to build urls
@@ -57,7 +76,7 @@ class Reverse(object):
     '''
     def __init__(self, scope, location=None, path='', host='', ready=False, 
                  need_arguments=False, bound_env=None, parent=None,
-                 finalize_params=None):
+                 finalize_params=None, cache=None, cache_key=None):
         # location is stuff containing builders for current reverse step
         # (builds url part for particular namespace or endpoint)
         self._location = location
@@ -73,6 +92,16 @@ class Reverse(object):
         self._bound_env = bound_env
         self._parent = parent
         self._finalize_params = finalize_params or {}
+        # Unbound subreverses built without arguments are shared between all
+        # reverses of the application by their dotted names. `cache_key` is
+        # the dotted name of the reverse or None if it is not cacheable.
+        self._cache = cache if cache is not None else {}
+        self._cache_key = cache_key
+
+    def _subkey(self, name):
+        if self._cache_key:
+            return self._cache_key + '.' + name
+        return name
 
     def _attach_subdomain(self, host, location):
         subdomain = location.build_subdomians(self)
@@ -101,7 +130,8 @@ class Reverse(object):
                                   bound_env=self._bound_env, 
                                   ready=self._is_endpoint,
                                   parent=self._parent,
-                                  finalize_params=finalize_params)
+                                  finalize_params=finalize_params,
+                                  cache=self._cache)
         raise UrlBuildingError('Not an endpoint {}'.format(repr(self)))
 
     def __getattr__(self, name):
@@ -114,6 +144,14 @@ class Reverse(object):
         if self._is_scope and name in self._scope:
             if self._need_arguments:
                 return getattr(self(), name)
+            cache_key = None
+            if self._cache_key is not None:
+                cache_key = self._subkey(name)
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    if self._bound_env is None:
+                        return cached
+                    return cached.bind_to_env(self._bound_env)
             location, scope = self._scope[name]
             path = self._path
             host = self._host
@@ -121,10 +159,18 @@ class Reverse(object):
             if ready:
                 path += location.build_path(self)
                 host = self._attach_subdomain(host, location)
-            return self.__class__(scope, location, path, host, ready,
-                                  bound_env=self._bound_env,
-                                  parent=self,
-                                  need_arguments=location.need_arguments)
+            # cached subreverse must not keep a reference to bound env
+            parent = self if self._bound_env is None else self.bind_to_env(None)
+            subreverse = self.__class__(scope, location, path, host, ready,
+                                        parent=parent,
+                                        need_arguments=location.need_arguments,
+                                        cache=self._cache,
+                                        cache_key=cache_key)
+            if cache_key is not None:
+                self._cache[cache_key] = subreverse
+            if self._bound_env is None:
+                return subreverse
+            return subreverse.bind_to_env(self._bound_env)
         raise UrlBuildingError('Namespace or endpoint "%s" does not exist'
                                ' in "%r"' % (name, self))
 
@@ -141,7 +187,8 @@ class Reverse(object):
         return self.__class__({}, self._location, path=path, host=host,
                               bound_env=self._bound_env, 
                               parent=self._parent,
-                              ready=self._is_endpoint)
+                              ready=self._is_endpoint,
+                              cache=self._cache)
 
 
     @cached_property
@@ -155,6 +202,13 @@ class Reverse(object):
         return args
 
     def _build_url_silent(self, _name, **kwargs):
+        if not kwargs and self._cache_key is not None:
+            # parameterless endpoint, no need to walk through namespaces
+            subreverse = self._cache.get(self._subkey(_name))
+            if subreverse is not None and subreverse._ready:
+                if self._bound_env is not None:
+                    subreverse = subreverse.bind_to_env(self._bound_env)
+                return set(), subreverse
         subreverse = self
         used_args = set()
         for part in _name.split('.'):
@@ -247,6 +301,19 @@ class Reverse(object):
         '''URLencoded representation of the URL'''
         return str(self.as_url)
 
+    def warm(self):
+        '''
+        Compiles builders of all locations and caches all subreverses not
+        needing arguments.
+        '''
+        for name, (location, scope) in self._scope.items():
+            location._parts
+            if name and self._cache_key is not None and \
+                    not self._need_arguments:
+                getattr(self, name).warm()
+            else:
+                _compile_locations(scope)
+
     @classmethod
     def from_handler(cls, handler):
         '''
@@ -255,7 +322,7 @@ class Reverse(object):
             app = web.cases(..)
             Reverse.from_handler(app)
         '''
-        return cls(handler._locations())
+        return cls(handler._locations(), cache={}, cache_key='')
 
     def bind_to_env(self, bound_env):
         '''
@@ -271,7 +338,9 @@ class Reverse(object):
                               need_arguments=self._need_arguments,
                               finalize_params=self._finalize_params,
                               parent=self._parent,
-                              bound_env=bound_env)
+                              bound_env=bound_env,
+                              cache=self._cache,
+                              cache_key=self._cache_key)
 
     def __repr__(self):
         return '{}(path=\'{}\', host=\'{}\')'.format(
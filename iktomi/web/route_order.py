@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+'''
+Build step making `web.cases` probe their most requested branches first.
+
+Branches of `cases` are tried one by one in the order they are declared.
+Branches with non-overlapping static prefixes (see
+`WebHandler._static_prefix`) can not both match the same path, so they
+can be tried in any order. Consecutive runs of such branches are reordered
+by the number of hits they got::
+
+    order = RouteOrder(reorder_every=1000)
+
+    class App(Application):
+        route_order = order
+
+    app = web.cases(
+        web.match('/_routes', 'routes') | order.view,
+        ...
+    )
+    ...
+    order.dump('route-order.json')
+
+The learned order can be frozen for deterministic deploys, the branches
+are not counted then::
+
+    class App(Application):
+        route_order = RouteOrder.load('route-order.json')
+
+`./manage.py app:route_order [route-order.json]` prints the order of
+branches of the application. Compiled `cases` are not reordered, their
+index already skips branches that can not match.
+'''
+
+__all__ = ['RouteOrder', 'AdaptiveCases', 'reorder_cases']
+
+import json
+import threading
+from functools import partial
+
+from webob import Response
+from .core import WebHandler, cases, _call_branch
+
+
+def _branch_prefix(handler):
+    if isinstance(handler, WebHandler):
+        return handler._static_prefix()
+    return '', False
+
+
+def _branch_key(prefix):
+    literal, complete = prefix
+    return literal if complete else literal + '*'
+
+
+def _overlap(a, b):
+    # True if some path can start with both prefixes
+    (a_literal, a_complete), (b_literal, b_complete) = a, b
+    if a_complete and b_complete:
+        return a_literal == b_literal
+    if a_complete:
+        return a_literal.startswith(b_literal)
+    if b_complete:
+        return b_literal.startswith(a_literal)
+    return a_literal.startswith(b_literal) or \
+           b_literal.startswith(a_literal)
+
+
+def _disjoint_runs(handlers):
+    '''
+    Splits handlers into consecutive runs of branches that do not overlap
+    with each other, returns lists of their indices.'''
+    runs = []
+    run = []
+    prefixes = []
+    for i, handler in enumerate(handlers):
+        prefix = _branch_prefix(handler)
+        if any(_overlap(prefix, x) for x in prefixes):
+            runs.append(run)
+            run = []
+            prefixes = []
+        run.append(i)
+        prefixes.append(prefix)
+    if run:
+        runs.append(run)
+    return runs
+
+
+class AdaptiveCases(cases):
+    '''
+    `cases` counting hits of its branches and reordering disjoint
+    branches by them every `order.reorder_every` calls.
+
+    Hits and calls are counted without the lock, so concurrent requests
+    can lose some increments. The counts are approximate, which is
+    enough for the order, and requests do not wait for each other.
+    '''
+
+    def __init__(self, source, order):
+        self.__dict__.update(source.__dict__)
+        self.order = order
+        self._compile()
+
+    def _compile(self):
+        cases._compile(self)
+        self._runs = _disjoint_runs(self.handlers)
+        self._keys = [_branch_key(_branch_prefix(h)) for h in self.handlers]
+        self._hits = [0] * len(self.handlers)
+        self._calls = 0
+        self._lock = threading.Lock()
+        self.frozen = self.order.frozen is not None
+        if self.frozen:
+            self._runs = [self.order._frozen_run(run, self._keys)
+                          for run in self._runs]
+        self._order = sum(self._runs, [])
+
+    def adaptive_cases(self, env, data):
+        handlers = self.handlers
+        result = None
+        for i in self._order:
+            result = _call_branch(handlers[i], env, data)
+            if result is not None:
+                break
+        if not self.frozen:
+            if result is not None:
+                self._hits[i] += 1
+            self._calls += 1
+            if self._calls >= self.order.reorder_every:
+                self.reorder()
+        return result
+    __call__ = adaptive_cases
+
+    def _candidates(self, env):
+        return [self.handlers[i] for i in self._order]
+
+    def reorder(self):
+        '''Sorts disjoint branches by hits. The hits are halved, so the
+        order follows changes of traffic.'''
+        with self._lock:
+            self._calls = 0
+            hits = self._hits
+            runs = [sorted(run, key=lambda i: (-hits[i], i))
+                    for run in self._runs]
+            for i, count in enumerate(hits):
+                hits[i] = count // 2
+            self._runs = runs
+            self._order = sum(runs, [])
+
+    def as_list(self):
+        '''Returns runs of disjoint branches with more than one branch,
+        as lists of `(key, hits)` in current order.'''
+        return [[(self._keys[i], self._hits[i]) for i in run]
+                for run in self._runs if len(run) > 1]
+
+
+class RouteOrder(object):
+    '''
+    Order of disjoint branches of all `cases` of the application, learned
+    or `frozen` (a list of lists of branch keys made by `orders` method).
+    '''
+
+    def __init__(self, reorder_every=1000, frozen=None):
+        self.reorder_every = reorder_every
+        self.frozen = frozen
+        if frozen is not None:
+            self._frozen = dict((frozenset(keys), keys) for keys in frozen)
+        self._cases = []
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        '''Returns frozen order dumped to the file.'''
+        with open(filename) as f:
+            return cls(frozen=json.load(f), **kwargs)
+
+    def _frozen_run(self, run, keys):
+        order = self._frozen.get(frozenset(keys[i] for i in run))
+        if order is None:
+            return run
+        by_key = dict((keys[i], i) for i in run)
+        return [by_key[key] for key in order]
+
+    def adapt(self, handler):
+        adapted = AdaptiveCases(handler, self)
+        self._cases.append(adapted)
+        return adapted
+
+    def orders(self):
+        '''Returns a list of current orders of branch keys.'''
+        return [[key for key, hits in run]
+                for adapted in self._cases
+                for run in adapted.as_list()]
+
+    def dump(self, filename):
+        '''Saves current order to be loaded by `RouteOrder.load`.'''
+        with open(filename, 'w') as f:
+            json.dump(self.orders(), f, indent=2)
+
+    def report(self):
+        '''Returns text report of current order with hits.'''
+        lines = []
+        for adapted in self._cases:
+            for run in adapted.as_list():
+                lines.append(', '.join('%s %d' % x for x in run))
+        return '\n'.join(lines)
+
+    def view(self, env, data):
+        '''Handler returning the report.'''
+        return Response(self.report(), content_type='text/plain')
+
+
+def reorder_cases(handler, order):
+    '''
+    Returns a copy of handlers tree with not compiled `cases` replaced by
+    `AdaptiveCases` of `order`.'''
+    if not isinstance(handler, WebHandler):
+        return handler
+    handler = handler._map_handlers(partial(reorder_cases, order=order))
+    # `cases` already adapted by another order are adapted again
+    if (type(handler) is cases or isinstance(handler, AdaptiveCases)) and \
+            not handler.compiled:
+        return order.adapt(handler)
+    return handler
@@ -7,20 +7,41 @@ logger = logging.getLogger(__name__)
 
 class RouteState(object):
     def __init__(self, request):
-        self._prefixes = []
+        # urlencoded path of the request, never sliced while routing
+        self.full_path = request.path
+        # position in full_path where unmatched part starts
+        self.offset = 0
+        # offsets before each matched prefix
+        self._offsets = []
         # matched subdomain with aliases replaced by their main value
         self.primary_subdomains = []
         self.primary_domain = ''
-        # remaining subdomain part for match
-        self._domain = request.host.split(':', 1)[0].decode('idna')
-        self.subdomain = self._domain
+        # remaining subdomain part for match, see `subdomain` property
+        self._subdomain = None
         self.request = request
+        # location of the endpoint returned the response, it is recorded
+        # only if `track_location` is set, see `core._record_location`
+        self.location = None
+        self.track_location = False
 
     def add_prefix(self, prefix):
-        self._prefixes.append(prefix)
+        self.push_offset(self.offset + len(prefix))
+
+    def push_offset(self, offset):
+        self._offsets.append(self.offset)
+        self.offset = offset
 
     def pop_prefix(self):
-        self._prefixes.pop()
+        self.offset = self._offsets.pop()
+
+    def offset_state(self):
+        '''Returns the state changed by `push_offset`, to be restored by
+        `restore_offset_state` when a branch does not match.'''
+        return self.offset, len(self._offsets)
+
+    def restore_offset_state(self, state):
+        self.offset, count = state
+        del self._offsets[count:]
 
     def add_subdomain(self, subdomain, alias_matched):
         if subdomain:
@@ -29,11 +50,32 @@ class RouteState(object):
         if alias_matched:
             self.subdomain = self.subdomain[:-len(alias_matched)].rstrip('.')
 
+    def subdomain_state(self):
+        '''Returns the state changed by `add_subdomain`, to be restored
+        by `restore_subdomain_state` when a branch does not match.'''
+        return (self._subdomain, self.primary_domain,
+                len(self.primary_subdomains))
+
+    def restore_subdomain_state(self, state):
+        self._subdomain, self.primary_domain, count = state
+        del self.primary_subdomains[:len(self.primary_subdomains) - count]
+
+    @property
+    def subdomain(self):
+        '''Unmatched part of the domain. The host is decoded on first
+        access, so requests not routed by domain do not pay for it.'''
+        if self._subdomain is None:
+            host = self.request.host.split(':', 1)[0]
+            self._subdomain = host.decode('idna')
+        return self._subdomain
+
+    @subdomain.setter
+    def subdomain(self, value):
+        self._subdomain = value
+
     @property
     def path(self):
-        path = self.request.path
-        if self._prefixes:
-            length = sum(map(len, self._prefixes))
-            path = path[length:]
-        return path
+        '''Unmatched part of the path. Creates a new string, so handlers
+        should use `full_path` and `offset` instead.'''
+        return self.full_path[self.offset:]
 
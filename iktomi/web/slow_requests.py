@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+Watchdog logging profiles of slow requests. A background thread takes
+snapshots of Python stack of threads serving requests running longer than
+`threshold` seconds, and when such request finishes, the stacks are logged
+in folded format (one `frame;frame;frame count` line per unique stack,
+accepted by flame graph tools) with request method, URL, endpoint name and
+time spent in database queries and template rendering::
+
+    class App(Application):
+        slow_requests = SlowRequestSampler(threshold=2.0)
+
+    observe_query_time(engine, sampler=App.slow_requests)
+
+Requests faster than `threshold` cost a dict insertion and removal, the
+stacks are not touched unless there is a slow request.
+
+Template render time is recorded by `iktomi.templates.BoundTemplate`,
+query time is recorded by `iktomi.db.sqla.observe_query_time`. Other time
+can be added with `env.slow_requests.observe(kind, seconds)`.
+'''
+
+__all__ = ['SlowRequestSampler']
+
+import os
+import sys
+import time
+import thread
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Request(object):
+
+    __slots__ = ('env', 'thread_id', 'started', 'stacks', 'samples',
+                 'timings')
+
+    def __init__(self, env, thread_id, started):
+        self.env = env
+        self.thread_id = thread_id
+        self.started = started
+        # folded stack -> number of snapshots
+        self.stacks = {}
+        self.samples = 0
+        # kind -> [seconds, count]
+        self.timings = {}
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s:%s:%d' % (frame.f_globals.get('__name__', code.co_filename),
+                         code.co_name, frame.f_lineno)
+
+
+class SlowRequestSampler(object):
+    '''
+    Samples stacks of requests slower than `threshold` seconds every
+    `interval` seconds. Stacks are cut to `max_depth` innermost frames,
+    `max_stacks` most frequent stacks are logged.
+    '''
+
+    def __init__(self, threshold=1.0, interval=0.05, max_depth=40,
+                 max_stacks=20, logger=logger):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.logger = logger
+        # thread id -> _Request
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self, env):
+        '''Starts watching request served by current thread.'''
+        if self._pid != os.getpid():
+            self._start_thread()
+        thread_id = thread.get_ident()
+        request = self._active[thread_id] = \
+                _Request(env, thread_id, time.time())
+        return request
+
+    def finish(self, request):
+        '''Stops watching the request, logs its profile if it is slow.'''
+        self._active.pop(request.thread_id, None)
+        if request.samples:
+            self.logger.warning(self.report(request))
+
+    def observe(self, kind, seconds):
+        '''Adds time spent by request of current thread on `kind` of
+        work, like `'db'`.'''
+        request = self._active.get(thread.get_ident())
+        if request is not None:
+            timing = request.timings.get(kind)
+            if timing is None:
+                timing = request.timings[kind] = [0.0, 0]
+            timing[0] += seconds
+            timing[1] += 1
+
+    def _start_thread(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # threads do not survive fork, so a new one is started by
+            # each worker process
+            self._pid = os.getpid()
+            self._active = {}
+            watchdog = threading.Thread(target=self._run,
+                                        name='SlowRequestSampler')
+            watchdog.daemon = True
+            watchdog.start()
+
+    def _run(self, sleep=time.sleep, error=Exception):
+        # names are bound at definition, as builtins and module globals
+        # are cleared on interpreter shutdown while the thread still runs
+        while True:
+            sleep(self.interval)
+            try:
+                self.sample()
+            except error:
+                if sys is None:
+                    # module globals are cleared on interpreter shutdown
+                    return
+                self.logger.exception('Failed to sample slow requests')
+
+    def sample(self, now=None):
+        '''Takes stack snapshots of slow requests, called by the watchdog
+        thread.'''
+        if now is None:
+            now = time.time()
+        deadline = now - self.threshold
+        slow = [request for request in self._active.values()
+                if request.started <= deadline]
+        if not slow:
+            return
+        frames = sys._current_frames()
+        for request in slow:
+            frame = frames.get(request.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            request.stacks[stack] = request.stacks.get(stack, 0) + 1
+            request.samples += 1
+
+    def report(self, request):
+        '''Returns text report of the request profile.'''
+        env = request.env
+        lines = ['Slow request %s %s (%s) took %.3fs' % (
+                    env.request.method, env.request.url,
+                    env._route_state.location or '-',
+                    time.time() - request.started)]
+        for kind, (seconds, count) in sorted(request.timings.items()):
+            lines.append('  %s: %.3fs in %d calls' % (kind, seconds, count))
+        lines.append('  %d stack samples taken every %.3fs:' % (
+                        request.samples, self.interval))
+        stacks = sorted(request.stacks.items(), key=lambda x: -x[1])
+        for stack, count in stacks[:self.max_stacks]:
+            lines.append('%s %d' % (stack, count))
+        return '\n'.join(lines)
@@ -11,15 +11,23 @@ from ..utils.storage import VersionedStorage
 def ask(handler, url, method=None, data=None,
         headers=None, additional_env=None, additional_data=None,
         env_class=None):
+    storage_class = VersionedStorage
     if isinstance(handler, Application):
         env_class = env_class or handler.env_class
+        storage_class = handler.storage_class
         handler = handler.handler
 
     env_class = env_class or AppEnvironment
     root = Reverse.from_handler(handler)
     rq_kw = dict(method=method.upper()) if method else {}
     request = Request.blank(url, POST=data, headers=headers, **rq_kw)
-    env = VersionedStorage(env_class, request, root, **(additional_env or {}))
+    env = storage_class(env_class, request, root, **(additional_env or {}))
     #TODO: may be later process cookies separatly
-    data = VersionedStorage(**(additional_data or {}))
-    return handler(env, data)
+    data = storage_class(**(additional_data or {}))
+    result = handler(env, data)
+    # run tasks deferred with env.defer() at once to check their results
+    deferred = getattr(env, '_deferred', None)
+    while deferred:
+        func, args, kwargs = deferred.pop(0)
+        func(*args, **kwargs)
+    return result
@@ -1,17 +1,39 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['URL']
+__all__ = ['URL', 'LazyURL', 'SharedQuery']
 
 import urllib
 from urlparse import urlparse, parse_qs
 from webob.multidict import MultiDict
 from .url_templates import urlquote
+from ..utils import cached_property
 
 
-def construct_url(path, query, host, port, schema):
-    query = ('?' + '&'.join(['%s=%s' % (urlquote(k), urlquote(v)) \
-                            for k,v in query.iteritems()])  \
-             if query else '')
+def quote_pair(key, value):
+    return '%s=%s' % (urlquote(key), urlquote(value))
+
+
+def encode_query(query, encoded_pairs=None):
+    '''
+    Returns urlencoded query string for MultiDict. Already encoded
+    `key=value` strings can be provided by `encoded_pairs` dict with
+    `(key, type(value), value)` keys. The type is a part of the key, as
+    equal values like `True` and `1` are encoded differently.
+    '''
+    if not encoded_pairs:
+        return '&'.join([quote_pair(k, v) for k, v in query.iteritems()])
+    pairs = []
+    for k, v in query.iteritems():
+        try:
+            pair = encoded_pairs.get((k, type(v), v))
+        except TypeError: # unhashable value
+            pair = None
+        pairs.append(pair or quote_pair(k, v))
+    return '&'.join(pairs)
+
+
+def construct_url(path, query, host, port, schema, encoded_pairs=None):
+    query = ('?' + encode_query(query, encoded_pairs) if query else '')
 
     path = path
     if host:
@@ -22,18 +44,78 @@ def construct_url(path, query, host, port, schema):
         return path + query
 
 
+def query_set(query, *args, **kwargs):
+    '''Set values in MultiDict in place'''
+    if args and kwargs:
+        raise TypeError('Use positional args or keyword args not both')
+    if args:
+        mdict = MultiDict(args[0])
+        for k in mdict.keys():
+            if k in query:
+                del query[k]
+        for k, v in mdict.items():
+            query.add(k, v)
+    else:
+        for k, v in kwargs.items():
+            query[k] = v
+
+
+def query_add(query, *args, **kwargs):
+    '''Add values to MultiDict in place'''
+    if args:
+        mdict = MultiDict(args[0])
+        for k, v in mdict.items():
+            query.add(k, v)
+    for k, v in kwargs.items():
+        query.add(k, v)
+
+
+def query_delete(query, key):
+    '''Delete value from MultiDict in place'''
+    try:
+        del query[key]
+    except KeyError:
+        pass
+
+
+class SharedQuery(MultiDict):
+    '''
+    MultiDict of query parameters shared by many URLs, for example, filter
+    values added to each link in a list. Encoded form of its parameters is
+    computed once and reused by `LazyURL`::
+
+        filters = SharedQuery(filter_data)
+        for item in items:
+            url = env.root.item(id=item.id).as_url.lazy().qs_set(filters)
+    '''
+
+    @cached_property
+    def encoded_pairs(self):
+        pairs = {}
+        for k, v in self.iteritems():
+            try:
+                pairs[(k, type(v), v)] = quote_pair(k, v)
+            except TypeError: # unhashable value
+                pass
+        return pairs
+
+
 class URL(str):
 
-    def __new__(cls, path, query=None, host=None, port=None, schema=None, show_host=True):
+    def __new__(cls, path, query=None, host=None, port=None, schema=None,
+                show_host=True, encoded_pairs=None):
         '''
         path - urlencoded string or unicode object (not encoded at all)
+        encoded_pairs - see `encode_query`
         '''
         path = path if isinstance(path, str) else urlquote(path)
         query = MultiDict(query) if query else MultiDict()
         host = host or ''
         port = port or ''
         schema = schema or 'http'
-        self = str.__new__(cls, construct_url(path, query, host if show_host else '', port,schema))
+        self = str.__new__(cls, construct_url(path, query,
+                                              host if show_host else '',
+                                              port, schema, encoded_pairs))
         self.path = path
         self.query = query
         self.host = host
@@ -66,30 +148,14 @@ class URL(str):
 
     def qs_set(self, *args, **kwargs):
         '''Set values in QuerySet MultiDict'''
-        if args and kwargs:
-            raise TypeError('Use positional args or keyword args not both')
         query = self.query.copy()
-        if args:
-            mdict = MultiDict(args[0])
-            for k in mdict.keys():
-                if k in query:
-                    del query[k]
-            for k, v in mdict.items():
-                query.add(k, v)
-        else:
-            for k, v in kwargs.items():
-                query[k] = v
+        query_set(query, *args, **kwargs)
         return self._copy(query=query)
 
     def qs_add(self, *args, **kwargs):
         '''Add value to QuerySet MultiDict'''
         query = self.query.copy()
-        if args:
-            mdict = MultiDict(args[0])
-            for k, v in mdict.items():
-                query.add(k, v)
-        for k, v in kwargs.items():
-            query.add(k, v)
+        query_add(query, *args, **kwargs)
         return self._copy(query=query)
 
     def with_host(self):
@@ -99,12 +165,15 @@ class URL(str):
     def qs_delete(self, key):
         '''Delete value from QuerySet MultiDict'''
         query = self.query.copy()
-        try:
-            del query[key]
-        except KeyError:
-            pass
+        query_delete(query, key)
         return self._copy(query=query)
 
+    def lazy(self):
+        '''
+        Returns `LazyURL` builder accumulating query changes and
+        constructing URL string only once'''
+        return LazyURL(self)
+
     def qs_get(self, key, default=None):
         '''Get a value from QuerySet MultiDict'''
         return self.query.get(key, default=default)
@@ -123,3 +192,82 @@ class URL(str):
 
     def __repr__(self):
         return '<URL %r>' % str.__repr__(self)
+
+
+class LazyURL(object):
+    '''
+    URL builder with the same query changing methods as `URL` has. The
+    changes are accumulated and applied at once, and the URL string is
+    constructed on first conversion to string or `as_url` access::
+
+        url = URL('/items').lazy().qs_set(filters).qs_set(page=2)
+        str(url)
+    '''
+
+    def __init__(self, url, changes=()):
+        self.url = url
+        self._changes = changes
+
+    def _change(self, func, *args, **kwargs):
+        return self.__class__(self.url,
+                              self._changes + ((func, args, kwargs),))
+
+    def qs_set(self, *args, **kwargs):
+        '''Set values in QuerySet MultiDict'''
+        if args and kwargs:
+            raise TypeError('Use positional args or keyword args not both')
+        return self._change(query_set, *args, **kwargs)
+
+    def qs_add(self, *args, **kwargs):
+        '''Add value to QuerySet MultiDict'''
+        return self._change(query_add, *args, **kwargs)
+
+    def qs_delete(self, key):
+        '''Delete value from QuerySet MultiDict'''
+        return self._change(query_delete, key)
+
+    def with_host(self):
+        '''Force show_host parameter'''
+        return self._change(None)
+
+    @cached_property
+    def as_url(self):
+        '''`URL` object with all changes applied'''
+        url = self.url
+        query = url.query.copy()
+        show_host = url.show_host
+        encoded_pairs = {}
+        for func, args, kwargs in self._changes:
+            if func is None: # with_host
+                show_host = True
+                continue
+            for arg in args:
+                if isinstance(arg, SharedQuery):
+                    encoded_pairs.update(arg.encoded_pairs)
+            func(query, *args, **kwargs)
+        return url.__class__(url.path, query=query, host=url.host,
+                             port=url.port, schema=url.schema,
+                             show_host=show_host,
+                             encoded_pairs=encoded_pairs)
+
+    def qs_get(self, key, default=None):
+        '''Get a value from QuerySet MultiDict'''
+        return self.as_url.qs_get(key, default=default)
+
+    def get_readable(self):
+        return self.as_url.get_readable()
+
+    def __str__(self):
+        return str(self.as_url)
+
+    def __unicode__(self):
+        return unicode(str(self.as_url))
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<LazyURL %r>' % str(self)
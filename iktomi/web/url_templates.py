@@ -2,6 +2,7 @@
 
 import urllib
 import re
+import time
 import logging
 from .url_converters import default_converters, ConvertError
 
@@ -44,7 +45,9 @@ def construct_re(url_template, match_whole_str=False, converters=None,
     builder_params = []
     # found url params and their converters
     url_params = {}
-    result = r'^'
+    # no "^" anchor: pattern is always used with match() which is anchored
+    # anyway, and "^" does not match at non-zero position
+    result = r''
     parts = _split_pattern.split(url_template)
     for i, part in enumerate(parts):
         is_url_pattern = _static_url_pattern.match(part)
@@ -74,12 +77,60 @@ def construct_re(url_template, match_whole_str=False, converters=None,
     return re.compile(result), url_params, builder_params
 
 
+# Process-wide caches of constructed patterns and converters. Applications
+# have many identical templates (like '/' or '/<int:id>') and converters,
+# and all of them are built once when the application is imported in the
+# master process before forking workers.
+_patterns_cache = {}
+_converters_cache = {}
+_cache_stats = {'hits': 0, 'misses': 0, 'time': 0.0}
+
+
+def cached_construct_re(url_template, match_whole_str=False, converters=None,
+                        default_converter='string'):
+    '''
+    Same as `construct_re`, but returns the same objects for identical
+    arguments. Returned objects are shared and must not be changed.
+    '''
+    key = (url_template, match_whole_str, default_converter,
+           tuple(sorted((converters or {}).items())))
+    result = _patterns_cache.get(key)
+    if result is not None:
+        _cache_stats['hits'] += 1
+        return result
+    started = time.time()
+    result = _patterns_cache[key] = construct_re(
+            url_template, match_whole_str=match_whole_str,
+            converters=converters, default_converter=default_converter)
+    _cache_stats['misses'] += 1
+    _cache_stats['time'] += time.time() - started
+    return result
+
+
+def template_cache_info():
+    '''
+    Returns a dict with number of cache `hits` and `misses` of url templates
+    patterns and total `time` spent to construct them.
+    '''
+    return dict(_cache_stats, size=len(_patterns_cache))
+
+
+def clear_template_cache():
+    _patterns_cache.clear()
+    _converters_cache.clear()
+    _cache_stats.update(hits=0, misses=0, time=0.0)
+
+
 def init_converter(conv_class, args):
     if args:
-        #XXX: taken from werkzeug
-        storage = type('_Storage', (), {'__getitem__': lambda s, x: x})()
-        args, kwargs = eval(u'(lambda *a, **kw: (a, kw))(%s)' % args, {}, storage)
-        return conv_class(*args, **kwargs)
+        key = (conv_class, args)
+        conv_object = _converters_cache.get(key)
+        if conv_object is None:
+            #XXX: taken from werkzeug
+            storage = type('_Storage', (), {'__getitem__': lambda s, x: x})()
+            args, kwargs = eval(u'(lambda *a, **kw: (a, kw))(%s)' % args, {}, storage)
+            conv_object = _converters_cache[key] = conv_class(*args, **kwargs)
+        return conv_object
     return conv_class()
 
 
@@ -91,38 +142,90 @@ class UrlTemplate(object):
         self.match_whole_str = match_whole_str
         self._allowed_converters = self._init_converters(converters)
         self._pattern, self._url_params, self._builder_params = \
-            construct_re(template,
-                         match_whole_str=match_whole_str,
-                         converters=self._allowed_converters,
-                         default_converter=default_converter)
+            cached_construct_re(template,
+                                match_whole_str=match_whole_str,
+                                converters=self._allowed_converters,
+                                default_converter=default_converter)
+        # urlencoded literal part every matching path starts with
+        self.static_prefix = ''
+        for part in self._builder_params:
+            if isinstance(part, tuple):
+                break
+            self.static_prefix += part
+        # template without converters matching the whole path
+        self.is_static = match_whole_str and not self._url_params
 
-    def match(self, path, **kw):
+    def match(self, path, pos=0, **kw):
         '''
         path - str (urlencoded)
+        pos - position in the path to start matching from
         '''
-        m = self._pattern.match(path)
+        end, kwargs = self.match_to(path, pos, **kw)
+        if end is None:
+            return None, {}
+        return path[pos:end], kwargs
+
+    def match_to(self, path, pos=0, **kw):
+        '''
+        Same as `match`, but returns end position of matched part of the path
+        instead of the part itself, so no new strings are created.
+        '''
+        m = self._pattern.match(path, pos)
         if m:
-            kwargs = m.groupdict()
-            # convert params
-            for url_arg_name, value_urlencoded in kwargs.items():
-                conv_obj = self._url_params[url_arg_name]
-                unicode_value = urllib.unquote(value_urlencoded).decode('utf-8', 'replace')
-                try:
-                    kwargs[url_arg_name] = conv_obj.to_python(unicode_value, **kw)
-                except ConvertError, err:
-                    logger.debug('ConvertError in parameter "%s" '
-                                 'by %r, value "%s"',
-                                 url_arg_name,
-                                 err.converter.__class__,
-                                 err.value)
-                    return None, {}
-            return m.group(), kwargs
+            kwargs = self.convert(m.groupdict(), **kw)
+            if kwargs is not None:
+                return m.end(), kwargs
         return None, {}
 
-    def __call__(self, **kwargs):
-        'Url building with url params values taken from kwargs. (reverse)'
+    def convert(self, kwargs, **kw):
+        '''
+        Converts dict of urlencoded url params to python values in place.
+        Returns None if any value is not accepted by it's converter.
+        '''
+        for url_arg_name, value_urlencoded in kwargs.items():
+            conv_obj = self._url_params[url_arg_name]
+            unicode_value = urllib.unquote(value_urlencoded).decode('utf-8', 'replace')
+            try:
+                kwargs[url_arg_name] = conv_obj.to_python(unicode_value, **kw)
+            except ConvertError, err:
+                logger.debug('ConvertError in parameter "%s" '
+                             'by %r, value "%s"',
+                             url_arg_name,
+                             err.converter.__class__,
+                             err.value)
+                return None
+        return kwargs
+
+    def regex(self, group_prefix=''):
+        '''
+        Returns source of the pattern with url params groups names prefixed by `group_prefix`. Used to combine
+        several templates into one pattern.
+        '''
         result = ''
         for part in self._builder_params:
+            if isinstance(part, tuple):
+                var, conv_obj = part
+                result += '(?P<%s%s>%s)' % (group_prefix, var, conv_obj.regex)
+            else:
+                result += re.escape(part)
+        if self.match_whole_str:
+            result += '$'
+        return result
+
+    def __call__(self, **kwargs):
+        'Url building with url params values taken from kwargs. (reverse)'
+        return self.build_parts(self._builder_params, kwargs)
+
+    @staticmethod
+    def build_parts(parts, kwargs):
+        '''
+        Builds urlencoded str from parts like `_builder_params`: static
+        strings and `(name, converter)` tuples, with url params values
+        taken from `kwargs` dict. Used by `Location` to build the path of
+        several templates at once.
+        '''
+        result = []
+        for part in parts:
             if isinstance(part, tuple):
                 var, conv_obj = part
                 try:
@@ -133,11 +236,9 @@ class UrlTemplate(object):
                     else:
                         raise UrlBuildingError('Missing argument for '
                                                'URL builder: %s' % var)
-                result += urlquote(conv_obj.to_url(value))
-            else:
-                result += part
-        # result - urlencoded str
-        return result
+                part = urlquote(conv_obj.to_url(value))
+            result.append(part)
+        return ''.join(result)
 
     def _init_converters(self, converters):
         convs = default_converters.copy()
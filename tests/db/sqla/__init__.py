@@ -1,8 +1,9 @@
 import unittest
 from sqlalchemy.exc import UnboundExecutionError
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import func
-from iktomi.db.sqla import multidb_binds
+from sqlalchemy import func, create_engine
+from iktomi.db.sqla import multidb_binds, observe_query_time
+from iktomi.web.metrics import MetricsRegistry
 from . import multidb_models
 from .multidb_models import db1, db2
 
@@ -45,3 +46,15 @@ class MultidbTest(unittest.TestCase):
             self.db.query(func.max(db1.SameName.id)).all()
         except UnboundExecutionError as exc:
             self.fail('Unexpected exception: {}'.format(exc))
+
+
+class ObserveQueryTimeTest(unittest.TestCase):
+
+    def test_observe(self):
+        metrics = MetricsRegistry()
+        engine = create_engine('sqlite://')
+        observe_query_time(engine, metrics)
+        engine.execute('select 1')
+        engine.execute('select 2')
+        values = metrics.collect()
+        self.assertEqual(values[('iktomi_db_query_seconds', 'count', ())], 2)
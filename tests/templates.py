@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['TemplateStreamTests']
+
+import os
+import shutil
+import tempfile
+import unittest
+from iktomi import web
+from iktomi.templates import Template, BoundTemplate
+from iktomi.templates.jinja2 import TemplateEngine
+from iktomi.utils.storage import VersionedStorage
+from iktomi.web.metrics import MetricsRegistry
+
+
+class TextEngine(object):
+    # engine without `stream` method
+
+    def render(self, template_name, **kw):
+        return u'%s: %s' % (template_name, kw['title'])
+
+
+class TemplateStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'page.html'), 'w') as f:
+            f.write('<h1>{{ title }}</h1>'
+                    '{% for item in items %}<p>{{ item }}</p>{% endfor %}')
+        with open(os.path.join(self.dir, 'page.txt'), 'w') as f:
+            f.write('')
+        self.metrics = MetricsRegistry()
+        self.env = VersionedStorage(metrics=self.metrics)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def bound(self, **engines):
+        return BoundTemplate(self.env, Template(self.dir, engines=engines))
+
+    def render_count(self):
+        return self.metrics.collect().get(
+                ('iktomi_template_render_seconds', 'count', ()), 0)
+
+    def test_stream_to_response(self):
+        engine = TemplateEngine([self.dir])
+        engine.stream_buffer_size = 2
+        bound = self.bound(html=engine)
+        data = {'title': u'Заголовок', 'items': [u'один', u'два', u'три']}
+        response = bound.stream_to_response('page', data)
+        self.assert_(web.is_streaming(response))
+        self.assertEqual(response.content_type, 'text/html')
+        # nothing is rendered before the body is read
+        self.assertEqual(self.render_count(), 0)
+        chunks = list(response.app_iter)
+        self.assert_(len(chunks) > 1)
+        self.assert_(all(isinstance(chunk, str) for chunk in chunks))
+        self.assertEqual(''.join(chunks),
+                         bound.render('page', data).encode('utf-8'))
+        # both stream and render are observed
+        self.assertEqual(self.render_count(), 2)
+
+    def test_stream_closed(self):
+        bound = self.bound(html=TemplateEngine([self.dir]))
+        parts = bound.stream('page', title=u'x', items=range(100))
+        next(parts)
+        parts.close()
+        self.assertEqual(self.render_count(), 1)
+
+    def test_engine_without_stream(self):
+        bound = self.bound(txt=TextEngine())
+        response = bound.stream_to_response('page', {'title': u'ж'},
+                                            content_type='text/plain')
+        self.assertEqual(list(response.app_iter),
+                         [u'page.txt: ж'.encode('utf-8')])
+        self.assertEqual(self.render_count(), 1)
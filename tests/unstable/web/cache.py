@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['CacheManagerTests']
+
+import zlib
+import unittest
+from iktomi import web
+from iktomi.storage import LocalMemStorage
+from iktomi.unstable.web.cache import CacheManager
+
+
+class CacheManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        def view(env, data):
+            self.calls.append(env.request.url)
+            return web.Response('content ' * 100)
+        self.storage = LocalMemStorage()
+        self.app = CacheManager(self.storage, 60, {}) | web.gzip() | view
+
+    def get(self, **headers):
+        return web.ask(self.app, '/', headers=headers)
+
+    def test_cache(self):
+        self.assertEqual(self.get().body, 'content ' * 100)
+        self.assertEqual(self.get().body, 'content ' * 100)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_gzip_variant(self):
+        response = self.get(Accept_Encoding='gzip')
+        self.assertEqual(response.content_encoding, 'gzip')
+        body = response.body
+        self.assertEqual(zlib.decompress(body, 16 + zlib.MAX_WBITS),
+                         'content ' * 100)
+        self.assertEqual(len(self.calls), 1)
+
+        # compressed body is served from cache
+        response = self.get(Accept_Encoding='gzip')
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertEqual(response.vary, ('Accept-Encoding',))
+        self.assertEqual(response.body, body)
+        self.assertEqual(len(self.calls), 1)
+
+        # clients not accepting gzip get uncompressed variant
+        response = self.get()
+        self.assertEqual(response.content_encoding, None)
+        self.assertEqual(response.body, 'content ' * 100)
+        self.assertEqual(len(self.calls), 2)
+        response = self.get()
+        self.assertEqual(response.vary, ('Accept-Encoding',))
+        self.get(Accept_Encoding='gzip')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.storage.storage), 2)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['MultipartTests']
+
+import os
+import shutil
+import tempfile
+import unittest
+from webob import Request
+from webob.exc import HTTPBadRequest, HTTPRequestEntityTooLarge
+from iktomi import web
+from iktomi.forms import Form, Field, convs
+from iktomi.unstable.db.files import FileManager, TransientFile
+from iktomi.unstable.forms.files import FileFieldSet
+from iktomi.unstable.web.multipart import parse_multipart, spool_multipart, \
+                                          SpooledFile
+
+
+class UploadForm(Form):
+
+    fields = [
+        Field('title', conv=convs.Char()),
+        FileFieldSet('file'),
+    ]
+
+
+class MultipartTests(unittest.TestCase):
+
+    def setUp(self):
+        self.transient_root = tempfile.mkdtemp()
+        self.file_manager = FileManager(self.transient_root,
+                                        tempfile.mkdtemp(),
+                                        '/transient/', '/media/')
+
+    def tearDown(self):
+        shutil.rmtree(self.transient_root)
+        shutil.rmtree(self.file_manager.persistent_root)
+
+    def environ(self, post):
+        return Request.blank('/', POST=post,
+                             content_type='multipart/form-data').environ
+
+    def parse(self, post, **kwargs):
+        return parse_multipart(self.environ(post), self.file_manager,
+                               **kwargs)
+
+    def test_parse(self):
+        content = 'file content\r\n--not a boundary\r\n' * 1000
+        post = [('title', u'Заголовок'),
+                ('file', ('photo.jpg', content)),
+                ('empty', ('', '')),
+                ('title', '')]
+        for chunk_size in (7, 64 * 1024):
+            result = self.parse(post, chunk_size=chunk_size)
+            self.assertEqual(result.getall('title'), [u'Заголовок', u''])
+            self.assertEqual(result['empty'], u'')
+            spooled = result['file']
+            self.assert_(isinstance(spooled, SpooledFile))
+            self.assertEqual(spooled.filename, u'photo.jpg')
+            self.assertEqual(spooled.original_name, u'photo.jpg')
+            self.assertEqual(spooled.type, 'image/jpeg')
+            self.assertEqual(spooled.ext, '.jpg')
+            self.assertEqual(os.path.dirname(spooled.path),
+                             self.transient_root)
+            self.assertEqual(spooled.url, '/transient/' + spooled.name)
+            self.assertEqual(spooled.read(), content)
+            spooled.close()
+
+    def test_file_too_large(self):
+        post = [('title', 'x'),
+                ('first', ('a.txt', 'a' * 10)),
+                ('second', ('b.txt', 'b' * 11))]
+        self.assertRaises(HTTPRequestEntityTooLarge, self.parse, post,
+                          max_file_size=10, chunk_size=4)
+        # partially written and previous files are removed
+        self.assertEqual(os.listdir(self.transient_root), [])
+        self.assertEqual(len(self.parse(post, max_file_size=11)), 3)
+
+    def test_text_too_large(self):
+        post = [('title', 'x' * 11)]
+        self.assertRaises(HTTPRequestEntityTooLarge, self.parse, post,
+                          max_text_size=10)
+
+    def test_body_too_large(self):
+        post = [('file', ('a.txt', 'a' * 100))]
+        self.assertRaises(HTTPRequestEntityTooLarge, self.parse, post,
+                          max_body_size=100)
+        environ = self.environ(post)
+        del environ['CONTENT_LENGTH']
+        environ['wsgi.input_terminated'] = True
+        self.assertRaises(HTTPRequestEntityTooLarge, parse_multipart,
+                          environ, self.file_manager, max_body_size=100)
+        self.assertEqual(os.listdir(self.transient_root), [])
+
+    def test_malformed(self):
+        environ = self.environ([('file', ('a.txt', 'content'))])
+        body = environ['wsgi.input'].read()
+        for broken in (body[:-20], body.replace('form-data;', 'x;')):
+            environ = self.environ([('file', ('a.txt', 'content'))])
+            environ['wsgi.input'].seek(0)
+            environ['wsgi.input'].truncate()
+            environ['wsgi.input'].write(broken)
+            environ['wsgi.input'].seek(0)
+            environ['CONTENT_LENGTH'] = str(len(broken))
+            self.assertRaises(HTTPBadRequest, parse_multipart, environ,
+                              self.file_manager)
+        self.assertEqual(os.listdir(self.transient_root), [])
+
+    def test_form(self):
+        results = []
+        def upload(env, data):
+            form = UploadForm(env)
+            results.append((form.accept(env.request.POST), form))
+            return web.Response()
+        app = spool_multipart(max_file_size=100) | upload
+        web.ask(app, '/', data={'title': u'Заголовок',
+                                'file.file': ('a.txt', 'content'),
+                                'file.mode': 'empty'},
+                additional_env={'file_manager': self.file_manager})
+        accepted, form = results[0]
+        self.assert_(accepted, form.errors)
+        self.assertEqual(form.python_data['title'], u'Заголовок')
+        transient = form.python_data['file']
+        self.assert_(isinstance(transient, TransientFile))
+        # the spooled file is used, no copy is made
+        self.assertEqual(os.listdir(self.transient_root), [transient.name])
+        with open(transient.path) as f:
+            self.assertEqual(f.read(), 'content')
+        self.assertRaises(HTTPRequestEntityTooLarge, web.ask, app, '/',
+                          data={'file.file': ('a.txt', 'a' * 101)},
+                          additional_env={'file_manager': self.file_manager})
+
+    def test_files_closed(self):
+        uploads = []
+        def read(env, data):
+            upload = env.request.POST['file']
+            uploads.append(upload)
+            return web.Response(upload.read())
+        app = spool_multipart() | read
+        response = web.ask(app, '/', data={'file': ('a.txt', 'content')},
+                           additional_env={'file_manager': self.file_manager})
+        self.assertEqual(response.body, 'content')
+        self.assert_('file' not in vars(uploads[0]))
+
+    def test_not_multipart(self):
+        def handler(env, data):
+            return web.Response(env.request.POST['title'])
+        app = spool_multipart() | handler
+        response = web.ask(app, '/', data={'title': 'x'},
+                           additional_env={'file_manager': None})
+        self.assertEqual(response.body, 'x')
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['VersionedStorageTests']
+__all__ = ['VersionedStorageTests', 'FlatVersionedStorageTests']
 
 import unittest
 from iktomi.utils.storage import VersionedStorage, StorageFrame, \
-        storage_property, storage_cached_property, storage_method
+        FlatVersionedStorage, storage_property, storage_cached_property, \
+        storage_method
 
 
 class VersionedStorageTests(unittest.TestCase):
@@ -104,3 +105,70 @@ class VersionedStorageTests(unittest.TestCase):
         self.assertRaises(AttributeError, lambda: vs.storage)
         self.assertRaises(AttributeError, vs.method)
 
+
+
+class FlatVersionedStorageTests(unittest.TestCase):
+
+    def test_push_pop(self):
+        'FlatVersionedStorage push/pop'
+        vs = FlatVersionedStorage(a=1)
+        vs._push(b=2)
+        self.assertEqual(vs.as_dict(), {'a': 1, 'b': 2})
+
+        vs._push(c=3, b=4)
+        vs.a = 5
+        self.assertEqual(vs.as_dict(), {'a': 5, 'b': 4, 'c': 3})
+        self.assertEqual((vs.a, vs.b, vs.c), (5, 4, 3))
+
+        vs._pop()
+        self.assertEqual(vs.as_dict(), {'a': 1, 'b': 2})
+        self.assert_(not hasattr(vs, 'c'))
+
+        vs._pop()
+        self.assertEqual(vs.as_dict(), {'a': 1})
+
+    def test_delattr(self):
+        'FlatVersionedStorage delattr deletes value of the current frame'
+        vs = FlatVersionedStorage(a=1)
+        vs._push(a=2, b=3)
+        del vs.a
+        del vs.b
+        self.assertEqual(vs.as_dict(), {'a': 1})
+        self.assertRaises(AttributeError, lambda: delattr(vs, 'a'))
+        vs._pop()
+        self.assertEqual(vs.as_dict(), {'a': 1})
+        del vs.a
+        self.assertEqual(vs.as_dict(), {})
+
+    def test_parent_storage(self):
+        'FlatVersionedStorage chained to another storage'
+        env = FlatVersionedStorage(a=1)
+        vs = FlatVersionedStorage(b=2)
+        vs._storage._parent_storage = env
+        self.assertEqual((vs.a, vs.b), (1, 2))
+        self.assertEqual(vs.as_dict(), {'a': 1, 'b': 2})
+
+    def test_storage_properties(self):
+        class Env(StorageFrame):
+
+            @storage_cached_property
+            def storage_cached(self):
+                return self.value
+
+            @storage_property
+            def storage(self):
+                return self.value
+
+        vs = FlatVersionedStorage(Env)
+        vs._push(value=4)
+        self.assertEqual(vs.storage_cached, 4)
+        self.assertEqual(vs.storage, 4)
+
+        vs._push(value=1)
+        self.assertEqual(vs.storage_cached, 4)
+        self.assertEqual(vs.storage, 1)
+
+        vs._pop()
+        vs._pop()
+        self.assertEqual(vs.storage_cached, 4)
+        self.assertRaises(AttributeError, lambda: vs.storage)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['AsyncApplicationTests']
+
+import threading
+import unittest
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+    from iktomi.web.aio import AsyncApplication, AsyncFilter
+except ImportError:
+    # trollius and futures packages are optional
+    raise unittest.SkipTest('trollius or futures is not installed')
+from webob import Request, Response
+from webob.exc import HTTPForbidden
+from iktomi import web
+from iktomi.web.route_order import RouteOrder
+
+
+@web.request_filter
+@asyncio.coroutine
+def slow(env, data, next_handler):
+    yield From(asyncio.sleep(0.1))
+    data.filter_thread = threading.current_thread()
+    result = yield From(next_handler(env, data))
+    raise Return(result)
+
+
+def endpoint(env, data):
+    return Response('%s %s' % (env.current_location,
+                               getattr(data, 'filter_thread', None) ==
+                                    threading.current_thread()))
+
+
+@web.request_filter
+def sync_filter(env, data, next_handler):
+    return next_handler(env, data)
+
+
+def forbidden(env, data):
+    raise HTTPForbidden()
+
+
+def error(env, data):
+    raise ValueError()
+
+
+class AsyncApplicationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.apps = []
+
+    def tearDown(self):
+        for app in self.apps:
+            app.executor.shutdown(wait=True)
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def app(self, handler=None, **kwargs):
+        handler = handler or web.cases(
+            web.match('/', 'index') | endpoint,
+            web.match('/slow', 'slow') | slow | endpoint,
+            web.match('/nested', 'nested') | sync_filter | slow | endpoint,
+            web.prefix('/news', name='news') | web.cases(
+                web.match('/<int:id>', 'item') | slow | endpoint,
+                compiled=True),
+            web.match('/forbidden', 'forbidden') | forbidden,
+            web.match('/error', 'error') | error,
+        )
+        class App(AsyncApplication):
+            pass
+        for key, value in kwargs.items():
+            setattr(App, key, value)
+        app = App(handler, loop=self.loop)
+        app.handle_error = lambda env: None
+        self.apps.append(app)
+        return app
+
+    def respond(self, app, *urls):
+        tasks = [app.respond(Request.blank(url).environ) for url in urls]
+        return self.loop.run_until_complete(asyncio.gather(*tasks,
+                                                           loop=self.loop))
+
+    def test_sync(self):
+        app = self.app()
+        response, = self.respond(app, '/')
+        self.assertEqual(response.body, 'index False')
+        self.assertEqual(self.respond(app, '/none')[0].status_int, 404)
+        self.assertEqual(self.respond(app, '/forbidden')[0].status_int, 403)
+        self.assertEqual(self.respond(app, '/error')[0].status_int, 500)
+
+    def test_async_filter(self):
+        app = self.app()
+        for url, body in [('/slow', 'slow False'),
+                          ('/news/1', 'news.item False'),
+                          # filter is run on the loop, next handler is
+                          # called by the worker thread
+                          ('/nested', 'nested False')]:
+            response, = self.respond(app, url)
+            self.assertEqual(response.body, body)
+
+    def check_concurrency(self, make_handler, **kwargs):
+        entered = []
+        all_entered = asyncio.Event(loop=self.loop)
+        @web.request_filter
+        @asyncio.coroutine
+        def gate(env, data, next_handler):
+            entered.append(env.request.path)
+            if len(entered) == 5:
+                all_entered.set()
+            # no request goes on until all of them have reached the
+            # filter, so they do not wait for the single worker thread
+            yield From(asyncio.wait_for(all_entered.wait(), 5,
+                                        loop=self.loop))
+            result = yield From(next_handler(env, data))
+            raise Return(result)
+        app = self.app(make_handler(gate | endpoint), max_workers=1,
+                       **kwargs)
+        responses = self.respond(app, *(['/gate'] * 5))
+        self.assertEqual([r.body for r in responses], ['gate False'] * 5)
+        self.assertEqual(len(entered), 5)
+
+    def test_concurrency(self):
+        self.check_concurrency(lambda h: web.match('/gate', 'gate') | h)
+
+    def test_concurrency_choosers(self):
+        # coroutine filters behind any cases are run on the loop
+        self.check_concurrency(lambda h: web.cases(
+            web.match('/', 'index') | endpoint,
+            web.match('/gate', 'gate') | h,
+            compiled=True))
+        self.check_concurrency(lambda h: web.match('/gate', 'gate') |
+                web.by_method({'GET': h}))
+        self.check_concurrency(lambda h: web.by_subdomain(
+            web.subdomain('example.com') | endpoint,
+            web.subdomain('localhost') | web.match('/gate', 'gate') | h))
+        self.check_concurrency(lambda h: web.cases(
+            web.match('/', 'index') | endpoint,
+            web.match('/gate', 'gate') | h),
+            route_order=RouteOrder())
+
+    def test_by_method_fallback(self):
+        app = self.app(web.match('/', 'index') |
+                       web.by_method({'POST': slow | endpoint}))
+        response, = self.respond(app, '/')
+        self.assertEqual(response.status_int, 405)
+        self.assertEqual(response.headers['Allow'], 'POST')
+
+    def test_prepare(self):
+        app = self.app()
+        self.assertEqual(app.root.slow.as_url, '/slow')
+        self.assertEqual(app.root.news.item(id=1).as_url, '/news/1')
+        filters = []
+        def collect(handler):
+            if isinstance(handler, AsyncFilter):
+                filters.append(handler)
+            if isinstance(handler, web.WebHandler):
+                handler._map_handlers(collect)
+            return handler
+        collect(app.handler)
+        self.assertEqual(len(filters), 3)
+
+    def test_wsgi(self):
+        app = self.app()
+        response = Request.blank('/slow').get_response(app)
+        self.assertEqual(response.body, 'slow True')
+        self.assertEqual(web.ask(app, '/nested').body, 'nested True')
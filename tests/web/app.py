@@ -8,7 +8,7 @@ from webob import Response, Request
 from webob.exc import HTTPMethodNotAllowed
 from iktomi import web
 from iktomi.web.app import Application, AppEnvironment
-from iktomi.utils.storage import VersionedStorage
+from iktomi.utils.storage import VersionedStorage, FlatVersionedStorage
 from iktomi.utils import cached_property
 from webtest import TestApp
 
@@ -77,3 +77,126 @@ class ApplicationTests(unittest.TestCase):
         wa = Application(self.app, AppEnv)
         assert wa.env_class == AppEnv
 
+
+    def test_storage_class(self):
+        class FlatApplication(Application):
+            storage_class = FlatVersionedStorage
+        testapp = TestApp(FlatApplication(self.app))
+        self.assertEqual(testapp.get('/').body, 'index')
+        self.assertEqual(testapp.get('/404', status=404).status_int, 404)
+
+    def test_lazy_env(self):
+        for storage_class in (VersionedStorage, FlatVersionedStorage):
+            wa = self.wsgi_app
+            request = Request.blank('/', headers={'Host': 'xn--80a.example.com'})
+            env = storage_class(wa.env_class, request, wa.root)
+            frame = env._storage
+            self.assert_('root' not in vars(frame))
+            self.assertEqual(frame._route_state._subdomain, None)
+            env._push()
+            self.assertEqual(env.root.index.as_url, '/')
+            self.assert_(env.root._bound_env is env)
+            env._pop()
+            # bound root is kept after the frame is popped
+            self.assert_(env.root is frame.root)
+            self.assertEqual(env._route_state.subdomain, u'\u0430.example.com')
+
+    def test_build_times(self):
+        wa = Application(self.app)
+        self.assertEqual(set(wa.build_times), set(['process_templates', 'reverse']))
+        wa.warm()
+        self.assert_('warm' in wa.build_times)
+        self.assert_(wa.root._cache['index'] is wa.root.index)
+        self.assert_('_parts' in vars(wa.root._scope['err500'][0]))
+
+    def test_streaming(self):
+        produced = []
+        def chunks():
+            for chunk in [u'a', 'b', u'ж']:
+                produced.append(chunk)
+                yield chunk
+        def stream(env, data):
+            response = web.StreamingResponse(chunks(),
+                                             content_type='text/plain')
+            # nothing is produced by handlers
+            self.assertEqual(produced, [])
+            return response
+        wa = Application(web.match('/', 'index') | stream)
+        started = []
+        def start_response(status, headers):
+            started.append(dict(headers))
+        app_iter = wa(Request.blank('/').environ, start_response)
+        self.assertEqual(produced, [])
+        self.assertEqual(''.join(app_iter), u'abж'.encode('utf-8'))
+        self.assert_('Content-Length' not in started[0])
+        self.assert_(web.is_streaming(web.StreamingResponse([])))
+        self.assert_(not web.is_streaming(Response()))
+
+    def test_streaming_error(self):
+        def chunks():
+            yield 'a'
+            raise ValueError()
+        closed = []
+        class Chunks(object):
+            def __iter__(self):
+                return chunks()
+            def close(self):
+                closed.append(True)
+        wa = Application(web.match('/', 'index') |
+                         (lambda e, d: web.StreamingResponse(Chunks())))
+        errors = []
+        wa.handle_error = lambda env: errors.append(sys.exc_info()[1])
+        app_iter = wa(Request.blank('/').environ, lambda *args: None)
+        body = iter(app_iter)
+        self.assertEqual(next(body), 'a')
+        self.assertRaises(ValueError, next, body)
+        assert isinstance(errors[0], ValueError)
+        app_iter.close()
+        self.assertEqual(closed, [True])
+
+    def test_defer(self):
+        calls = []
+        def add(x, y=0):
+            calls.append(x + y)
+        def handler(env, data):
+            env.defer(add, 1)
+            env.defer(lambda: 1 + '')
+            env.defer(add, 1, y=1)
+            return Response('index')
+        wa = Application(web.match('/', 'index') | handler)
+        errors = []
+        wa.handle_error = lambda env: errors.append(sys.exc_info()[1])
+        app_iter = wa(Request.blank('/').environ, lambda *args: None)
+        self.assertEqual(calls, [])
+        self.assertEqual(''.join(app_iter), 'index')
+        self.assertEqual(calls, [])
+        app_iter.close()
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(len(errors), 1)
+        assert isinstance(errors[0], TypeError)
+
+    def test_defer_executor(self):
+        submitted = []
+        class Executor(object):
+            def submit(self, func, *args):
+                submitted.append((func, args))
+        class App(Application):
+            defer_executor = Executor()
+        calls = []
+        def handler(env, data):
+            env.defer(calls.append, 1)
+            return Response('index')
+        wa = App(web.match('/', 'index') | handler)
+        TestApp(wa).get('/')
+        self.assertEqual(calls, [])
+        func, args = submitted[0]
+        func(*args)
+        self.assertEqual(calls, [1])
+
+    def test_defer_ask(self):
+        calls = []
+        def handler(env, data):
+            env.defer(calls.append, 1)
+            return Response('index')
+        web.ask(web.match('/', 'index') | handler, '/')
+        self.assertEqual(calls, [1])
@@ -291,3 +291,105 @@ class Chain(unittest.TestCase):
         self.assert_(response is nf)
 
 
+
+
+class CompiledCases(unittest.TestCase):
+
+    def _apps(self, *handlers):
+        return web.cases(*handlers), web.cases(*handlers, compiled=True)
+
+    def test_same_result(self):
+        'Compiled cases return the same results as regular ones'
+        def r(name):
+            return lambda e, d: name
+        handlers = (web.match('/', 'index') | r('index'),
+                    web.prefix('/news') | web.cases(
+                        web.match('', 'news') | r('news'),
+                        web.match('/<int:id>', 'item') | r('item')),
+                    web.match('/<name>', 'page') | r('page'),
+                    web.prefix('/doc') | r('doc'),
+                    web.match('/docs/<int:id>', 'docs') | r('docs'),
+                    web.namespace('ns') | web.match('/ns/a', 'a') | r('a'))
+        plain, compiled = self._apps(*handlers)
+        for url in ['/', '/news', '/news/1', '/newsletter', '/news/x',
+                    '/docs/1', '/docs', '/doc', '/ns/a', '/ns/b', '/x/y']:
+            self.assertEqual(web.ask(plain, url), web.ask(compiled, url))
+        self.assertEqual(web.ask(compiled, '/newsletter'), 'page')
+        self.assertEqual(web.ask(compiled, '/docs/1'), 'doc')
+        self.assertEqual(web.ask(compiled, '/ns/a'), 'a')
+
+    def test_skip_branches(self):
+        'Compiled cases do not call branches that can not match'
+        calls = []
+        def counter(env, data, nxt):
+            calls.append(env._route_state.path)
+            return nxt(env, data)
+        app = web.cases(*[web.prefix('/p%d' % i) | F(counter) |
+                            web.match('/', 'm%d' % i) | (lambda e, d: 'ok')
+                          for i in range(10)],
+                        compiled=True)
+        self.assertEqual(web.ask(app, '/p7/'), 'ok')
+        self.assertEqual(calls, ['/'])
+
+    def test_partial_segment_index(self):
+        'Compiled cases index prefixes ending inside the first segment'
+        app = web.cases(*[web.prefix('/p%d' % i) | web.match('', 'm%d' % i) |
+                            (lambda e, d: e.current_url_name)
+                          for i in range(10)] +
+                         [web.match('/<name>', 'page') | (lambda e, d: 'page')],
+                        compiled=True)
+        def literals(segment):
+            return [entry[0] for entry in app._index._bucket(segment)]
+        self.assertEqual(literals('p7'), ['/p7', '/'])
+        self.assertEqual(literals('p71'), ['/p7', '/'])
+        self.assertEqual(literals('x'), ['/'])
+        self.assertEqual(web.ask(app, '/p7'), 'm7')
+        self.assertEqual(web.ask(app, '/p71'), 'page')
+        self.assertEqual(web.ask(app, '/x'), 'page')
+
+    def test_dynamic_branches_order(self):
+        'Compiled cases keep order of static and dynamic branches'
+        app = web.cases(
+            web.match('/a', 'a1') | (lambda e, d: None),
+            F(lambda e, d, n: 'filter'),
+            web.match('/a', 'a2') | (lambda e, d: 'a2'),
+            compiled=True)
+        self.assertEqual(web.ask(app, '/a'), 'filter')
+
+    def test_chaining(self):
+        'Chaining after compiled cases'
+        app = web.cases(web.match('/a', 'a'),
+                        web.match('/b', 'b'),
+                        compiled=True) | (lambda e, d: e.current_location)
+        self.assertEqual(web.ask(app, '/b'), 'b')
+        self.assertEqual(web.ask(app, '/c'), None)
+        self.assertEqual(set(app._locations()), set(['a', 'b']))
+
+    def test_unexpected_kwargs(self):
+        self.assertRaises(TypeError, lambda: web.cases(compile=True))
+
+    def test_combined_matches(self):
+        'Compiled cases match sibling templates with one pattern'
+        app = web.cases(
+            web.match('/<string(max=3):s>', 'short') | (lambda e, d: d.s),
+            web.match('/<int:a>/<int:b>', 'sum') | (lambda e, d: d.a + d.b),
+            web.match('/<int:a>/<int:b>', 'never') | (lambda e, d: 'never'),
+            web.match('/x/<int:a>', 'none') | (lambda e, d: None),
+            web.match('/x/<int:b>', 'x') | (lambda e, d: d.b * 2),
+            web.match('/<name>', 'long') | (lambda e, d: 'long ' + d.name),
+            compiled=True)
+        self.assertEqual(web.ask(app, '/abc'), 'abc')
+        self.assertEqual(web.ask(app, '/abcdef'), 'long abcdef')
+        self.assertEqual(web.ask(app, '/2/3'), 5)
+        self.assertEqual(web.ask(app, '/x/4'), 8)
+        self.assertEqual(web.ask(app, '/x/y'), None)
+
+    def test_many_combined_matches(self):
+        'Compiled cases split combined patterns with too many groups'
+        app = web.cases(*[web.match('/<int:a>/%d/<int:b>' % i, 'm%d' % i) |
+                            (lambda e, d: e.current_url_name)
+                          for i in range(150)],
+                        compiled=True)
+        self.assertEqual(web.ask(app, '/1/0/1'), 'm0')
+        self.assertEqual(web.ask(app, '/1/149/1'), 'm149')
+        self.assertEqual(web.ask(app, '/1/150/1'), None)
@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['Prefix', 'Match', 'Subdomain']
-
+__all__ = ['Prefix', 'Match', 'Subdomain', 'StaticFiles', 'Gzip',
+           'LimitConcurrency', 'ETag']
+
+import os
+import time
+import gzip
+import zlib
+import shutil
+import tempfile
+import threading
 import unittest
 from iktomi import web
-from webob import Response
+from iktomi.web.flatten import flatten_chains
+from webob import Response, Request
+from webtest import TestApp
 
 
 class WebHandler(unittest.TestCase):
@@ -87,6 +97,22 @@ class Prefix(unittest.TestCase):
         self.assertEqual(web.ask(app, '/docs/list/something'), None)
         self.assertEqual(web.ask(app, '/docs/list/other-thing'), None)
 
+    def test_prefix_offsets(self):
+        '''Prefixes move offset in the path without slicing it'''
+
+        def handler(env, data):
+            route_state = env._route_state
+            return route_state.full_path, route_state.offset, route_state.path
+
+        app = web.cases(
+            web.prefix('/docs') | web.prefix('/list') | web.match('/x', 'x'),
+            web.prefix('/docs') | web.match('/<name>', 'name')) | handler
+
+        self.assertEqual(web.ask(app, '/docs/list/x'),
+                         ('/docs/list/x', 10, '/x'))
+        self.assertEqual(web.ask(app, '/docs/list'),
+                         ('/docs/list', 5, '/list'))
+
     def test_unicode(self):
         '''Routing rules with unicode'''
         # XXX move to urltemplate and reverse tests?
@@ -217,6 +243,68 @@ class Subdomain(unittest.TestCase):
                 'http://en.example.com/ http://en.example.com/')
 
 
+    def test_by_subdomain(self):
+        calls = []
+        def handler(env, data):
+            return Response(env.current_location + ' ' +
+                            env._route_state.primary_domain + ' ' +
+                            env.root.main.en.as_url.with_host())
+        def site(name):
+            @web.request_filter
+            def record(env, data, next_handler):
+                calls.append(name)
+                return next_handler(env, data)
+            return record
+        app = web.by_subdomain(
+            web.subdomain('example.com', 'example.ru', name='main') | site('main') | web.cases(
+                web.subdomain('en', 'eng', name='en') | web.match('/', ''),
+                web.subdomain('', 'www') | web.match('/', 'index'),
+            ),
+            web.subdomain('example.org', name='org') | site('org') | web.match('/', ''),
+            web.subdomain('admin.example.com', 'admin.example.org',
+                          name='admin') | site('admin') | web.match('/', ''),
+            web.subdomain(None, name='other') | site('other') | web.match('/', ''),
+        ) | handler
+
+        self.assertEqual(web.ask(app, 'http://example.com/').body,
+                         'main.index example.com http://en.example.com/')
+        self.assertEqual(calls, ['main'])
+        del calls[:]
+        self.assertEqual(web.ask(app, 'http://eng.example.ru/').body,
+                         'main.en en.example.com http://en.example.com/')
+        self.assertEqual(calls, ['main'])
+        del calls[:]
+        self.assertEqual(web.ask(app, 'http://www.example.org/').body,
+                         'org example.org http://en.example.com/')
+        self.assertEqual(calls, ['org'])
+        del calls[:]
+        # the first branch does not match and the state is restored
+        self.assertEqual(web.ask(app, 'http://admin.example.com/').body,
+                         'admin admin.example.com http://en.example.com/')
+        self.assertEqual(calls, ['main', 'admin'])
+        del calls[:]
+        self.assertEqual(web.ask(app, 'http://example.net/').body,
+                         'other  http://en.example.com/')
+        self.assertEqual(calls, ['other'])
+
+        root = web.Reverse.from_handler(app)
+        self.assertEqual(root.admin.as_url, 'http://admin.example.com/')
+        self.assertEqual(root.main.index.as_url, 'http://example.com/')
+
+        flat = web.Application(app)
+        flat.handler = flatten_chains(app)
+        for host in ('example.com', 'eng.example.ru', 'admin.example.com'):
+            self.assertEqual(web.ask(flat, 'http://%s/' % host).body,
+                             web.ask(app, 'http://%s/' % host).body)
+
+    def test_by_subdomain_alias_order(self):
+        app = web.by_subdomain(
+            web.subdomain('a.com', 'com') | (lambda e, d: e._route_state.subdomain),
+        )
+        self.assertEqual(web.ask(app, 'http://x.a.com/'), 'x')
+        self.assertEqual(web.ask(app, 'http://x.b.com/'), 'x.b')
+        self.assertEqual(web.ask(app, 'http://xcom/'), None)
+
 class Match(unittest.TestCase):
 
     def test_simple_match(self):
@@ -335,6 +423,52 @@ class Method(unittest.TestCase):
         self.assertEqual(web.ask(app, '/', method="PUT").body, 'post')
         self.assertEqual(web.ask(app, '/', method="DELETE").body, 'delete')
         self.assertEqual(web.ask(app, '/').status_int, 405)
+        self.assertEqual(web.ask(app, '/').headers['Allow'],
+                         'DELETE, POST, PUT')
+
+    def test_by_method_head(self):
+        app = web.by_method({
+            'GET': lambda e,d: Response('get'),
+        })
+        self.assertEqual(web.ask(app, '/', method='HEAD').body, 'get')
+        app = web.by_method({
+            'GET': lambda e,d: Response('get'),
+            'HEAD': lambda e,d: Response('head'),
+        })
+        self.assertEqual(web.ask(app, '/', method='HEAD').body, 'head')
+        self.assertEqual(web.ask(app, '/', method='POST').headers['Allow'],
+                         'GET, HEAD')
+
+    def test_by_method_default(self):
+        def get(env, data):
+            data.x = 1
+            return None
+        def default(env, data):
+            return Response(env.request.method + ' ' +
+                            str(getattr(data, 'x', None)))
+        app = web.by_method({'GET': get}, default)
+        self.assertEqual(web.ask(app, '/').body, 'GET None')
+        self.assertEqual(web.ask(app, '/', method='POST').body, 'POST None')
+
+    def test_by_method_chain(self):
+        app = web.by_method({
+            'GET': web.match('/', 'get'),
+            'POST': web.match('/', 'post'),
+        }) | (lambda e,d: Response(e.current_url_name))
+        self.assertEqual(web.ask(app, '/').body, 'get')
+        self.assertEqual(web.ask(app, '/', method='POST').body, 'post')
+        self.assertEqual(web.ask(app, '/x').status_int, 405)
+        self.assertEqual(sorted(app._locations()), ['get', 'post'])
+        self.assertEqual(web.ask(flatten_chains(app), '/').body, 'get')
+
+    def test_strict_allow(self):
+        from webob.exc import HTTPMethodNotAllowed
+        try:
+            web.ask(web.method('POST', 'put', strict=True), '/')
+        except HTTPMethodNotAllowed, e:
+            self.assertEqual(e.headers['Allow'], 'POST, PUT')
+        else:
+            self.fail('HTTPMethodNotAllowed is not raised')
 
 
 class Namespace(unittest.TestCase):
@@ -374,4 +508,417 @@ class Namespace(unittest.TestCase):
     def test_empty(self):
         self.assertRaises(TypeError, web.namespace, '')
 
-# XXX tests for static_files needed!
+
+
+class StaticFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.location, 'css'))
+        with open(os.path.join(self.location, 'css', 'main.css'), 'wb') as f:
+            f.write('body {}\n' * 10)
+        self.app = web.Application(
+                web.static_files(self.location, production=True, max_age=60))
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def get(self, url, app=None, **headers):
+        return Request.blank(url, headers=headers).get_response(app or self.app)
+
+    def test_dev(self):
+        app = web.Application(web.static_files(self.location))
+        response = self.get('/static/css/main.css', app)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'text/css')
+        self.assertEqual(response.body, 'body {}\n' * 10)
+        self.assertEqual(self.get('/static/css/none.css', app).status_int, 404)
+        self.assertEqual(self.get('/static/css', app).status_int, 404)
+        self.assertEqual(self.get('/static/', app).status_int, 404)
+
+    def test_outside_of_location(self):
+        name = os.path.basename(self.location)
+        for production in (False, True):
+            app = web.Application(web.static_files(
+                os.path.join(self.location, 'css'), production=production))
+            response = self.get('/static/x/../../%s/css/main.css' % name, app)
+            self.assertEqual(response.status_int, 404)
+
+    def test_production(self):
+        response = self.get('/static/css/main.css')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'text/css')
+        self.assertEqual(response.body, 'body {}\n' * 10)
+        self.assertEqual(response.content_length, 80)
+        self.assertEqual(response.cache_control.max_age, 60)
+        self.assert_(response.etag)
+        self.assert_(response.last_modified)
+        self.assertEqual(self.get('/static/css/none.css').status_int, 404)
+        self.assertEqual(self.get('/static/css').status_int, 404)
+
+    def test_concurrent_cache(self):
+        handler = web.static_files(self.location, production=True,
+                                   cache_size=2, cache_ttl=0)
+        app = web.Application(handler)
+        errors = []
+        def work():
+            try:
+                for i in range(200):
+                    for name in ('main.css', 'none.css', 'x.css'):
+                        self.get('/static/css/' + name, app)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assert_(len(handler._cache) <= 2)
+
+    def test_file_wrapper(self):
+        wrapped = []
+        def file_wrapper(f, block_size):
+            wrapped.append(f)
+            return iter(lambda: f.read(block_size), '')
+        request = Request.blank('/static/css/main.css')
+        request.environ['wsgi.file_wrapper'] = file_wrapper
+        response = request.get_response(self.app)
+        self.assertEqual(response.body, 'body {}\n' * 10)
+        self.assertEqual(len(wrapped), 1)
+
+    def test_not_modified(self):
+        response = self.get('/static/css/main.css')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        response = self.get('/static/css/main.css', If_None_Match=etag)
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.body, '')
+        response = self.get('/static/css/main.css',
+                            If_Modified_Since=last_modified)
+        self.assertEqual(response.status_int, 304)
+        response = self.get('/static/css/main.css', If_None_Match='"xxx"')
+        self.assertEqual(response.status_int, 200)
+
+    def test_range(self):
+        response = self.get('/static/css/main.css', Range='bytes=8-15')
+        self.assertEqual(response.status_int, 206)
+        self.assertEqual(response.body, 'body {}\n')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 8-15/80')
+        response = self.get('/static/css/main.css', Range='bytes=100-')
+        self.assertEqual(response.status_int, 416)
+
+    def test_gzip(self):
+        gz_path = os.path.join(self.location, 'css', 'main.css.gz')
+        f = gzip.open(gz_path, 'wb')
+        f.write('body {}\n' * 10)
+        f.close()
+        response = self.get('/static/css/main.css',
+                            Accept_Encoding='deflate, gzip')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertEqual(response.content_type, 'text/css')
+        self.assertEqual(response.content_length, os.path.getsize(gz_path))
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        gz_etag = response.etag
+        response.decode_content()
+        self.assertEqual(response.body, 'body {}\n' * 10)
+
+        for accept in ('deflate', 'gzip;q=0'):
+            response = self.get('/static/css/main.css',
+                                Accept_Encoding=accept)
+            self.assertEqual(response.content_encoding, None)
+            self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(response.body, 'body {}\n' * 10)
+            self.assertNotEqual(response.etag, gz_etag)
+
+    def test_cache(self):
+        handler = web.static_files(self.location, production=True,
+                                   cache_size=2)
+        app = web.Application(handler)
+        self.assertEqual(self.get('/static/css/main.css', app).status_int, 200)
+        self.assertEqual(self.get('/static/a.css', app).status_int, 404)
+        self.assertEqual(self.get('/static/b.css', app).status_int, 404)
+        self.assertEqual(len(handler._cache), 2)
+
+        # missing file is cached
+        with open(os.path.join(self.location, 'b.css'), 'wb') as f:
+            f.write('b')
+        self.assertEqual(self.get('/static/b.css', app).status_int, 404)
+        handler.cache_ttl = 0
+        self.assertEqual(self.get('/static/b.css', app).status_int, 200)
+
+        # removed file is not served from cache
+        handler.cache_ttl = 10
+        os.remove(os.path.join(self.location, 'b.css'))
+        self.assertEqual(self.get('/static/b.css', app).status_int, 404)
+
+
+class Gzip(unittest.TestCase):
+
+    body = 'body {}\n' * 100
+
+    def get(self, app, **headers):
+        return web.ask(app, '/', headers=headers)
+
+    def decompress(self, body):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+    def test_compress(self):
+        app = web.gzip() | (lambda e, d: Response(self.body,
+                                                  content_type='text/css'))
+        response = self.get(app, Accept_Encoding='deflate, gzip')
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertEqual(response.vary, ('Accept-Encoding',))
+        self.assertEqual(response.content_length, len(response.body))
+        self.assertEqual(self.decompress(response.body), self.body)
+
+        for headers in [{}, {'Accept-Encoding': 'gzip;q=0'}]:
+            response = self.get(app, **headers)
+            self.assertEqual(response.content_encoding, None)
+            self.assertEqual(response.vary, ('Accept-Encoding',))
+            self.assertEqual(response.body, self.body)
+
+    def test_file(self):
+        class FileIter(object):
+            def __iter__(self):
+                raise AssertionError('File is read')
+        def handler(env, data):
+            response = Response(content_type='text/css')
+            response.app_iter = FileIter()
+            return response
+        app = web.gzip() | web.etag() | handler
+        response = self.get(app, Accept_Encoding='gzip')
+        self.assertEqual(response.content_encoding, None)
+        self.assertEqual(response.etag, None)
+        self.assert_(isinstance(response.app_iter, FileIter))
+        self.assert_(not web.body_in_memory(response))
+        self.assert_(web.body_in_memory(Response('a')))
+
+    def test_skip(self):
+        responses = [
+            Response('short'),
+            Response(self.body, content_type='image/png'),
+            Response(self.body, content_encoding='br'),
+            Response(self.body, status=206),
+        ]
+        for response in responses:
+            body = response.body
+            app = web.gzip() | (lambda e, d: response)
+            response = self.get(app, Accept_Encoding='gzip')
+            self.assertNotEqual(response.content_encoding, 'gzip')
+            self.assertEqual(response.body, body)
+        self.assertEqual(web.ask(web.gzip() | web.cases(), '/'), None)
+        app = web.gzip(skip_content_types=['text/']) | \
+                (lambda e, d: Response(self.body))
+        self.assertEqual(self.get(app, Accept_Encoding='gzip').body,
+                         self.body)
+
+    def test_level(self):
+        app = web.gzip(level=1, min_size=0) | (lambda e, d: Response('a'))
+        response = self.get(app, Accept_Encoding='gzip')
+        self.assertEqual(self.decompress(response.body), 'a')
+
+    def test_etag(self):
+        def handler(env, data):
+            response = Response(self.body)
+            response.etag = 'abc'
+            return response
+        app = web.gzip() | handler
+        self.assertEqual(self.get(app, Accept_Encoding='gzip').etag,
+                         'abc-gzip')
+        self.assertEqual(self.get(app).etag, 'abc')
+
+    def test_streaming(self):
+        chunks = ['a' * 10, '', 'b' * 10]
+        app = web.gzip() | (lambda e, d: web.StreamingResponse(iter(chunks)))
+        response = self.get(app, Accept_Encoding='gzip')
+        self.assertEqual(response.content_encoding, 'gzip')
+        app_iter = response.app_iter
+        # the first chunk is sent before the stream is exhausted
+        first = next(app_iter)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(first), 'a' * 10)
+        self.assertEqual(self.decompress(first + ''.join(app_iter)),
+                         ''.join(chunks))
+
+
+class LimitConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.entered = []
+        def handler(env, data):
+            self.entered.append(env.request.path)
+            self.release.wait(5)
+            return Response(env.request.path)
+        self.handler = handler
+
+    def start(self, app, url):
+        results = []
+        thread = threading.Thread(
+                target=lambda: results.append(web.ask(app, url)))
+        thread.start()
+        return thread, results
+
+    def wait_for(self, condition):
+        for i in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('timeout')
+
+    def test_shed(self):
+        limiter = web.limit_concurrency(1, retry_after=3)
+        app = limiter | self.handler
+        thread, results = self.start(app, '/1')
+        self.wait_for(lambda: self.entered)
+        response = web.ask(app, '/2')
+        self.assertEqual(response.status_int, 503)
+        self.assertEqual(response.headers['Retry-After'], '3')
+        self.release.set()
+        thread.join()
+        self.assertEqual(results[0].body, '/1')
+        self.assertEqual(web.ask(app, '/3').body, '/3')
+        self.assertEqual(limiter.counters(),
+                         dict(admitted=2, queued=0, shed=1,
+                              active=0, waiting=0))
+
+    def test_queue(self):
+        limiter = web.limit_concurrency(1, max_queued=1, timeout=5)
+        app = limiter | self.handler
+        first = self.start(app, '/1')
+        self.wait_for(lambda: self.entered)
+        second = self.start(app, '/2')
+        self.wait_for(lambda: limiter.counters()['waiting'] == 1)
+        # the queue is full
+        self.assertEqual(web.ask(app, '/3').status_int, 503)
+        self.release.set()
+        for thread, results in (first, second):
+            thread.join()
+        self.assertEqual(first[1][0].body, '/1')
+        self.assertEqual(second[1][0].body, '/2')
+        self.assertEqual(limiter.counters(),
+                         dict(admitted=2, queued=1, shed=1,
+                              active=0, waiting=0))
+
+    def test_timeout(self):
+        limiter = web.limit_concurrency(1, max_queued=1, timeout=0.05)
+        app = limiter | self.handler
+        thread, results = self.start(app, '/1')
+        self.wait_for(lambda: self.entered)
+        self.assertEqual(web.ask(app, '/2').status_int, 503)
+        self.release.set()
+        thread.join()
+        self.assertEqual(limiter.counters()['queued'], 1)
+        self.assertEqual(limiter.counters()['shed'], 1)
+
+    def test_per_namespace(self):
+        limiter = web.limit_concurrency(1, per_namespace=True)
+        app = web.cases(
+            web.prefix('/a', name='a'),
+            web.prefix('/b', name='b'),
+        ) | limiter | self.handler
+        thread, results = self.start(app, '/a')
+        self.wait_for(lambda: self.entered)
+        self.assertEqual(web.ask(app, '/a').status_int, 503)
+        # requests to other namespace are not limited
+        other_thread, other_results = self.start(app, '/b')
+        self.wait_for(lambda: len(self.entered) == 2)
+        self.release.set()
+        thread.join()
+        other_thread.join()
+        self.assertEqual(other_results[0].body, '/b')
+        self.assertEqual(limiter.counters('a')['shed'], 1)
+        self.assertEqual(limiter.counters('b')['shed'], 0)
+        self.assertEqual(limiter.counters()['admitted'], 2)
+
+
+class ETag(unittest.TestCase):
+
+    def setUp(self):
+        self.rendered = []
+
+    def render(self, env, data):
+        self.rendered.append(env.request.path)
+        response = Response('content ' * 100)
+        response.cache_control.max_age = 60
+        return response
+
+    def test_body_hash(self):
+        app = web.etag() | self.render
+        response = web.ask(app, '/')
+        self.assertEqual(response.status_int, 200)
+        tag = response.etag
+        self.assert_(tag)
+        response = web.ask(app, '/', headers={'If-None-Match': '"%s"' % tag})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.etag, tag)
+        self.assertEqual(response.body, '')
+        self.assertEqual(response.cache_control.max_age, 60)
+        response = web.ask(app, '/', headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.status_int, 200)
+        # the body is rendered to be hashed
+        self.assertEqual(len(self.rendered), 3)
+
+    def test_version(self):
+        version = {'value': 1}
+        app = web.etag(version=lambda env, data: version['value'],
+                       salt='r1') | self.render
+        tag = web.ask(app, '/').etag
+        self.assertEqual(tag, web.etag(salt='r1').make_tag(1))
+        self.assertNotEqual(tag, web.etag(salt='r2').make_tag(1))
+        response = web.ask(app, '/', headers={'If-None-Match': '"%s"' % tag})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(self.rendered, ['/'])
+        version['value'] = 2
+        response = web.ask(app, '/', headers={'If-None-Match': '"%s"' % tag})
+        self.assertEqual(response.status_int, 200)
+        self.assertNotEqual(response.etag, tag)
+
+    def test_check_etag(self):
+        def handler(env, data):
+            web.check_etag(env, data.version)
+            return self.render(env, data)
+        app = web.Application(web.cases(
+            web.match('/<int:version>', 'item') | web.etag() | handler,
+            web.match('/plain/<int:version>', 'plain') | handler,
+        ))
+        client = TestApp(app)
+        tag = client.get('/1').headers['ETag']
+        response = client.get('/1', headers={'If-None-Match': tag},
+                              status=304)
+        self.assertEqual(response.headers['ETag'], tag)
+        self.assertEqual(self.rendered, ['/1'])
+        client.get('/2', headers={'If-None-Match': tag}, status=200)
+        # without the filter the version is ignored
+        response = client.get('/plain/1', headers={'If-None-Match': tag})
+        self.assert_('ETag' not in response.headers)
+
+    def test_gzip(self):
+        app = web.gzip() | web.etag() | self.render
+        headers = {'Accept-Encoding': 'gzip'}
+        response = web.ask(app, '/', headers=headers)
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assert_(response.etag.endswith('-gzip'))
+        headers['If-None-Match'] = '"%s"' % response.etag
+        response = web.ask(app, '/', headers=headers)
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.content_encoding, None)
+
+    def test_skipped(self):
+        app = web.etag() | web.cases(
+            web.match('/stream', 'stream') |
+                (lambda e, d: web.StreamingResponse(['a'])),
+            web.match('/tagged', 'tagged') |
+                (lambda e, d: Response('a', etag='v1')),
+            web.match('/error', 'error') |
+                (lambda e, d: Response('a', status=500)),
+            self.render)
+        self.assertEqual(web.ask(app, '/stream').etag, None)
+        self.assertEqual(web.ask(app, '/error').etag, None)
+        response = web.ask(app, '/tagged', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_int, 304)
+        response = web.ask(app, '/', method='POST', data={'a': 'b'})
+        self.assertEqual(response.etag, None)
+        self.assertEqual(web.ask(web.etag() | (lambda e, d: None), '/'), None)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['FlattenChainsTests']
+
+import unittest
+from webob.exc import HTTPMethodNotAllowed
+from iktomi import web
+from iktomi.web.flatten import FlatChain, flatten_chains, call_depths
+
+
+class FlattenChainsTests(unittest.TestCase):
+
+    def app(self, compiled=False):
+        @web.request_filter
+        def wrapper(env, data, nxt):
+            return nxt(env, data)
+        location = lambda e, d: (e.current_location, d.as_dict())
+        return web.cases(
+            web.match('/', 'index') | location,
+            web.prefix('/news', name='news') | wrapper | web.cases(
+                web.match('', 'list') | location,
+                web.match('/<int:id>', 'item') | web.method('GET') | location,
+                web.match('/<int:id>', 'item_post') |
+                    web.method('POST', strict=True) | location,
+                compiled=compiled),
+            web.subdomain('en', None) | web.namespace('en') |
+                web.match('/about', 'about') | location,
+            compiled=compiled)
+
+    def test_same_results(self):
+        'Flattened handlers return the same results'
+        for compiled in (False, True):
+            app = self.app(compiled)
+            flat = flatten_chains(app)
+            for url, method in [('/', 'GET'), ('/news', 'GET'),
+                                ('/news/1', 'GET'), ('/news/1', 'POST'),
+                                ('http://en.example.com/about', 'GET'),
+                                ('/about', 'GET'), ('/none', 'GET')]:
+                self.assertEqual(web.ask(app, url, method=method),
+                                 web.ask(flat, url, method=method))
+            self.assertRaises(HTTPMethodNotAllowed,
+                              web.ask, flat, '/news/1', method='PUT')
+
+    def test_structure(self):
+        'Chains of step handlers are replaced by FlatChain'
+        flat = flatten_chains(self.app())
+        chain = flat.handlers[2]
+        self.assert_(isinstance(chain, FlatChain))
+        self.assertEqual(len(chain.steps), 3)
+        self.assertEqual(flat._locations().keys(),
+                         self.app()._locations().keys())
+
+    def test_call_depths(self):
+        'Flattening reduces call depth'
+        app = self.app()
+        depths = call_depths(app)
+        flat_depths = call_depths(flatten_chains(app))
+        self.assertEqual(set(depths), set(['index', 'news.list', 'news.item',
+                                           'news.item_post', 'en.about']))
+        self.assertEqual(depths['en.about'], 5)
+        self.assertEqual(flat_depths['en.about'], 3)
+        self.assertEqual(depths['news.item'], 9)
+        self.assertEqual(flat_depths['news.item'], 7)
+        for name in depths:
+            self.assert_(flat_depths[name] <= depths[name])
+
+    def test_prefix_miss(self):
+        'Path offset pushed by flattened prefix is restored on a miss'
+        for compiled in (False, True):
+            app = flatten_chains(web.cases(
+                web.prefix('/a') | web.match('/b', 'b') | (lambda e, d: 'b'),
+                web.prefix('/a') | web.namespace('a') | web.cases(
+                    web.match('/c', 'c') | (lambda e, d: None)),
+                web.match('/a/c', 'ac') | (lambda e, d: 'ac'),
+                compiled=compiled))
+            self.assert_(isinstance(app.handlers[0], FlatChain))
+            self.assertEqual(web.ask(app, '/a/b'), 'b')
+            self.assertEqual(web.ask(app, '/a/c'), 'ac')
+
+    def test_chaining(self):
+        'FlatChain can be chained'
+        chain = flatten_chains(web.match('/', 'index'))
+        chain = chain | (lambda e, d: 'ok')
+        self.assert_(isinstance(chain, FlatChain))
+        self.assertEqual(web.ask(chain, '/'), 'ok')
+
+    def test_subclass(self):
+        'Step handlers with overridden __call__ are not flattened'
+        class my_match(web.match):
+            def __call__(self, env, data):
+                return 'overridden'
+        flat = flatten_chains(my_match('/', 'index') | (lambda e, d: 'ok'))
+        self.assert_(not isinstance(flat, FlatChain))
+        self.assertEqual(web.ask(flat, '/'), 'overridden')
+
+    def test_application(self):
+        class FlatApplication(web.Application):
+            flatten_chains = True
+        app = FlatApplication(self.app())
+        self.assert_(isinstance(app.handler.handlers[0], FlatChain))
+        self.assertEqual(app.call_depths()['index'], 3)
+        self.assertEqual(web.ask(app, '/news/1')[0], 'news.item')
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['InstrumentTests']
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from webob import Request, Response
+from iktomi import web
+from iktomi.web.flatten import flatten_chains
+from iktomi.web.instrument import HandlerStats, TimedHandler, instrument
+
+
+def location(env, data):
+    return Response(env.current_location)
+
+
+class InstrumentTests(unittest.TestCase):
+
+    def records(self, stats):
+        return dict(((x['handler'], x['location']), x)
+                    for x in stats.as_list())
+
+    def test_same_results(self):
+        for compiled in (False, True):
+            app = web.cases(
+                web.match('/', 'index') | location,
+                web.prefix('/news', name='news') | web.cases(
+                    web.match('', 'list') | location,
+                    web.match('/<int:id>', 'item') | location,
+                    compiled=compiled),
+                compiled=compiled)
+            timed = instrument(app, HandlerStats())
+            self.assert_(isinstance(timed, TimedHandler))
+            for url in ['/', '/news', '/news/1', '/news/x', '/none']:
+                self.assertEqual(getattr(web.ask(app, url), 'body', None),
+                                 getattr(web.ask(timed, url), 'body', None))
+            root = web.Reverse.from_handler(timed)
+            self.assertEqual(root.news.item(id=1).as_url, '/news/1')
+
+    def test_counts(self):
+        stats = HandlerStats()
+        app = instrument(web.cases(
+            web.match('/', 'index') | location,
+            web.prefix('/news', name='news') |
+                web.match('/<int:id>', 'item') | location,
+        ), stats)
+        web.ask(app, '/news/1')
+        web.ask(app, '/news/1')
+        web.ask(app, '/none')
+        records = self.records(stats)
+
+        endpoint = records[(__name__ + '.location', 'news.item')]
+        self.assertEqual(endpoint['calls'], 2)
+        self.assertEqual(endpoint['misses'], 0)
+
+        index = records[("match('/', 'index')", '')]
+        self.assertEqual(index['calls'], 3)
+        self.assertEqual(index['misses'], 3)
+
+        item = records[("match('/<int:id>', 'item')", 'news.item')]
+        self.assertEqual(item['calls'], 2)
+        self.assertEqual(item['misses'], 0)
+        self.assert_(item['total'] >= endpoint['total'])
+        self.assert_(item['exclusive'] <= item['total'])
+
+        total = sum(x['total'] for x in stats.as_list()
+                    if x['handler'].startswith('cases(') and
+                       x['location'] == '')
+        exclusive = sum(x['exclusive'] for x in stats.as_list())
+        self.assert_(exclusive <= total + 1e-6)
+
+        stats.reset()
+        self.assertEqual(stats.as_list(), [])
+
+    def test_exception(self):
+        stats = HandlerStats()
+        app = instrument(web.match('/', 'index') |
+                         web.method('POST', strict=True) | location, stats)
+        self.assertRaises(Exception, web.ask, app, '/')
+        for record in stats.as_list():
+            self.assertEqual(record['misses'], 0)
+        self.assertEqual(stats._stack(), [])
+
+    def test_chain(self):
+        stats = HandlerStats()
+        app = instrument(web.match('/', 'index'), stats) | location
+        self.assert_(isinstance(app, TimedHandler))
+        self.assertEqual(web.ask(app, '/').body, 'index')
+        self.assertEqual(len(stats.as_list()), 2)
+
+    def test_flattened(self):
+        stats = HandlerStats()
+        app = instrument(flatten_chains(
+            web.prefix('/news', name='news') | web.cases(
+                web.match('', 'list') | location,
+                web.match('/<int:id>', 'item') | location,
+                compiled=True)), stats)
+        self.assertEqual(web.ask(app, '/news/1').body, 'news.item')
+
+    def test_application(self):
+        stats = HandlerStats()
+        class App(web.Application):
+            handler_stats = stats
+        app = App(web.cases(
+            web.match('/_stats', 'stats') | stats.view,
+            web.prefix('/news', name='news') |
+                web.match('/<int:id>', 'item') | location,
+        ))
+        self.assert_('instrument' in app.build_times)
+        Request.blank('/news/1').get_response(app)
+        report = Request.blank('/_stats').get_response(app).body
+        self.assert_('news.item' in report)
+        self.assert_("match('/<int:id>', 'item')" in report)
+
+    def test_unicode_route(self):
+        stats = HandlerStats()
+        class App(web.Application):
+            handler_stats = stats
+        app = App(web.cases(
+            web.match('/_stats', 'stats') | stats.view,
+            web.match(u'/новости', 'news') | location,
+        ))
+        response = Request.blank('/%D0%BD%D0%BE%D0%B2%D0%BE%D1%81%D1%82%D0%B8')\
+                .get_response(app)
+        self.assertEqual(response.body, 'news')
+        report = Request.blank('/_stats').get_response(app).body
+        self.assert_("match('/новости')" in report)
+
+    def test_dump(self):
+        stats = HandlerStats()
+        app = instrument(web.match('/', 'index') | location, stats)
+        web.ask(app, '/')
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'stats.json')
+            stats.dump(filename)
+            with open(filename) as f:
+                self.assertEqual(len(json.load(f)), len(stats.as_list()))
+        finally:
+            shutil.rmtree(tmp)
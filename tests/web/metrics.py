@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['MetricsTests']
+
+import os
+import shutil
+import tempfile
+import unittest
+from webob import Request, Response
+from iktomi import web
+from iktomi.web.metrics import MetricsRegistry
+
+
+def ok(env, data):
+    return Response('ok')
+
+
+def error(env, data):
+    raise ValueError()
+
+
+class MetricsTests(unittest.TestCase):
+
+    def test_counter(self):
+        metrics = MetricsRegistry()
+        counter = metrics.counter('emails_total', 'Sent "emails"',
+                                  ['kind'])
+        self.assert_(metrics.counter('emails_total') is counter)
+        counter.inc(kind='news')
+        counter.inc(2, kind='news')
+        counter.inc(kind=u'a\n"b"')
+        self.assertEqual(metrics.render(),
+                         '# HELP emails_total Sent \\"emails\\"\n'
+                         '# TYPE emails_total counter\n'
+                         'emails_total{kind="a\\n\\"b\\""} 1\n'
+                         'emails_total{kind="news"} 3\n')
+        self.assertRaises(TypeError, counter.inc)
+        self.assertRaises(TypeError, metrics.histogram, 'emails_total')
+
+    def test_histogram(self):
+        metrics = MetricsRegistry()
+        histogram = metrics.histogram('duration_seconds',
+                                      buckets=[1, 0.1])
+        for value in [0.05, 0.5, 0.7, 20]:
+            histogram.observe(value)
+        self.assertEqual(metrics.render(),
+                         '# TYPE duration_seconds histogram\n'
+                         'duration_seconds_bucket{le="0.1"} 1\n'
+                         'duration_seconds_bucket{le="1"} 3\n'
+                         'duration_seconds_bucket{le="+Inf"} 4\n'
+                         'duration_seconds_sum 21.25\n'
+                         'duration_seconds_count 4\n')
+
+    def test_timer(self):
+        metrics = MetricsRegistry()
+        with metrics.timer('upstream_seconds', host='a'):
+            pass
+        values = metrics.collect()
+        self.assertEqual(values[('upstream_seconds', 'count', (u'a',))], 1)
+
+    def test_processes(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            metrics = MetricsRegistry(tmp)
+            counter = metrics.counter('requests_total', labels=['url'])
+            counter.inc(url='/')
+            pid = os.fork()
+            if pid == 0:
+                # child process writes to own file
+                try:
+                    counter.inc(url='/')
+                    # enough keys to grow the file
+                    for i in range(2000):
+                        counter.inc(url='/%d' % i)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            self.assertEqual(len(os.listdir(tmp)), 2)
+            counter.inc(url='/')
+            values = metrics.collect()
+            self.assertEqual(values[('requests_total', '', (u'/',))], 3)
+            self.assertEqual(values[('requests_total', '', (u'/5',))], 1)
+            # values are kept in files
+            metrics = MetricsRegistry(tmp)
+            metrics.counter('requests_total', labels=['url']).inc(url='/')
+            self.assert_('requests_total{url="/"} 4\n' in metrics.render())
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_created_by_other_process(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            metrics = MetricsRegistry(tmp)
+            metrics.counter('requests_total').inc()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    metrics.counter('emails_total', 'Sent "emails"',
+                                    ['kind']).inc(kind='news')
+                    metrics.histogram('render_seconds',
+                                      buckets=[0.1, 1]).observe(0.5)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            report = metrics.render()
+            self.assert_('# HELP emails_total Sent \\"emails\\"\n'
+                         '# TYPE emails_total counter\n'
+                         'emails_total{kind="news"} 1\n' in report)
+            self.assert_('# TYPE render_seconds histogram\n'
+                         'render_seconds_bucket{le="0.1"} 0\n'
+                         'render_seconds_bucket{le="1"} 1\n'
+                         'render_seconds_bucket{le="+Inf"} 1\n'
+                         'render_seconds_sum 0.5\n'
+                         'render_seconds_count 1\n' in report)
+            self.assert_('requests_total 1\n' in report)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_application(self):
+        metrics = MetricsRegistry()
+        class App(web.Application):
+            pass
+        App.metrics = metrics
+        app = App(web.cases(
+            web.match('/metrics', 'metrics') | metrics.view,
+            web.prefix('/news', name='news') | web.cases(
+                web.match('/<int:id>', 'item') | ok,
+            ),
+            web.match('/error', 'error') | error,
+            web.match('/other', 'declined') | (lambda env, data: None),
+            web.match('/other', 'other') | ok,
+        ))
+        app.handle_error = lambda env: None
+        for url in ['/news/1', '/news/2', '/error', '/none', '/other']:
+            Request.blank(url).get_response(app)
+        response = Request.blank('/metrics').get_response(app)
+        self.assertEqual(response.content_type, 'text/plain')
+        report = response.body
+        self.assert_('iktomi_requests_total{endpoint="news.item",'
+                     'status="200"} 2\n' in report)
+        self.assert_('iktomi_requests_total{endpoint="error",'
+                     'status="500"} 1\n' in report)
+        self.assert_('iktomi_requests_total{endpoint="",'
+                     'status="404"} 1\n' in report)
+        self.assert_('iktomi_request_errors_total{endpoint="error"} 1\n'
+                     in report)
+        self.assert_('iktomi_request_duration_seconds_count'
+                     '{endpoint="news.item"} 2\n' in report)
+        # the branch declined the request is not counted
+        self.assert_('iktomi_requests_total{endpoint="other",'
+                     'status="200"} 1\n' in report)
+        self.assert_('endpoint="declined"' not in report)
+
+    def test_location_not_tracked(self):
+        envs = []
+        class App(web.Application):
+            def create_env(self, request, **kwargs):
+                env = web.Application.create_env(self, request, **kwargs)
+                envs.append(env)
+                return env
+        app = App(web.cases(
+            web.match('/', 'index') | ok,
+        ))
+        Request.blank('/').get_response(app)
+        self.assertEqual(envs[0]._route_state.location, None)
+        App.metrics = MetricsRegistry()
+        Request.blank('/').get_response(App(app.handler))
+        self.assertEqual(envs[1]._route_state.location, 'index')
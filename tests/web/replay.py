@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['ReplayTests']
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from webob import Response
+from iktomi import web
+from iktomi.web.replay import Replay, LogEntry, parse_line, read_log, \
+                              _percentile
+
+
+def slow(env, data):
+    time.sleep(0.01)
+    return Response('slow')
+
+
+def fast(env, data):
+    return Response(env.request.headers.get('User-Agent', ''))
+
+
+LOG = '''\
+127.0.0.1 - - [10/Oct/2015:13:55:36 +0300] "GET /news/1?page=2 HTTP/1.1" 200 2326 "http://example.com/" "Mozilla/5.0"
+example.com 127.0.0.1 - frank [10/Oct/2015:13:55:36 +0300] "POST /news/2 HTTP/1.1" 200 - "-" "-"
+not a log line
+{"method": "GET", "path": "/slow", "host": "example.com", "headers": {"User-Agent": "bot"}}
+127.0.0.1 - - [10/Oct/2015:13:55:37 +0300] "GET /none HTTP/1.1" 404 0 "-" "-"
+'''
+
+
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def app(self):
+        return web.Application(web.cases(
+            web.match('/slow', 'slow') | slow,
+            web.prefix('/news', name='news') | web.cases(
+                web.match('/<int:id>', 'item') | fast,
+            ),
+        ))
+
+    def entries(self):
+        filename = os.path.join(self.tmp, 'access.log')
+        with open(filename, 'w') as f:
+            f.write(LOG)
+        return list(read_log(filename, default_host='example.com'))
+
+    def test_parse(self):
+        self.assertEqual(self.entries(), [
+            LogEntry('GET', '/news/1', 'page=2', 'example.com',
+                     {'Referer': 'http://example.com/',
+                      'User-Agent': 'Mozilla/5.0'}),
+            LogEntry('POST', '/news/2', '', 'example.com', {}),
+            LogEntry('GET', '/slow', '', 'example.com',
+                     {'User-Agent': 'bot'}),
+            LogEntry('GET', '/none', '', 'example.com', {}),
+        ])
+        self.assertEqual(parse_line('{broken'), None)
+
+    def check(self, results):
+        self.assertEqual(len(results.records), 4)
+        by_url = dict((x.entry.path, x) for x in results.records)
+        self.assertEqual(by_url['/news/1'].endpoint, 'news.item')
+        self.assertEqual(by_url['/news/1'].status, 200)
+        self.assertEqual(by_url['/none'].endpoint, '')
+        self.assertEqual(by_url['/none'].status, 404)
+        self.assertEqual(results.slowest(1)[0].entry.path, '/slow')
+        stats = results.by_endpoint()
+        self.assertEqual(stats[0]['endpoint'], 'slow')
+        news = [x for x in stats if x['endpoint'] == 'news.item'][0]
+        self.assertEqual(news['count'], 2)
+        self.assert_(news['p50'] <= news['p90'] <= news['p99'] <= news['max'])
+        report = results.report()
+        self.assert_('4 requests' in report)
+        self.assert_('news.item' in report)
+        self.assert_('GET http://example.com/slow' in report)
+
+    def test_percentile(self):
+        values = range(1, 11)
+        self.assertEqual(_percentile(values, 50), 5)
+        self.assertEqual(_percentile(values, 90), 9)
+        self.assertEqual(_percentile(values, 99), 10)
+        self.assertEqual(_percentile(values, 100), 10)
+        self.assertEqual(_percentile([3], 50), 3)
+
+    def test_app_not_changed(self):
+        app = self.app()
+        create_env = app.create_env
+        replay = Replay(app)
+        replay.run(self.entries())
+        self.assertEqual(app.create_env, create_env)
+        self.assert_(replay.app is app)
+
+    def test_threads(self):
+        self.check(Replay(self.app(), workers=3).run(self.entries()))
+
+    def test_processes(self):
+        replay = Replay(self.app(), workers=2, processes=True)
+        replay.chunk_size = 1
+        self.check(replay.run(self.entries()))
+
+    def test_profile(self):
+        replay = Replay(self.app())
+        results = replay.run(self.entries())
+        directory = os.path.join(self.tmp, 'profiles')
+        filenames = replay.profile(results.slowest(2), directory)
+        self.assertEqual(len(filenames), 2)
+        self.assert_(filenames[0].endswith('00-slow.prof'))
+        for filename in filenames:
+            self.assert_(os.path.getsize(filename) > 0)
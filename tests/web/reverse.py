@@ -470,3 +470,34 @@ class ReverseTests(unittest.TestCase):
         self.assertEqual(r.build_url('ns.url'), '/0/0')
         self.assertEqual(r.build_url('ns.url', id1=1, id2=2), '/1/2')
         
+
+    def test_subreverse_cache(self):
+        'Subreverses without arguments are shared by reverses of the app'
+        app = web.prefix('/news', name='news') | web.cases(
+                web.match('', 'index'),
+                web.match('/<int:id>', 'item'))
+        r = web.Reverse.from_handler(app)
+        self.assert_(r.news.index is r.news.index)
+        self.assert_(r.news.item is r.news.item)
+        self.assert_(r.news.item(id=1) is not r.news.item(id=1))
+        self.assertEqual(r.build_url('news.index'), '/news')
+        self.assertEqual(r.build_url('news.item', id=1), '/news/1')
+        self.assertRaises(UrlBuildingError, r.build_url, 'news.item')
+
+        env = web.ask(web.match('/', 'x') | (lambda e, d: e),
+                      'http://example.com/')
+        bound = r.bind_to_env(env)
+        self.assert_(bound.news.index._bound_env is env)
+        self.assert_(r.news.index._bound_env is None)
+        self.assertEqual(bound.build_url('news.index'), '/news')
+        self.assert_(r._cache['news']._bound_env is None)
+        self.assert_(r._cache['news']._parent._bound_env is None)
+
+    def test_compiled_location(self):
+        'Static parts of location builders are joined'
+        location = Location(UrlTemplate('/news', match_whole_str=False),
+                            UrlTemplate('/<int:id>/page'))
+        self.assertEqual(location._parts[0], '/news/')
+        self.assertEqual(location._parts[2], '/page')
+        self.assertEqual(location.build_path(None, id=3), '/news/3/page')
+        self.assertRaises(UrlBuildingError, location.build_path, None)
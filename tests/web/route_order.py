@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['RouteOrderTests']
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from webob import Request, Response
+from iktomi import web
+from iktomi.cli.app import App as CliApp
+from iktomi.web.route_order import RouteOrder, AdaptiveCases, \
+        reorder_cases, _disjoint_runs
+
+
+def location(env, data):
+    return Response(env.current_location)
+
+
+class RouteOrderTests(unittest.TestCase):
+
+    def app(self):
+        return web.cases(
+            web.match('/', 'index') | location,
+            web.prefix('/news', name='news') | web.cases(
+                web.match('', 'list') | location,
+                web.match('/<int:id>', 'item') | location,
+            ),
+            web.match('/about', 'about') | location,
+            web.match('/docs', 'docs') | location,
+            # overlaps with everything
+            web.match('/<path>', 'page') | location,
+            web.match('/contacts', 'contacts') | location,
+        )
+
+    def test_runs(self):
+        handlers = self.app().handlers
+        self.assertEqual(_disjoint_runs(handlers), [[0, 1, 2, 3], [4], [5]])
+        self.assertEqual(_disjoint_runs([
+            web.prefix('/a'),
+            web.match('/b', 'b'),
+            web.match('/a/b', 'ab'),
+        ]), [[0, 1], [2]])
+        self.assertEqual(_disjoint_runs([
+            web.prefix('/a'),
+            web.match('/', 'index'),
+            web.prefix('/ab'),
+        ]), [[0, 1], [2]])
+
+    def test_reorder(self):
+        order = RouteOrder(reorder_every=10)
+        app = reorder_cases(self.app(), order)
+        self.assert_(isinstance(app, AdaptiveCases))
+        # nested cases are adapted first
+        self.assertEqual(order.orders(),
+                         [['', '/*'], ['/', '/news*', '/about', '/docs']])
+        urls = ['/docs'] * 5 + ['/news/1'] * 3 + ['/about', '/x']
+        for url in urls:
+            response = web.ask(app, url)
+            self.assertEqual(response.body,
+                             'page' if url == '/x' else
+                             web.ask(self.app(), url).body)
+        self.assertEqual(app.as_list()[0],
+                         [('/docs', 2), ('/news*', 1), ('/about', 0),
+                          ('/', 0)])
+        self.assertEqual(web.ask(app, '/').body, 'index')
+        self.assertEqual(web.ask(app, '/contacts').body, 'page')
+        self.assert_('/docs 2, /news* 1' in order.report())
+
+    def test_frozen(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'order.json')
+            with open(filename, 'w') as f:
+                json.dump([['/docs', '/', '/about', '/news*']], f)
+            order = RouteOrder.load(filename, reorder_every=1)
+            app = reorder_cases(self.app(), order)
+            self.assertEqual(web.ask(app, '/news/1').body, 'news.item')
+            self.assertEqual(app.as_list()[0],
+                             [('/docs', 0), ('/', 0), ('/about', 0),
+                              ('/news*', 0)])
+            order.dump(filename)
+            with open(filename) as f:
+                self.assertEqual(json.load(f),
+                                 [['', '/*'],
+                                  ['/docs', '/', '/about', '/news*']])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_application(self):
+        order = RouteOrder(reorder_every=1)
+        class App(web.Application):
+            route_order = order
+        app = App(self.app())
+        self.assert_('route_order' in app.build_times)
+        for i in range(2):
+            response = Request.blank('/about').get_response(app)
+            self.assertEqual(response.body, 'about')
+        self.assertEqual(app.root.news.item(id=1).as_url, '/news/1')
+        self.assertEqual(app.handler.as_list()[0][0][0], '/about')
+
+    def route_order_command(self, app, *args):
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            CliApp(app).command_route_order(*args)
+        finally:
+            sys.stdout = stdout
+        return output.getvalue()
+
+    def test_command(self):
+        order = RouteOrder(reorder_every=100)
+        class App(web.Application):
+            route_order = order
+        app = App(self.app())
+        for url in ['/docs', '/docs', '/about']:
+            Request.blank(url).get_response(app)
+        # hits of the running application
+        self.assert_('/ 0, /news* 0, /about 1, /docs 2' in
+                     self.route_order_command(app))
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'order.json')
+            with open(filename, 'w') as f:
+                json.dump([['/about', '/docs', '/', '/news*']], f)
+            self.assert_('/about 0, /docs 0, / 0, /news* 0' in
+                         self.route_order_command(app, filename))
+        finally:
+            shutil.rmtree(tmp)
+        self.assert_('/ 0, /news* 0, /about 0, /docs 0' in
+                     self.route_order_command(web.Application(self.app())))
+
+    def test_compiled(self):
+        order = RouteOrder()
+        app = reorder_cases(web.cases(web.match('/', 'index'),
+                                      compiled=True), order)
+        self.assert_(type(app) is web.cases)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ['SlowRequestSamplerTests']
+
+import time
+import logging
+import unittest
+from webob import Request, Response
+from iktomi import web
+from iktomi.web.slow_requests import SlowRequestSampler
+from iktomi.utils.storage import VersionedStorage
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def wait_for_upstream():
+    time.sleep(0.2)
+
+
+def slow(env, data):
+    env.slow_requests.observe('db', 0.1)
+    env.slow_requests.observe('db', 0.05)
+    wait_for_upstream()
+    return Response('slow')
+
+
+def fast(env, data):
+    env.slow_requests.observe('db', 0.1)
+    return Response('fast')
+
+
+class SlowRequestSamplerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.log = ListHandler()
+        self.logger = logging.getLogger('test_slow_requests')
+        self.logger.propagate = False
+        self.logger.addHandler(self.log)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.log)
+
+    def app(self, sampler):
+        class App(web.Application):
+            slow_requests = sampler
+        return App(web.cases(
+            web.match('/slow', 'slow') | slow,
+            web.match('/fast', 'fast') | fast,
+        ))
+
+    def test_slow(self):
+        sampler = SlowRequestSampler(threshold=0.05, interval=0.01,
+                                     logger=self.logger)
+        app = self.app(sampler)
+        self.assertEqual(Request.blank('/slow').get_response(app).body,
+                         'slow')
+        self.assertEqual(len(self.log.messages), 1)
+        lines = self.log.messages[0].splitlines()
+        self.assert_(lines[0].startswith(
+                        'Slow request GET http://localhost/slow (slow)'))
+        self.assertEqual(lines[1], '  db: 0.150s in 2 calls')
+        stacks = lines[3:]
+        self.assert_(stacks)
+        self.assert_(any(':wait_for_upstream:' in x for x in stacks))
+        self.assertEqual(sampler._active, {})
+
+    def test_fast(self):
+        sampler = SlowRequestSampler(threshold=0.5, interval=0.01,
+                                     logger=self.logger)
+        app = self.app(sampler)
+        for i in range(3):
+            Request.blank('/fast').get_response(app)
+        time.sleep(0.05)
+        self.assertEqual(self.log.messages, [])
+        self.assertEqual(sampler._active, {})
+
+    def test_sample(self):
+        sampler = SlowRequestSampler(threshold=1, logger=self.logger)
+        env = VersionedStorage(web.AppEnvironment, Request.blank('/'),
+                               web.Reverse.from_handler(web.cases()))
+        request = sampler.start(env)
+        sampler.sample(now=request.started + 0.5)
+        self.assertEqual(request.samples, 0)
+        sampler.sample(now=request.started + 1)
+        self.assertEqual(request.samples, 1)
+        stack, = request.stacks
+        # sampled by current thread, so the innermost frame is `sample`
+        self.assert_(stack.split(';')[-2].startswith(
+                        __name__ + ':test_sample:'))
+        sampler.finish(request)
+        self.assertEqual(len(self.log.messages), 1)
+
+    def test_sampling_errors(self):
+        sampler = SlowRequestSampler(logger=self.logger)
+        errors = [ValueError(), KeyboardInterrupt()]
+        def sample():
+            raise errors.pop(0)
+        sampler.sample = sample
+        # errors are logged, but interrupt stops the thread
+        self.assertRaises(KeyboardInterrupt, sampler._run,
+                          sleep=lambda seconds: None)
+        self.assertEqual(self.log.messages,
+                         ['Failed to sample slow requests'])
@@ -3,6 +3,7 @@
 import unittest
 from urllib import quote
 from iktomi.web.reverse import URL
+from iktomi.web.url import LazyURL, SharedQuery
 from iktomi.web.url_templates import UrlTemplate
 from iktomi.web.url_converters import Converter, ConvertError
 
@@ -52,6 +53,39 @@ class URLTests(unittest.TestCase):
         url = URL('/')
         self.assertEqual(url.qs_add([('a', 1), ('c', 3)], a=2, b=2), '/?a=1&c=3&a=2&b=2')
 
+    def test_lazy(self):
+        'Lazy URL builder'
+        url = URL('/path', query=[('a', 1)]).lazy()
+        self.assert_(isinstance(url, LazyURL))
+        url = url.qs_set(b=2).qs_add(a=3).qs_set([('c', u'ы')]).qs_delete('b')
+        self.assertEqual(url, '/path?a=1&a=3&c=%D1%8B')
+        self.assertEqual(str(url), '/path?a=1&a=3&c=%D1%8B')
+        self.assertEqual(unicode(url), u'/path?a=1&a=3&c=%D1%8B')
+        self.assertEqual(url.qs_get('c'), u'ы')
+        self.assert_(url.as_url is url.as_url)
+        self.assertRaises(TypeError, url.qs_set, [('a', 1)], z=0)
+        url = URL('/path', host='example.com', show_host=False).lazy()
+        self.assertEqual(url, '/path')
+        self.assertEqual(url.with_host(), 'http://example.com/path')
+
+    def test_shared_query(self):
+        'Encoded pairs of shared query are reused'
+        filters = SharedQuery([('q', u'ы'), ('tags', 1), ('tags', 2)])
+        self.assertEqual(filters.encoded_pairs[(u'q', unicode, u'ы')],
+                         'q=%D1%8B')
+        filters.encoded_pairs[('tags', int, 1)] = 'tags=cached'
+        url = URL('/items').lazy().qs_set(filters).qs_add(page=1)
+        self.assertEqual(url, '/items?q=%D1%8B&tags=cached&tags=2&page=1')
+        self.assertEqual(URL('/items').qs_set(filters),
+                         '/items?q=%D1%8B&tags=1&tags=2')
+
+    def test_shared_query_equal_values(self):
+        'Equal values of different types are not confused'
+        shared = SharedQuery([('flag', 1)])
+        url = URL('/x', query=[('flag', True)])
+        self.assertEqual(url.lazy().qs_add(shared), '/x?flag=True&flag=1')
+        self.assertEqual(url.qs_add(shared), '/x?flag=True&flag=1')
+
     def test_param_get(self):
         'Get param from url'
         u = URL('/path/to/something', query=dict(id=3, page=5, title='title'))
@@ -95,3 +95,33 @@ class UrlTemplateTests(unittest.TestCase):
 
     def test_no_delimiter(self):
         self.assertRaises(ValueError, UrlTemplate, '<any(x,y)slug>')
+
+    def test_match_from_position(self):
+        'UrlTemplate match method with start position'
+        ut = UrlTemplate('/simple/<int:id>', match_whole_str=False)
+        self.assertEqual(ut.match('/prefix/simple/2/x', 7),
+                         ('/simple/2', {'id': 2}))
+        self.assertEqual(ut.match_to('/prefix/simple/2/x', 7),
+                         (16, {'id': 2}))
+        self.assertEqual(ut.match('/prefix/simple/2/x', 6), (None, {}))
+        ut = UrlTemplate('/simple')
+        self.assertEqual(ut.match('/x/simple', 2), ('/simple', {}))
+        self.assertEqual(ut.match('/x/simple/', 2), (None, {}))
+
+    def test_cache(self):
+        'Identical templates share constructed pattern and converters'
+        from iktomi.web.url_templates import template_cache_info, \
+                clear_template_cache
+        clear_template_cache()
+        ut1 = UrlTemplate('/simple/<string(max=3):name>')
+        ut2 = UrlTemplate('/simple/<string(max=3):name>')
+        ut3 = UrlTemplate('/other/<string(max=3):name>')
+        ut4 = UrlTemplate('/simple/<string(max=3):name>', match_whole_str=False)
+        self.assert_(ut1._pattern is ut2._pattern)
+        self.assert_(ut1._pattern is not ut4._pattern)
+        self.assert_(ut1._url_params['name'] is ut3._url_params['name'])
+        info = template_cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['size']),
+                         (1, 3, 3))
+        self.assertEqual(ut2.match('/simple/abc'), ('/simple/abc',
+                                                     {'name': 'abc'}))